@@ -0,0 +1,224 @@
+"""
+Analysis of files of positions of power four.
+
+Each line of the input is a position: the columns played from the empty
+grid, from 1 (e.g. 4453, see `records.format_moves`, an empty line being
+the empty grid), or a JSON object with a "moves" field (the same string,
+or a list of columns from 1). The lines are read lazily, in chunks
+searched by a pool of processes, and one JSON object per line is
+written, in the order of the input:
+
+    {"line": 0, "moves": "4453", "score": 12, "best_move": 3,
+     "pv": "3443", "depth": 9, "nodes": 48213}
+
+(or {"line": ..., "error": ...} for an invalid position). Only a few
+chunks per worker are in flight, so that the memory does not depend on
+the size of the input. After each chunk, the number of lines done and
+the size of the output are saved in a checkpoint: `--resume` goes on
+from there after an interruption.
+
+Usage:
+    python analyze.py positions.txt -o results.jsonl --depth 8
+        [--movetime 100] [--workers 8] [--chunk 256] [--resume]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from grid import Grid, InvalidMoveError
+from engine import Engine
+from records import format_moves, parse_moves
+
+
+CHUNK_SIZE = 256
+# chunks in flight per worker, searched or waiting to be written
+CHUNKS_PER_WORKER = 2
+
+AnalysisOptions = namedtuple("AnalysisOptions", [
+    "nb_rows", "nb_cols", "nb_in_a_row", "movetime", "max_depth",
+    "max_nodes", "tt_size_mb"])
+AnalysisOptions.__doc__ = """Grid and budget of the search of each
+position: `movetime` in seconds, `max_depth` in plies, `max_nodes`,
+each one None for no limit."""
+
+# engines of a worker process, by options
+_engines = {}
+
+
+def parse_position(line: str, nb_rows: int, nb_cols: int,
+                   nb_in_a_row: int) -> tuple:
+    """Gives the moves of a line, the grid after them and the player to
+    move."""
+    if line.startswith("{"):
+        moves = json.loads(line)["moves"]
+    else:
+        moves = line
+    if isinstance(moves, str):
+        moves = parse_moves(moves)
+    elif isinstance(moves, list) and all(type(col) is int for col in moves):
+        moves = [col - 1 for col in moves]
+    else:
+        raise ValueError("the moves are neither a string nor a list of"
+                         " columns")
+    grid = Grid(nb_rows, nb_cols)
+    id_player = 1
+    for col in moves:
+        row = grid.drop_piece(col, id_player)
+        if grid.check_win_at(row, col, id_player, nb_in_a_row):
+            raise ValueError(f"player {id_player} has already won")
+        id_player = id_player % 2 + 1
+    if grid.is_full():
+        raise ValueError("the grid is full")
+    return moves, grid, id_player
+
+
+def analyse_chunk(first: int, lines: list, options: AnalysisOptions) -> list:
+    """Searches the positions of `lines` (in a worker process), the
+    first one being the line `first` of the input, and gives the JSON
+    lines of their results."""
+    engine = _engines.get(options)
+    if engine is None:
+        engine = _engines[options] = Engine(
+            options.nb_in_a_row, movetime=options.movetime,
+            max_depth=options.max_depth, max_nodes=options.max_nodes,
+            tt_size_mb=options.tt_size_mb)
+    results = []
+    for i, line in enumerate(lines, first):
+        line = line.strip()
+        try:
+            moves, grid, id_player = parse_position(
+                line, options.nb_rows, options.nb_cols, options.nb_in_a_row)
+        except (ValueError, KeyError, InvalidMoveError) as error:
+            results.append(json.dumps({"line": i, "error": str(error)}))
+            continue
+        # an empty table for each position, so that a resumed analysis
+        # gives the same results
+        engine.tt.clear()
+        result = engine.search(grid, id_player)
+        pv = engine.principal_variation(grid, id_player, result.best_move,
+                                        max(result.depth, 1))
+        results.append(json.dumps({
+            "line": i, "moves": format_moves(moves),
+            "score": result.score, "best_move": result.best_move + 1,
+            "pv": format_moves(pv), "depth": result.depth,
+            "nodes": result.nodes}))
+    return results
+
+
+def analyse(lines, options: AnalysisOptions, nb_workers: int = None,
+            chunk_size: int = CHUNK_SIZE, start: int = 0):
+    """Yields, in the order of the input, the number of lines done and
+    the JSON results of each chunk of `lines`, the first one being the
+    line `start` of the input."""
+    nb_workers = nb_workers or os.cpu_count() or 1
+    lines = iter(lines)
+    with ProcessPoolExecutor(nb_workers) as pool:
+        # chunks in the order of the input, done or not
+        window = deque()
+        first = start
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if chunk:
+                first += len(chunk)
+                window.append((first, pool.submit(
+                    analyse_chunk, first - len(chunk), chunk, options)))
+            if window and (not chunk or len(window)
+                           >= nb_workers * CHUNKS_PER_WORKER):
+                done, future = window.popleft()
+                yield done, future.result()
+            elif not chunk:
+                return
+
+
+def read_checkpoint(path: str) -> tuple:
+    """Lines done and size of the output at the last checkpoint."""
+    try:
+        with open(path) as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return 0, 0
+    return checkpoint["lines"], checkpoint["offset"]
+
+
+def write_checkpoint(path: str, nb_lines: int, offset: int):
+    # written aside then renamed, so that a checkpoint is never partial
+    with open(path + ".tmp", "w") as file:
+        json.dump({"lines": nb_lines, "offset": offset}, file)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyses positions of"
+                                                 " power four, one per"
+                                                 " line.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file of positions (- for stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL results (- for stdout)")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="plies searched per position")
+    parser.add_argument("--movetime", type=float, default=None,
+                        help="ms of search per position")
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE,
+                        help="positions per task of the workers")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    parser.add_argument("--tt-size-mb", type=float, default=1)
+    parser.add_argument("--checkpoint", help="checkpoint file (default:"
+                                             " the output + .ckpt)")
+    parser.add_argument("--resume", action="store_true",
+                        help="goes on from the checkpoint")
+    args = parser.parse_args()
+
+    if args.depth is None and args.movetime is None and args.nodes is None:
+        args.depth = 8
+    options = AnalysisOptions(
+        args.rows, args.cols, args.nb_in_a_row,
+        None if args.movetime is None else args.movetime / 1000,
+        args.depth, args.nodes, args.tt_size_mb)
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.output != "-":
+        checkpoint = args.output + ".ckpt"
+    if args.resume and checkpoint is None:
+        parser.error("--resume needs an output file or a checkpoint")
+
+    start, offset = read_checkpoint(checkpoint) if args.resume else (0, 0)
+    source = sys.stdin if args.input == "-" else open(args.input)
+    if args.output == "-":
+        output = sys.stdout
+    elif args.resume and os.path.exists(args.output):
+        # the results written after the checkpoint are written again
+        output = open(args.output, "r+")
+        output.truncate(offset)
+        output.seek(offset)
+    else:
+        output = open(args.output, "w")
+    try:
+        lines = itertools.islice(source, start, None)
+        for done, results in analyse(lines, options, args.workers,
+                                     args.chunk, start):
+            for result in results:
+                output.write(result + "\n")
+            output.flush()
+            if checkpoint is not None:
+                write_checkpoint(checkpoint, done, output.tell()
+                                 if output is not sys.stdout else 0)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Batch of grids of power four, played all at once with NumPy.
+
+Used to generate self-play data and random playouts: every call applies
+one move to each game of the batch, and checks the wins of all of them
+with sliding windows of `nb_in_a_row` cells, along the lines through
+the last pieces only.
+"""
+
+import numpy as np
+
+from grid import InvalidMoveError, NB_PLAYERS
+
+
+DRAW = -1
+
+
+class BatchGrid:
+    """Stores N grids of power four"""
+
+    def __init__(self, nb_games: int, nb_rows: int = 6, nb_cols: int = 7,
+                 nb_in_a_row: int = 4, nb_players: int = NB_PLAYERS):
+        self.nb_games = nb_games
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.nb_in_a_row = nb_in_a_row
+        self.nb_players = nb_players
+        # boards[n, row, col], row 0 being the bottom row, is a view of
+        # boards padded with empty cells, so that lines never get out
+        pad = nb_in_a_row - 1
+        self._padded = np.zeros((nb_games, nb_rows + 2 * pad,
+                                 nb_cols + 2 * pad), dtype=np.int8)
+        self.boards = self._padded[:, pad:pad + nb_rows, pad:pad + nb_cols]
+        # offsets, in the flat padded boards, of the cells of the lines
+        # through a piece in the four orientations
+        width = nb_cols + 2 * pad
+        steps = np.arange(-pad, pad + 1)
+        self._line_offsets = [steps * (d_row * width + d_col)
+                              for d_row, d_col
+                              in ((1, 0), (0, 1), (1, 1), (-1, 1))]
+        self.heights = np.zeros((nb_games, nb_cols), dtype=np.int8)
+        self.nb_moves = np.zeros(nb_games, dtype=np.int16)
+        # 0 while a game goes on, then the id of the winner, or DRAW
+        self.winners = np.zeros(nb_games, dtype=np.int8)
+
+    def reset_board(self, games=None):
+        """Resets all the games, or the ones selected by `games`."""
+        if games is None:
+            games = slice(None)
+        self.boards[games] = 0
+        self.heights[games] = 0
+        self.nb_moves[games] = 0
+        self.winners[games] = 0
+
+    @property
+    def finished(self) -> np.ndarray:
+        return self.winners != 0
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.winners == 0
+
+    def valid_locations(self) -> np.ndarray:
+        """Gives a (N, nb_cols) mask of the playable columns, all false for
+        finished games."""
+        return (self.heights < self.nb_rows) & self.active[:, None]
+
+    def drop_pieces(self, cols, id_players) -> np.ndarray:
+        """Drops one piece in each active game.
+
+        `cols` holds a column per game, `id_players` a player per game or
+        one for all. Finished games are left untouched. Returns the rows
+        of the pieces, -1 for the finished games."""
+        cols = np.asarray(cols, dtype=np.intp)
+        id_players = np.broadcast_to(
+            np.asarray(id_players, dtype=np.int8), (self.nb_games,))
+        games = np.flatnonzero(self.active)
+        cols_played = cols[games]
+        rows = self.heights[games, cols_played].astype(np.intp)
+        if (rows >= self.nb_rows).any() or (cols_played < 0).any():
+            raise InvalidMoveError("A column is filled."
+                                   " Please try another.")
+        self.boards[games, rows, cols_played] = id_players[games]
+        self.heights[games, cols_played] += 1
+        self.nb_moves[games] += 1
+
+        won = self.wins_at(games, rows, cols_played, id_players[games])
+        self.winners[games[won]] = id_players[games[won]]
+        full = self.active & (self.nb_moves == self.nb_rows * self.nb_cols)
+        self.winners[full] = DRAW
+
+        all_rows = np.full(self.nb_games, -1, dtype=np.intp)
+        all_rows[games] = rows
+        return all_rows
+
+    def alignments(self, mask: np.ndarray) -> np.ndarray:
+        """Gives, per game, if `mask` (N, rows, cols) holds `nb_in_a_row`
+        cells aligned in any orientation."""
+        k = self.nb_in_a_row
+        n_rows, n_cols = self.nb_rows, self.nb_cols
+        found = np.zeros(self.nb_games, dtype=bool)
+        if k <= n_cols:
+            # horizontal windows
+            run = mask[:, :, :n_cols - k + 1].copy()
+            for i in range(1, k):
+                run &= mask[:, :, i:n_cols - k + 1 + i]
+            found |= run.any(axis=(1, 2))
+        if k <= n_rows:
+            # vertical windows
+            run = mask[:, :n_rows - k + 1, :].copy()
+            for i in range(1, k):
+                run &= mask[:, i:n_rows - k + 1 + i, :]
+            found |= run.any(axis=(1, 2))
+        if k <= n_rows and k <= n_cols:
+            # diagonal windows, positively then negatively sloped
+            up = mask[:, :n_rows - k + 1, :n_cols - k + 1].copy()
+            down = mask[:, k - 1:, :n_cols - k + 1].copy()
+            for i in range(1, k):
+                up &= mask[:, i:n_rows - k + 1 + i, i:n_cols - k + 1 + i]
+                down &= mask[:, k - 1 - i:n_rows - i, i:n_cols - k + 1 + i]
+            found |= up.any(axis=(1, 2)) | down.any(axis=(1, 2))
+        return found
+
+    def wins_at(self, games, rows, cols, id_players) -> np.ndarray:
+        """Checks, for each game of `games`, if the piece of its player in
+        (row, col) ends an alignment, looking only at the four lines
+        through that cell."""
+        k = self.nb_in_a_row
+        pad = k - 1
+        _, height, width = self._padded.shape
+        flat = self._padded.reshape(-1)
+        centres = games * (height * width) + (rows + pad) * width + cols + pad
+        won = np.zeros(len(games), dtype=bool)
+        for offsets in self._line_offsets:
+            line = flat[centres[:, None] + offsets] == id_players[:, None]
+            # sliding windows of k cells along the line
+            windows = line[:, :k].copy()
+            for i in range(1, k):
+                windows &= line[:, i:i + k]
+            won |= windows.any(axis=1)
+        return won
+
+    def winning_games(self, id_players) -> np.ndarray:
+        """Checks, per game, if its player of `id_players` is winning."""
+        id_players = np.broadcast_to(
+            np.asarray(id_players, dtype=np.int8), (self.nb_games,))
+        return self.alignments(self.boards == id_players[:, None, None])
+
+
+def random_moves(batch: BatchGrid, rng: np.random.Generator) -> np.ndarray:
+    """Draws a random valid column for each active game, 0 for the
+    others."""
+    noise = rng.random((batch.nb_games, batch.nb_cols))
+    noise[~batch.valid_locations()] = -1.
+    return noise.argmax(axis=1)
+
+
+def random_playouts(nb_games: int, nb_rows: int = 6, nb_cols: int = 7,
+                    nb_in_a_row: int = 4, seed=None) -> np.ndarray:
+    """Plays `nb_games` random games to their end.
+
+    Returns the winner of each game, DRAW for the draws."""
+    rng = np.random.default_rng(seed)
+    batch = BatchGrid(nb_games, nb_rows, nb_cols, nb_in_a_row)
+    id_player = 1
+    while batch.active.any():
+        batch.drop_pieces(random_moves(batch, rng), id_player)
+        id_player = id_player % batch.nb_players + 1
+    return batch.winners
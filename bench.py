@@ -0,0 +1,343 @@
+"""
+Benchmarks of the hot paths of power four.
+
+Every benchmark runs on fixed random games (seeded), for each size of
+grid and number in a row asked, and reports the time per operation.
+Results are appended to a JSON history file, keyed by commit, and can
+be compared with a previous run to spot regressions.
+
+Usage:
+    python bench.py                       all the benchmarks, 6x7 k=4
+    python bench.py --sizes 6x7,12x12 --k 4,5 -b grid
+    python bench.py --compare             compare with the last run
+    python bench.py --compare <commit>    compare with a given commit
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from grid import Grid
+from engine import Engine
+from threats import ThreatMap
+
+
+HISTORY = "bench_history.json"
+REPEAT = 5
+THRESHOLD = 0.10  # relative slow-down reported as a regression
+
+# positions of the search benchmark, as 1-based columns on a 6x7 grid
+SEARCH_POSITIONS = ["", "4", "44", "4453", "443322", "3344556677",
+                    "4444332255"]
+SEARCH_DEPTH = 6
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    """Custom error raised when a benchmark cannot run here."""
+
+
+def benchmark(name: str):
+    """Registers a benchmark.
+
+    The decorated function gets (nb_rows, nb_cols, nb_in_a_row) and
+    returns the function to time and the number of operations it does.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def random_games(nb_games: int, nb_rows: int, nb_cols: int,
+                 nb_in_a_row: int, seed: int = 0) -> list:
+    """Plays random games to their end, and gives their columns."""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(nb_games):
+        grid = Grid(nb_rows, nb_cols)
+        moves, id_player = [], 1
+        while not grid.is_full():
+            col = rng.choice([c for c in range(nb_cols)
+                              if grid.is_valid_location(c)])
+            row = grid.drop_piece(col, id_player)
+            moves.append(col)
+            if grid.check_win_at(row, col, id_player, nb_in_a_row):
+                break
+            id_player = id_player % 2 + 1
+        games.append(moves)
+    return games
+
+
+def play(moves: list, nb_rows: int, nb_cols: int) -> Grid:
+    grid = Grid(nb_rows, nb_cols)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+    return grid
+
+
+@benchmark("grid.drop_piece+check_win_at")
+def bench_drop_win(nb_rows, nb_cols, nb_in_a_row):
+    games = random_games(50, nb_rows, nb_cols, nb_in_a_row)
+
+    def run():
+        for moves in games:
+            grid = Grid(nb_rows, nb_cols)
+            for i, col in enumerate(moves):
+                id_player = i % 2 + 1
+                row = grid.drop_piece(col, id_player)
+                grid.check_win_at(row, col, id_player, nb_in_a_row)
+    return run, sum(map(len, games))
+
+
+@benchmark("grid.winning_move")
+def bench_winning_move(nb_rows, nb_cols, nb_in_a_row):
+    grids = [play(moves[:-1], nb_rows, nb_cols)
+             for moves in random_games(50, nb_rows, nb_cols, nb_in_a_row)]
+
+    def run():
+        for grid in grids:
+            grid.winning_move(1, nb_in_a_row)
+            grid.winning_move(2, nb_in_a_row)
+    return run, 2 * len(grids)
+
+
+@benchmark("threats.play+evaluate")
+def bench_threats(nb_rows, nb_cols, nb_in_a_row):
+    games = random_games(50, nb_rows, nb_cols, nb_in_a_row)
+
+    def run():
+        for moves in games:
+            grid = Grid(nb_rows, nb_cols)
+            threats = ThreatMap(nb_rows, nb_cols, nb_in_a_row)
+            for i, col in enumerate(moves):
+                id_player = i % 2 + 1
+                threats.play(col, grid.drop_piece(col, id_player), id_player)
+                threats.evaluate(id_player)
+    return run, sum(map(len, games))
+
+
+@benchmark("grid.winning_alignments+threats.cells")
+def bench_alignments_threats(nb_rows, nb_cols, nb_in_a_row):
+    # what the tk panel computes in `victory_threaten` (main.py imports
+    # modules which are not always installed)
+    positions = []
+    for moves in random_games(50, nb_rows, nb_cols, nb_in_a_row):
+        grid = play(moves, nb_rows, nb_cols)
+        positions.append((grid, ThreatMap.from_grid(grid, nb_in_a_row)))
+
+    def run():
+        for grid, threats in positions:
+            grid.winning_alignments(1, nb_in_a_row)
+            threats.cells(1)
+    return run, len(positions)
+
+
+@benchmark("playouts.grid")
+def bench_playouts_grid(nb_rows, nb_cols, nb_in_a_row):
+    nb_games = 20
+
+    def run():
+        random_games(nb_games, nb_rows, nb_cols, nb_in_a_row)
+    return run, nb_games
+
+
+@benchmark("playouts.batch")
+def bench_playouts_batch(nb_rows, nb_cols, nb_in_a_row):
+    try:
+        from batch import random_playouts
+    except ImportError as error:
+        raise SkipBenchmark(str(error))
+    nb_games = 5000
+
+    def run():
+        random_playouts(nb_games, nb_rows, nb_cols, nb_in_a_row, seed=0)
+    return run, nb_games
+
+
+@benchmark("engine.search(node)")
+def bench_search(nb_rows, nb_cols, nb_in_a_row):
+    if (nb_rows, nb_cols) != (6, 7):
+        raise SkipBenchmark("the positions are for a 6x7 grid")
+    grids = []
+    for position in SEARCH_POSITIONS:
+        grid = play([int(c) - 1 for c in position], nb_rows, nb_cols)
+        grids.append((grid, grid.nb_moves % 2 + 1))
+    # the number of nodes is fixed by the depth, so it is counted once
+    nb_nodes = 0
+    for grid, id_player in grids:
+        nb_nodes += Engine(nb_in_a_row, tt_size_mb=4).search(
+            grid, id_player, movetime=None, max_depth=SEARCH_DEPTH).nodes
+
+    def run():
+        for grid, id_player in grids:
+            Engine(nb_in_a_row, tt_size_mb=4).search(
+                grid, id_player, movetime=None, max_depth=SEARCH_DEPTH)
+    return run, nb_nodes
+
+
+def display_manager(nb_rows, nb_cols):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame
+        from draft import DisplayManager, COLOR_SETTINGS
+    except ImportError as error:
+        raise SkipBenchmark(str(error))
+    pygame.display.init()
+    return DisplayManager(nb_rows, nb_cols, 40, COLOR_SETTINGS)
+
+
+@benchmark("display.draw_grid(move)")
+def bench_draw_grid_move(nb_rows, nb_cols, nb_in_a_row):
+    manager = display_manager(nb_rows, nb_cols)
+    moves = random_games(1, nb_rows, nb_cols, nb_in_a_row)[0]
+    boards = []
+    grid = Grid(nb_rows, nb_cols)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+        boards.append(grid.board)
+    empty = Grid(nb_rows, nb_cols).board
+
+    def run():
+        manager.draw_grid(empty)
+        for board in boards:
+            manager.draw_grid(board)
+    return run, len(boards) + 1
+
+
+@benchmark("display.draw_grid(full)")
+def bench_draw_grid_full(nb_rows, nb_cols, nb_in_a_row):
+    manager = display_manager(nb_rows, nb_cols)
+    board = play(random_games(1, nb_rows, nb_cols, nb_in_a_row)[0],
+                 nb_rows, nb_cols).board
+    nb_frames = 20
+
+    def run():
+        for _ in range(nb_frames):
+            # forgets what was drawn, so that every cell is drawn again
+            manager._drawn = [[None] * nb_cols for _ in range(nb_rows)]
+            manager.draw_grid(board)
+    return run, nb_frames
+
+
+def time_benchmark(func, nb_ops: int, repeat: int = REPEAT) -> dict:
+    func()  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"us_per_op": best / nb_ops * 1e6,
+            "median_us_per_op": statistics.median(times) / nb_ops * 1e6,
+            "ops_per_s": nb_ops / best if best else 0.,
+            "nb_ops": nb_ops}
+
+
+def run_benchmarks(names, sizes, ks, repeat: int = REPEAT) -> dict:
+    results = {}
+    for name in names:
+        for nb_rows, nb_cols in sizes:
+            for nb_in_a_row in ks:
+                key = f"{name}[{nb_rows}x{nb_cols},k={nb_in_a_row}]"
+                try:
+                    func, nb_ops = BENCHMARKS[name](nb_rows, nb_cols,
+                                                    nb_in_a_row)
+                except SkipBenchmark as error:
+                    print(f"{key:<50} skipped: {error}")
+                    continue
+                results[key] = time_benchmark(func, nb_ops, repeat)
+                print(f"{key:<50} {results[key]['us_per_op']:>12.2f} us/op")
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD):
+    """Prints the ratio of each time to the baseline, and returns the
+    names of the regressions."""
+    regressions = []
+    print(f"\ncompared with {baseline['commit']} ({baseline['date']}):")
+    for key, result in results.items():
+        if key not in baseline["results"]:
+            continue
+        ratio = result["us_per_op"] / baseline["results"][key]["us_per_op"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{key:<50} x{ratio:>6.2f}{flag}")
+    return regressions
+
+
+def parse_sizes(text: str) -> list:
+    return [tuple(int(n) for n in size.split("x"))
+            for size in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of power four.")
+    parser.add_argument("-b", "--bench", default="",
+                        help="only the benchmarks whose name contains it")
+    parser.add_argument("--sizes", default="6x7", type=parse_sizes,
+                        help="sizes of grid, e.g. 6x7,12x12")
+    parser.add_argument("--k", default="4",
+                        type=lambda t: [int(k) for k in t.split(",")],
+                        help="numbers in a row, e.g. 4,5")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--history", default=HISTORY)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", nargs="?", const="last",
+                        help="commit to compare with (the last run if"
+                             " not given)")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.bench in name]
+    results = run_benchmarks(names, args.sizes, args.k, args.repeat)
+    history = load_history(args.history)
+
+    regressions = []
+    if args.compare:
+        baselines = history if args.compare == "last" \
+            else [run for run in history if run["commit"] == args.compare]
+        if baselines:
+            regressions = compare(results, baselines[-1])
+        else:
+            print(f"\nno run of {args.compare} in {args.history}")
+
+    if not args.no_save:
+        history.append({"commit": current_commit(),
+                        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                        "results": results})
+        with open(args.history, "w") as file:
+            json.dump(history, file, indent=1)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
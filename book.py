@@ -0,0 +1,171 @@
+"""
+Opening book of power four.
+
+The book is generated offline by searching every position of the first
+plies, and written as a sorted array of fixed size records
+(key, best move, score) after a small header. A position and its mirror
+share one record, under their canonical key (see
+`grid.Grid.canonical_key`). At runtime, the file is
+memory-mapped and looked up by binary search, so that only the pages
+touched by the search are read.
+
+Usage: python book.py book.bin --plies 8 --movetime 0.05
+"""
+
+import argparse
+import mmap
+import struct
+import time
+
+from grid import Grid
+from engine import Engine
+
+
+MAGIC = b"P4OB"
+VERSION = 2
+HEADER = struct.Struct("<4sBBBBQ")
+RECORD = struct.Struct("<QBi")
+KEY = struct.Struct("<Q")
+
+
+class BookFormatError(Exception):
+    """Custom error raised when a file is not an opening book."""
+
+
+def book_positions(nb_plies: int, nb_rows: int = 6, nb_cols: int = 7,
+                   nb_in_a_row: int = 4):
+    """Yields (grid, id_player) for every position of at most `nb_plies`
+    pieces where nobody has won yet, each position once, and only one of
+    a position and its mirror."""
+    seen = set()
+    grid = Grid(nb_rows, nb_cols)
+
+    def explore(id_player):
+        key = grid.canonical_key(id_player)[0]
+        if key in seen:
+            return
+        seen.add(key)
+        yield grid, id_player
+        if grid.nb_moves == nb_plies:
+            return
+        for col in range(nb_cols):
+            if not grid.is_valid_location(col):
+                continue
+            grid.drop_piece(col, id_player)
+            if not grid.winning_move(id_player, nb_in_a_row) \
+                    and not grid.is_full():
+                yield from explore(id_player % 2 + 1)
+            grid.undo_piece(col)
+
+    yield from explore(1)
+
+
+def generate_book(path: str, nb_plies: int, engine: Engine,
+                  nb_rows: int = 6, nb_cols: int = 7, verbose=False):
+    """Searches the positions of the first `nb_plies` plies with
+    `engine`, and writes the book to `path`."""
+    records = []
+    start = time.perf_counter()
+    for grid, id_player in book_positions(nb_plies, nb_rows, nb_cols,
+                                          engine.nb_in_a_row):
+        result = engine.search(grid, id_player)
+        key, mirrored = grid.canonical_key(id_player)
+        records.append((key, grid.mirror_col(result.best_move) if mirrored
+                        else result.best_move, result.score))
+        if verbose and not len(records) % 1000:
+            print(f"{len(records)} positions,"
+                  f" {time.perf_counter() - start:.0f}s")
+    write_book(path, records, nb_rows, nb_cols, engine.nb_in_a_row)
+    return len(records)
+
+
+def write_book(path: str, records, nb_rows: int, nb_cols: int,
+               nb_in_a_row: int):
+    """Writes the records (key, move, score), sorted by key."""
+    records = sorted(records)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, nb_rows, nb_cols,
+                               nb_in_a_row, len(records)))
+        for record in records:
+            file.write(RECORD.pack(*record))
+
+
+class OpeningBook:
+    """Read-only memory-mapped opening book"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise BookFormatError(f"{path} is empty.")
+        magic, version, self.nb_rows, self.nb_cols, self.nb_in_a_row, \
+            self.nb_records = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise BookFormatError(f"{path} is not an opening book.")
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.nb_records
+
+    def find(self, key: int):
+        """Gives (move, score) stored for `key`, or None."""
+        data = self._map
+        lo, hi = 0, self.nb_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, = KEY.unpack_from(data, HEADER.size + mid * RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.nb_records:
+            found, move, score = RECORD.unpack_from(
+                data, HEADER.size + lo * RECORD.size)
+            if found == key:
+                return move, score
+        return None
+
+    def lookup(self, grid: Grid, id_player: int, nb_in_a_row: int = 4):
+        """Gives (move, score) of the book for `id_player`, or None."""
+        if (grid.nb_rows, grid.nb_cols, nb_in_a_row) \
+                != (self.nb_rows, self.nb_cols, self.nb_in_a_row):
+            return None
+        key, mirrored = grid.canonical_key(id_player)
+        entry = self.find(key)
+        if entry is not None and mirrored:
+            return grid.mirror_col(entry[0]), entry[1]
+        return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates an opening"
+                                                 " book of power four.")
+    parser.add_argument("path")
+    parser.add_argument("--plies", type=int, default=8)
+    parser.add_argument("--movetime", type=float, default=0.05,
+                        help="seconds of search per position")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    args = parser.parse_args()
+    engine = Engine(args.nb_in_a_row, movetime=args.movetime)
+    nb_records = generate_book(args.path, args.plies, engine,
+                               args.rows, args.cols, verbose=True)
+    print(f"{nb_records} positions written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
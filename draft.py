@@ -10,6 +10,11 @@ import math
 from typing import Tuple
 from collections import namedtuple
 
+from grid import Grid, InvalidMoveError  # noqa: F401
+from engine import Engine
+from instrument import INSTRUMENT, timed
+from worker import EngineWorker
+
 
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
@@ -38,88 +43,19 @@ SIZE_FONT = 75
 NAME_FONT = "monospace"
 
 NB_PLAYERS = 2
+AI_PLAYERS = ()  # e.g. (2,) to play against the computer
 
-
-class InvalidMoveError(Exception):
-    """Custom error for invalid moves."""
+FPS = 60  # maximal number of frames per second
+WIN_DELAY = 3000  # ms the winner is shown before the end of the game
+OVERLAY_DELAY = 1000  # ms between two refreshes of the measures shown
+# event posted by the thread of the engine, with its `message`
+ENGINE_EVENT = pygame.USEREVENT + 1
 
 
 class NotSetUpError(Exception):
     """Custom error raised when accessing something that is not set up."""
 
 
-class Grid:
-    """Stores the grid of power four"""
-
-    def __init__(self, nb_rows: int = 6,
-                 nb_cols: int = 7):
-        self.board = np.zeros((nb_rows, nb_cols), dtype=int)
-        self.nb_rows = nb_rows
-        self.nb_cols = nb_cols
-
-    def reset_board(self):
-        self.board[:, :] = 0
-
-    def is_valid_location(self, col: int) -> bool:
-        """Checks if a column is a valid location for a piece."""
-        return self.board[self.nb_rows - 1, col] == 0
-
-    def get_next_open_row(self, col: int) -> int:
-        """Finds the first row where a new piece can go.
-
-        This row must be a valid location"""
-        for r in range(self.nb_rows):
-            if self.board[r, col] == 0:
-                return r
-        raise InvalidMoveError("This column is filled. Please try another.")
-
-    def drop_piece(self, col: int, id_player: int):
-        """Drop the piece in the column."""
-        row = self.get_next_open_row(col)
-        self.board[row, col] = id_player
-
-    def print_board(self):
-        print(np.flip(self.board, 0))
-
-    @staticmethod
-    def index_diag_slope(length):
-        """Gives the index used to extract a diagonal from the board"""
-        r1_diag_slope = np.arange(length)
-        r2_diag_slope = length - 1 - r1_diag_slope
-        c_diag_slope = np.arange(length)
-        return r1_diag_slope, r2_diag_slope, c_diag_slope
-
-    def winning_move(self, player_id: int, nb_in_a_row: int = 4):
-        """Check if `player` is winning."""
-        r1_diag, r2_diag, c_diag = self.index_diag_slope(nb_in_a_row)
-        for c in range(self.nb_cols):
-            for r in range(self.nb_rows):
-                # Check horizontal locations for win
-                if c <= self.nb_cols - nb_in_a_row \
-                        and (self.board[r, c: c + nb_in_a_row]
-                             == player_id).all():
-                    return True
-
-                # Check vertical locations for win
-                if r <= self.nb_rows - nb_in_a_row \
-                        and (self.board[r: r + nb_in_a_row, c]
-                             == player_id).all():
-                    return True
-
-                # check diagonals :
-                if c <= self.nb_cols - nb_in_a_row \
-                        and r <= self.nb_rows - nb_in_a_row:
-                    # Check positively sloped diagonals
-                    if (self.board[
-                            r + r1_diag, c + c_diag] == player_id).all():
-                        return True
-
-                    # Check negatively sloped diagonals
-                    if (self.board[
-                            r + r2_diag, c + c_diag] == player_id).all():
-                        return True
-
-
 class PygameScreen:
     """Manages the pygame display"""
 
@@ -145,12 +81,73 @@ class PygameScreen:
                    color, antialias=True, dest=(40, 10)) -> None:
         """Prompts message in color to the screen"""
         label = self.font.render(msg, antialias, color)
-        self.screen.blit(label, dest)
-        pygame.display.update()
+        pygame.display.update(self.screen.blit(label, dest))
+
+
+class Sprites:
+    """Cells of the grid holding a disc, and discs on the background,
+    rendered once per color id and shared by the displays of the same
+    colors and square size (see `get`)"""
+
+    # sprites by square size and colors
+    _shared = {}
+
+    def __init__(self, square_size: int, color_settings: ColorSettings):
+        self.square_size = square_size
+        self.radius = square_size // 2 - square_size // 20
+        self.colors = color_settings
+        self._cells = {}
+        self._discs = {}
+
+    @classmethod
+    def get(cls, square_size: int,
+            color_settings: ColorSettings) -> "Sprites":
+        key = (square_size, tuple(color_settings.players_colors),
+               color_settings.grid_color, color_settings.background_color)
+        sprites = cls._shared.get(key)
+        if sprites is None:
+            sprites = cls._shared[key] = cls(square_size, color_settings)
+        return sprites
+
+    def _disc(self, background, color_id: int, ring=None) -> pygame.Surface:
+        surface = pygame.Surface((self.square_size, self.square_size))
+        surface.fill(background)
+        centre = (self.square_size // 2, self.square_size // 2)
+        if ring is not None:
+            pygame.draw.circle(surface, ring, centre, self.radius)
+            pygame.draw.circle(surface,
+                               self.colors.players_colors[color_id], centre,
+                               self.radius - max(2, self.square_size // 15))
+        else:
+            pygame.draw.circle(surface,
+                               self.colors.players_colors[color_id], centre,
+                               self.radius)
+        return surface
+
+    def cell(self, color_id: int, ring=None) -> pygame.Surface:
+        """Square of the grid holding a disc of the color, ringed with
+        the color `ring` if any."""
+        surface = self._cells.get((color_id, ring))
+        if surface is None:
+            surface = self._cells[color_id, ring] = self._disc(
+                self.colors.grid_color, color_id, ring)
+        return surface
+
+    def disc(self, color_id: int) -> pygame.Surface:
+        """Waiting disc of the color, on the background."""
+        surface = self._discs.get(color_id)
+        if surface is None:
+            surface = self._discs[color_id] = self._disc(
+                self.colors.background_color, color_id)
+        return surface
 
 
 class DisplayManager:
-    """Manager of the pygame display"""
+    """Manager of the pygame display
+
+    Only the cells which changed and the strip of the waiting circle are
+    redrawn, from surfaces rendered once per color, and only their
+    rectangles are updated on the screen."""
 
     def __init__(self, nb_rows, nb_cols,
                  square_size, color_settings: ColorSettings):
@@ -163,6 +160,12 @@ class DisplayManager:
         self.radius = square_size // 2 - square_size // 20
         self.screen = PygameScreen(width, height)
         self.colors = color_settings
+        # pre-rendered cells of the grid and waiting discs
+        self.sprites = Sprites.get(square_size, color_settings)
+        # ids drawn in each cell (row 0 at the bottom), None if not drawn
+        self._drawn = [[None] * nb_cols for _ in range(nb_rows)]
+        self._waiting_rect = None
+        self._dirty_rects = []
 
     @staticmethod
     def init_pygame():
@@ -181,22 +184,51 @@ class DisplayManager:
                             row * self.square_size + self.square_size // 2),
                            self.radius)
 
-    def draw_waiting_circle(self, pos_x=None, color_id: int = None):
-        pygame.draw.rect(self.screen.screen, self.colors.background_color,
-                         (0, 0, self.size[0], self.square_size))
-        if pos_x is None or color_id is None:
-            return
-        pygame.draw.circle(self.screen.screen, self.color_from_id(color_id),
-                           (pos_x, self.square_size // 2), RADIUS)
-        pygame.display.update()
+    def cell_surface(self, color_id: int) -> pygame.Surface:
+        """Square of the grid holding a disc of the color."""
+        return self.sprites.cell(color_id)
+
+    def disc_surface(self, color_id: int) -> pygame.Surface:
+        """Waiting disc of the color, on the background."""
+        return self.sprites.disc(color_id)
+
+    def update(self):
+        """Updates the rectangles of the screen drawn since last time."""
+        if self._dirty_rects:
+            pygame.display.update(self._dirty_rects)
+            self._dirty_rects = []
+            if INSTRUMENT.enabled:
+                INSTRUMENT.frame()
 
+    def draw_waiting_circle(self, pos_x=None, color_id: int = None):
+        if self._waiting_rect is not None:
+            self._dirty_rects.append(self.screen.screen.fill(
+                self.colors.background_color, self._waiting_rect))
+            self._waiting_rect = None
+        if pos_x is not None and color_id is not None:
+            self._waiting_rect = self.screen.screen.blit(
+                self.disc_surface(color_id),
+                (pos_x - self.square_size // 2, 0))
+            self._dirty_rects.append(self._waiting_rect)
+        self.update()
+
+    def draw_cell(self, row: int, col: int, id_player: int):
+        """Draws the cell (row, col) of the grid, row 0 being the bottom
+        one. The screen is updated by `update()`."""
+        self._dirty_rects.append(self.screen.screen.blit(
+            self.cell_surface(id_player),
+            (col * self.square_size, (self.nb_rows - row) * self.square_size)))
+        self._drawn[row][col] = id_player
+
+    @timed("draw_grid")
     def draw_grid(self, board: np.ndarray):
+        """Draws the cells of the board which changed since last time."""
         for r, l_row in enumerate(board):
+            drawn = self._drawn[r]
             for c, id_player in enumerate(l_row):
-                self.draw_row_col_square(self.nb_rows-r, c,
-                                         self.colors.grid_color)
-                self.draw_row_col_circle(self.nb_rows-r, c, id_player)
-        pygame.display.update()
+                if drawn[c] != id_player:
+                    self.draw_cell(r, c, id_player)
+        self.update()
 
     def prompt_msg(self, msg: str,
                    color_id, antialias=True, dest=(40, 10)) -> None:
@@ -216,11 +248,12 @@ class MainGame:
 
     def __init__(self, nb_rows, nb_cols, nb_in_a_row,
                  color_settings, square_size,
-                 name_font="monospace", size_font=30):
+                 name_font="monospace", size_font=30, ai_players=(),
+                 fps=FPS):
         # init grid
         self.nb_rows = nb_rows
         self.nb_cols = nb_cols
-        self.grid = Grid(nb_rows, nb_cols)
+        self.grid = Grid(nb_rows, nb_cols, NB_PLAYERS)
 
         # init pygame window
         DisplayManager.init_pygame()
@@ -231,10 +264,22 @@ class MainGame:
         # init game
         self.nb_in_a_row = nb_in_a_row
         self.current_player_id = 1
+        # ids of the players moved by the engine
+        self.ai_players = set(ai_players)
+        self.engine = Engine(nb_in_a_row)
+        # the engine searches in a thread, and posts ENGINE_EVENT events
+        self.worker = EngineWorker(self.engine, post=self.post_message)
+        self.ai_job = None
+        self.last_col = None
+        self.fps = fps
+        # measures of `instrument` shown in the caption (F3)
+        self.show_overlay = INSTRUMENT.enabled
+        self._overlay_time = 0
 
     def draw_grid(self):
         self.display_manager.draw_grid(self.grid.board)
 
+    @timed("mouse_motion")
     def mouse_motion(self, event: pygame.event.Event):
         pos_x = event.pos[0]
         self.display_manager.draw_waiting_circle(pos_x, self.current_player_id)
@@ -244,21 +289,79 @@ class MainGame:
         col = int(math.floor(pos_x / self.display_manager.square_size))
         return col
 
+    @timed("mouse_down")
     def mouse_down(self, event: pygame.event.Event) -> Tuple[bool, bool]:
         col = self.get_col_from_mouse(event)
+        return self.play(col)
 
+    @staticmethod
+    def post_message(message):
+        """Hands a message of the engine over to the main loop (called
+        from the thread of the engine)."""
+        pygame.event.post(pygame.event.Event(ENGINE_EVENT, message=message))
+
+    def ai_think(self):
+        """Starts the search of the move of the current player."""
+        self.ai_job = self.worker.think(self.grid, self.current_player_id)
+
+    def engine_message(self, message) -> Tuple[bool, bool]:
+        """Shows the best move found so far by the engine, and plays its
+        move at the end of the search."""
+        if message.job is not self.ai_job:
+            return False, False
+        col = message.result.best_move
+        if message.kind == "info":
+            self.display_manager.draw_waiting_circle(
+                (col * 2 + 1) * self.display_manager.square_size // 2,
+                self.current_player_id)
+            return False, False
+        self.ai_job = None
+        if INSTRUMENT.enabled:
+            INSTRUMENT.search(self.engine, message.result)
+        if col is None:
+            return False, False
+        return self.play(col)
+
+    def turn_played(self, col: int):
+        """After a move in `col`, the engine answers it, or ponders if it
+        played it."""
+        if self.current_player_id in self.ai_players:
+            # the search goes on if the engine expected this move
+            self.ai_job = self.worker.ponder_hit(col)
+            if self.ai_job is None:
+                self.ai_think()
+        elif (self.current_player_id - 2) % NB_PLAYERS + 1 \
+                in self.ai_players:
+            self.worker.ponder(self.grid, self.current_player_id)
+
+    def play(self, col: int) -> Tuple[bool, bool]:
+        """Drops a piece of the current player in the column."""
         if not self.grid.is_valid_location(col):
             return False, False
             # raise InvalidMoveError("Invalid column.")
 
         self.display_manager.draw_waiting_circle()
-        self.grid.drop_piece(col, self.current_player_id)
+        row = self.grid.drop_piece(col, self.current_player_id)
+        self.last_col = col
         # print_board(board)
-        self.draw_grid()
+        self.display_manager.draw_cell(row, col, self.current_player_id)
+        self.display_manager.update()
+
+        winning_cells = self.check_win_at(row, col)
+        return True, bool(winning_cells)
 
-        game_over = self.grid.winning_move(self.current_player_id,
-                                           self.nb_in_a_row)
-        return True, game_over
+    @timed("check_win")
+    def check_win_at(self, row: int, col: int) -> list:
+        return self.grid.check_win_at(row, col, self.current_player_id,
+                                      self.nb_in_a_row)
+
+    def update_overlay(self):
+        """Shows the measures of `instrument` in the caption, once a
+        second."""
+        now = pygame.time.get_ticks()
+        if now - self._overlay_time >= OVERLAY_DELAY:
+            self._overlay_time = now
+            pygame.display.set_caption(INSTRUMENT.overlay())
 
     def next_player(self):
         self.current_player_id %= NB_PLAYERS
@@ -268,29 +371,89 @@ class MainGame:
         self.display_manager.prompt_msg(
             f"Player {self.current_player_id} wins!!", self.current_player_id)
 
+    def draw(self):
+        self.display_manager.screen.prompt_msg(
+            "Draw!", self.display_manager.colors.grid_color)
+
+    def next_events(self, timeout: int = None) -> list:
+        """Waits for the next events, at most `timeout` ms (forever if
+        None), and gives all the events queued."""
+        if self.show_overlay:
+            timeout = OVERLAY_DELAY if timeout is None \
+                else min(timeout, OVERLAY_DELAY)
+        event = pygame.event.wait() if timeout is None \
+            else pygame.event.wait(timeout)
+        if event.type == pygame.NOEVENT:
+            return pygame.event.get()
+        return [event] + pygame.event.get()
+
     def main_loop(self):
-        """Main loop of the game"""
-        game_over = False
-        while not game_over:
-            for event in pygame.event.get():
+        """Main loop of the game
+
+        The loop sleeps until an event comes, and handles the events at
+        most `fps` times a second: the moves of the mouse are collapsed
+        to the last one, drawn once per frame. The winner (or the draw,
+        once the grid is full) is shown for WIN_DELAY ms while the events
+        are still handled."""
+        clock = pygame.time.Clock()
+        won_at = None  # ticks of the end of the game
+        if self.current_player_id in self.ai_players:
+            self.ai_think()
+        while True:
+            if won_at is not None:
+                remaining = won_at + WIN_DELAY - pygame.time.get_ticks()
+                if remaining <= 0:
+                    self.worker.cancel()
+                    return
+                events = self.next_events(remaining)
+            else:
+                events = self.next_events()
+            if INSTRUMENT.enabled:
+                INSTRUMENT.gauge("event_queue", len(events))
+                if self.show_overlay:
+                    self.update_overlay()
+
+            motion = None
+            for event in events:
                 if event.type == pygame.QUIT:
                     sys.exit()
-                if event.type == pygame.MOUSEMOTION:
-                    self.mouse_motion(event)
-                if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 \
+                        and INSTRUMENT.enabled:
+                    self.show_overlay = not self.show_overlay
+                    if not self.show_overlay:
+                        pygame.display.set_caption("")
+                if won_at is not None:
+                    continue
+                valid = game_over = False
+                if event.type == ENGINE_EVENT:
+                    valid, game_over = self.engine_message(event.message)
+                elif self.current_player_id in self.ai_players:
+                    continue
+                elif event.type == pygame.MOUSEMOTION:
+                    motion = event
+                elif event.type == pygame.MOUSEBUTTONDOWN:
                     # Ask for Player $turn Input
                     valid, game_over = self.mouse_down(event)
-                    if not valid or game_over:
-                        break
+                if game_over:
+                    self.win()
+                    won_at = pygame.time.get_ticks()
+                elif valid and self.grid.is_full():
+                    # nobody can play any more
+                    self.draw()
+                    won_at = pygame.time.get_ticks()
+                elif valid:
                     self.next_player()
-            if game_over:
-                self.win()
-                pygame.time.wait(3000)
+                    self.turn_played(self.last_col)
+            if motion is not None and won_at is None \
+                    and self.current_player_id not in self.ai_players:
+                self.mouse_motion(motion)
+            clock.tick(self.fps)
 
 
 def main():
     game = MainGame(ROW_COUNT, COLUMN_COUNT, NB_IN_A_ROW,
-                    COLOR_SETTINGS, SQUARE_SIZE, NAME_FONT, SIZE_FONT)
+                    COLOR_SETTINGS, SQUARE_SIZE, NAME_FONT, SIZE_FONT,
+                    AI_PLAYERS)
     game.draw_grid()
     game.main_loop()
 
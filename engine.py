@@ -0,0 +1,473 @@
+"""
+Search engine of power four.
+
+Negamax with alpha-beta pruning on the rules of `grid.Grid`, searched by
+iterative deepening under a time and/or node budget. Moves are tried
+centre first, after the move of the transposition table and the killer
+moves of the ply.
+
+With `threats`, the leaves are evaluated by a `threats.ThreatMap`
+updated along the search (open windows, threats and their parity)
+instead of the central pieces, and the forced moves (wins, then blocks)
+are tried first.
+
+Run as a script (python -m engine), it reads commands on stdin and
+answers on stdout, without any GUI import:
+
+    position [<moves>]     columns played from the empty grid, from 1
+                           (4453, or 4 4 5 3 beyond 9 columns)
+    size <rows> <cols> [k] size of the grid and number in a row
+    go [movetime <ms>] [depth <d>] [nodes <n>]
+    eval                   static evaluation for the player to move
+    perft <depth>          number of games of `depth` moves
+    new                    clears the transposition table
+    isready
+    quit
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from grid import Grid, InvalidMoveError
+from threats import ThreatMap
+from tt import TranspositionTable, EXACT, LOWER, UPPER
+
+
+WIN_SCORE = 1_000_000
+# scores above this bound are forced wins, below its opposite forced losses
+MATE_BOUND = WIN_SCORE - 10_000
+
+MOVETIME = 0.1  # seconds
+
+SearchResult = namedtuple("SearchResult", ["best_move", "score", "depth",
+                                           "nodes", "elapsed", "nps"])
+
+
+class SearchTimeout(Exception):
+    """Custom error raised when the budget of a search is spent."""
+
+
+class Engine:
+    """Negamax engine for two players playing on a `Grid`"""
+
+    def __init__(self, nb_in_a_row: int = 4, movetime: float = MOVETIME,
+                 max_nodes: int = None, max_depth: int = None,
+                 tt: TranspositionTable = None, tt_size_mb: float = 16,
+                 book=None, threats: bool = False):
+        self.nb_in_a_row = nb_in_a_row
+        # evaluation by the threats instead of the central pieces
+        self.threats = threats
+        # threat map of the running search, if `threats`
+        self._threat_map = None
+        # `book.OpeningBook` looked up before any search
+        self.book = book
+        self.tt_size_mb = tt_size_mb
+        self._tt = tt
+        self.movetime = movetime
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.nodes = 0
+        # beta cutoffs of the last search
+        self.cutoffs = 0
+        self.killers = []
+        self._deadline = None
+        # the deadline is also set from another thread, by `set_movetime`
+        self._deadline_lock = threading.Lock()
+        self._node_limit = None
+        # set from another thread to stop the running search
+        self.stopped = False
+        self._layouts = {}
+
+    @property
+    def tt(self) -> TranspositionTable:
+        """Transposition table, allocated by the first search."""
+        if self._tt is None:
+            self._tt = TranspositionTable(self.tt_size_mb)
+        return self._tt
+
+    @staticmethod
+    def other(id_player: int) -> int:
+        return id_player % 2 + 1
+
+    def layout(self, grid: Grid) -> tuple:
+        """Gives the centre-first order of the columns and the masks and
+        weights of the columns, cached per size of grid."""
+        key = (grid.nb_rows, grid.nb_cols)
+        if key not in self._layouts:
+            nb_cols = grid.nb_cols
+            order = sorted(range(nb_cols),
+                           key=lambda c: (abs(2 * c - nb_cols + 1), c))
+            column = (1 << grid.nb_rows) - 1
+            col_masks = [(column << (c * grid.col_height),
+                          min(c + 1, nb_cols - c))
+                         for c in range(nb_cols)]
+            self._layouts[key] = order, col_masks
+        return self._layouts[key]
+
+    def evaluate(self, grid: Grid, id_player: int) -> int:
+        """Heuristic score of the grid for `id_player`: pieces near the
+        centre are worth more, as they belong to more alignments (or the
+        score of `threats.ThreatMap.evaluate`, with `threats`)."""
+        if self.threats:
+            return ThreatMap.from_grid(grid, self.nb_in_a_row) \
+                .evaluate(id_player)
+        mine = grid.masks[id_player]
+        theirs = grid.masks[self.other(id_player)]
+        score = 0
+        for col_mask, weight in self.layout(grid)[1]:
+            score += weight * ((mine & col_mask).bit_count()
+                               - (theirs & col_mask).bit_count())
+        return score
+
+    def ordered_moves(self, grid: Grid, ply: int, first=None,
+                      forced=()) -> list:
+        """Gives the valid columns, the `forced` ones, `first` and the
+        killers ahead."""
+        moves = []
+        for col in (*forced, first, *self.killers[ply]):
+            if col is not None and col not in moves \
+                    and grid.is_valid_location(col):
+                moves.append(col)
+        for col in self.layout(grid)[0]:
+            if col not in moves and grid.is_valid_location(col):
+                moves.append(col)
+        return moves
+
+    def store_killer(self, ply: int, col: int):
+        killers = self.killers[ply]
+        if killers[0] != col:
+            killers[1] = killers[0]
+            killers[0] = col
+
+    @staticmethod
+    def to_tt(score: int, ply: int) -> int:
+        """Counts the forced wins from the node instead of the root."""
+        if score >= MATE_BOUND:
+            return score + ply
+        if score <= -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def from_tt(score: int, ply: int) -> int:
+        if score >= MATE_BOUND:
+            return score - ply
+        if score <= -MATE_BOUND:
+            return score + ply
+        return score
+
+    def stop(self):
+        """Stops the running search (from another thread), which gives
+        the result of its last completed iteration."""
+        self.stopped = True
+
+    def set_movetime(self, movetime: float):
+        """Gives the running search, or the next one if it has not
+        started yet, `movetime` seconds from now (from another thread),
+        e.g. when a pondered move is played. None withdraws it."""
+        with self._deadline_lock:
+            self._deadline = None if movetime is None \
+                else time.perf_counter() + movetime
+
+    def check_budget(self):
+        if self.stopped:
+            raise SearchTimeout
+        if self._node_limit is not None and self.nodes >= self._node_limit:
+            raise SearchTimeout
+        if self._deadline is not None \
+                and time.perf_counter() >= self._deadline:
+            raise SearchTimeout
+
+    def negamax(self, grid: Grid, depth: int, alpha: int, beta: int,
+                id_player: int, ply: int, first=None) -> tuple:
+        """Searches the grid with `id_player` to move.
+
+        Returns the score for `id_player` and the best move found."""
+        self.nodes += 1
+        if not self.nodes & 255:
+            self.check_budget()
+        if depth == 0:
+            if self._threat_map is not None:
+                return self._threat_map.evaluate(id_player), None
+            return self.evaluate(grid, id_player), None
+
+        # mirrored positions share their entry, with mirrored moves
+        key, mirrored = grid.canonical_key(id_player)
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, flag, tt_score, tt_move = entry
+            if mirrored:
+                tt_move = grid.mirror_col(tt_move)
+            if tt_depth >= depth:
+                tt_score = self.from_tt(tt_score, ply)
+                if flag == EXACT:
+                    return tt_score, tt_move
+                if flag == LOWER:
+                    alpha = max(alpha, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+                if alpha >= beta:
+                    return tt_score, tt_move
+            if first is None:
+                first = tt_move
+
+        alpha_orig = alpha
+        other = self.other(id_player)
+        best_score, best_move = -WIN_SCORE, None
+        threat_map = self._threat_map
+        forced = () if threat_map is None \
+            else threat_map.forced_moves(id_player) or ()
+        for col in self.ordered_moves(grid, ply, first, forced):
+            row = grid.drop_piece(col, id_player)
+            if threat_map is not None:
+                threat_map.play(col, row, id_player)
+            if grid.winning_move(id_player, self.nb_in_a_row):
+                score = WIN_SCORE - ply - 1
+            elif grid.is_full():
+                score = 0
+            else:
+                score = -self.negamax(grid, depth - 1, -beta, -alpha,
+                                      other, ply + 1)[0]
+            grid.undo_piece(col)
+            if threat_map is not None:
+                threat_map.undo(col, row, id_player)
+            if score > best_score:
+                best_score, best_move = score, col
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        self.store_killer(ply, col)
+                        break
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, flag, self.to_tt(best_score, ply),
+                      grid.mirror_col(best_move) if mirrored else best_move)
+        return best_score, best_move
+
+    def search(self, grid: Grid, id_player: int, movetime: float = None,
+               max_nodes: int = None, max_depth: int = None,
+               info=None) -> SearchResult:
+        """Looks for the best move of `id_player` by iterative deepening.
+
+        The search stops when the time (in seconds) or the nodes are
+        spent, and gives the result of the deepest completed iteration.
+        Positions of the opening book are not searched. `info` is called
+        with the result of each completed iteration.
+        """
+        if self.book is not None:
+            entry = self.book.lookup(grid, id_player, self.nb_in_a_row)
+            if entry is not None:
+                return SearchResult(entry[0], entry[1], 0, 0, 0., 0.)
+
+        movetime = self.movetime if movetime is None else movetime
+        max_nodes = self.max_nodes if max_nodes is None else max_nodes
+        max_depth = self.max_depth if max_depth is None else max_depth
+        nb_empty = grid.nb_rows * grid.nb_cols - grid.nb_moves
+        if max_depth is None or max_depth > nb_empty:
+            max_depth = nb_empty
+
+        # a search stopped by its budget leaves pieces on its grid
+        position, grid = grid, grid.copy()
+        if self.threats:
+            self._threat_map = ThreatMap.from_grid(grid, self.nb_in_a_row)
+        start = time.perf_counter()
+        with self._deadline_lock:
+            # a sooner deadline given by `set_movetime` before the start
+            # is kept
+            if movetime is not None and (self._deadline is None
+                                         or start + movetime
+                                         < self._deadline):
+                self._deadline = start + movetime
+        self._node_limit = max_nodes
+        self.nodes = self.cutoffs = 0
+        self.killers = [[None, None] for _ in range(nb_empty + 1)]
+
+        best_move, score, depth = None, 0, 0
+        for d in range(1, max_depth + 1):
+            try:
+                s, move = self.negamax(grid, d, -WIN_SCORE, WIN_SCORE,
+                                       id_player, 0, best_move)
+            except SearchTimeout:
+                break
+            best_move, score, depth = move, s, d
+            if info is not None:
+                elapsed = time.perf_counter() - start
+                info(SearchResult(best_move, score, depth, self.nodes,
+                                  elapsed,
+                                  self.nodes / elapsed if elapsed else 0.))
+            if abs(score) >= MATE_BOUND:
+                break
+        self._threat_map = None
+        if best_move is None and nb_empty:
+            # not even the first iteration completed
+            best_move = self.ordered_moves(position, 0)[0]
+
+        elapsed = time.perf_counter() - start
+        with self._deadline_lock:
+            self._deadline = None
+        self._node_limit = None
+        return SearchResult(best_move, score, depth, self.nodes, elapsed,
+                            self.nodes / elapsed if elapsed else 0.)
+
+    def best_move(self, grid: Grid, id_player: int) -> int:
+        """Gives the column the engine plays, None if the grid is full."""
+        return self.search(grid, id_player).best_move
+
+    def principal_variation(self, grid: Grid, id_player: int,
+                            best_move: int, max_plies: int) -> list:
+        """Gives the expected line of play, from `best_move` of
+        `id_player` then the moves of the transposition table."""
+        grid = grid.copy()
+        line = []
+        col = best_move
+        while col is not None and len(line) < max_plies \
+                and grid.is_valid_location(col):
+            grid.drop_piece(col, id_player)
+            line.append(col)
+            if grid.winning_move(id_player, self.nb_in_a_row) \
+                    or grid.is_full():
+                break
+            id_player = self.other(id_player)
+            key, mirrored = grid.canonical_key(id_player)
+            entry = self.tt.probe(key)
+            col = None if entry is None else entry[3]
+            if mirrored:
+                col = grid.mirror_col(col)
+        return line
+
+
+def perft(grid: Grid, depth: int, id_player: int, nb_in_a_row: int) -> int:
+    """Counts the games of `depth` more moves, a game stopping when it is
+    won or the grid full."""
+    if depth == 0:
+        return 1
+    nb_games = 0
+    for col in range(grid.nb_cols):
+        if not grid.is_valid_location(col):
+            continue
+        grid.drop_piece(col, id_player)
+        if grid.winning_move(id_player, nb_in_a_row) or grid.is_full():
+            nb_games += 1
+        else:
+            nb_games += perft(grid, depth - 1, id_player % 2 + 1,
+                              nb_in_a_row)
+        grid.undo_piece(col)
+    return nb_games
+
+
+class EngineProtocol:
+    """Text protocol of the engine, one command per line"""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.nb_in_a_row = 4
+        self.grid = Grid()
+        self.engine = Engine(self.nb_in_a_row)
+
+    def send(self, line: str):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    @property
+    def id_player(self) -> int:
+        return self.grid.nb_moves % 2 + 1
+
+    def handle(self, line: str) -> bool:
+        """Executes a command, returns False on `quit`."""
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "quit":
+            return False
+        handler = getattr(self, f"cmd_{command}", None)
+        if handler is None:
+            self.send(f"error unknown command {command}")
+            return True
+        try:
+            handler(args)
+        except (ValueError, IndexError, InvalidMoveError) as error:
+            self.send(f"error {error}")
+        return True
+
+    def cmd_isready(self, args):
+        self.send("readyok")
+
+    def cmd_new(self, args):
+        self.engine.tt.clear()
+
+    def cmd_size(self, args):
+        nb_rows, nb_cols = int(args[0]), int(args[1])
+        self.nb_in_a_row = int(args[2]) if len(args) > 2 else 4
+        self.grid = Grid(nb_rows, nb_cols)
+        self.engine.nb_in_a_row = self.nb_in_a_row
+
+    def cmd_position(self, args):
+        if len(args) == 1 and args[0].isdigit() and self.grid.nb_cols <= 9:
+            # moves written as one word, e.g. 4453 (one digit per column)
+            args = list(args[0])
+        grid = Grid(self.grid.nb_rows, self.grid.nb_cols)
+        id_player = 1
+        for word in args:
+            if word == "startpos":
+                continue
+            grid.drop_piece(int(word) - 1, id_player)
+            id_player = id_player % 2 + 1
+        self.grid = grid
+
+    def cmd_go(self, args):
+        options = dict(zip(args[::2], map(int, args[1::2])))
+        movetime = options.get("movetime")
+        if not options:
+            movetime = MOVETIME * 1000
+        elif movetime is None:
+            # only limited by the depth or the nodes
+            movetime = math.inf
+
+        def info(result: SearchResult):
+            self.send(f"info depth {result.depth} score {result.score}"
+                      f" nodes {result.nodes} nps {result.nps:.0f}"
+                      f" time {result.elapsed * 1000:.0f}"
+                      f" pv {result.best_move + 1}")
+
+        result = self.engine.search(
+            self.grid, self.id_player,
+            movetime=None if movetime is None else movetime / 1000,
+            max_nodes=options.get("nodes"), max_depth=options.get("depth"),
+            info=info)
+        if result.best_move is None:
+            self.send("bestmove none")
+        else:
+            self.send(f"bestmove {result.best_move + 1}")
+
+    def cmd_eval(self, args):
+        self.send(f"eval {self.engine.evaluate(self.grid, self.id_player)}")
+
+    def cmd_perft(self, args):
+        depth = int(args[0])
+        start = time.perf_counter()
+        nb_games = perft(self.grid.copy(), depth, self.id_player,
+                         self.nb_in_a_row)
+        elapsed = time.perf_counter() - start
+        self.send(f"perft {depth} {nb_games} time {elapsed * 1000:.0f}")
+
+    def loop(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line):
+                break
+
+
+def main():
+    EngineProtocol().loop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Evaluation of batches of positions by a pool of processes.
+
+The positions of a `PositionBatch` live in a block of shared memory
+(`multiprocessing.shared_memory`), with a fixed stride: the masks of the
+two players (2 x 8 bytes) of every position, then the player to move of
+every position (1 byte), the scores (4 bytes) and the best moves (1
+byte, -1 for none). The workers attach to the block once, by its name,
+and evaluate slices of it in place: only the bounds of the slices go to
+the workers, and only the number of positions evaluated comes back. A
+worker keeps the last block it attached to, until the next batch.
+
+Usage: python evalpool.py --positions 1000000 --depth 0 --workers 8
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from grid import Grid
+from engine import Engine
+
+
+NO_MOVE = -1
+# positions per task sent to the workers
+CHUNK_SIZE = 4096
+TASKS_PER_WORKER = 4
+
+# batch attached by a worker process, the last one it evaluated
+_batch = None
+# engines of a worker process, by (number in a row, depth)
+_engines = {}
+
+
+def layout(nb_positions: int) -> tuple:
+    """Offsets of the masks, the players to move, the scores and the
+    best moves in the block, and the size of the block."""
+    masks = 0
+    to_move = masks + 16 * nb_positions
+    scores = to_move + nb_positions
+    # the scores are aligned on 4 bytes
+    scores += -scores % 4
+    moves = scores + 4 * nb_positions
+    return masks, to_move, scores, moves, moves + nb_positions
+
+
+class PositionBatch:
+    """Positions of grids of `nb_rows` x `nb_cols` in shared memory"""
+
+    def __init__(self, nb_positions: int, nb_rows: int = 6, nb_cols: int = 7,
+                 name: str = None):
+        if (nb_rows + 1) * nb_cols > 64:
+            raise ValueError("The batches need grids of 64 bits at most.")
+        self.nb_positions = nb_positions
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        *offsets, size = layout(nb_positions)
+        # the block is created, unless a name is given to attach to it
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True,
+                                                  size=max(1, size))
+        else:
+            self.shm = attach(name)
+        buffer = self.shm.buf
+        self.masks = np.ndarray((nb_positions, 2), np.uint64, buffer,
+                                offsets[0])
+        self.to_move = np.ndarray(nb_positions, np.uint8, buffer,
+                                  offsets[1])
+        self.scores = np.ndarray(nb_positions, np.int32, buffer, offsets[2])
+        self.moves = np.ndarray(nb_positions, np.int8, buffer, offsets[3])
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def set(self, i: int, grid: Grid, id_player: int):
+        """Writes the grid, `id_player` to move, as the position `i`."""
+        self.masks[i] = grid.masks[1:3]
+        self.to_move[i] = id_player
+
+    def grid(self, i: int) -> Grid:
+        """Grid of the position `i`."""
+        grid = Grid(self.nb_rows, self.nb_cols)
+        grid.set_masks(self.masks[i].tolist())
+        return grid
+
+    def close(self):
+        """Releases the views and the block, which is destroyed by its
+        owner."""
+        self.masks = self.to_move = self.scores = self.moves = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __len__(self):
+        return self.nb_positions
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to the block `name`, which its creator unlinks."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13, the forked workers share the tracker of
+        # their parent, which forgets the block once on unlink
+        return shared_memory.SharedMemory(name)
+
+
+def evaluate_slice(name: str, nb_positions: int, nb_rows: int, nb_cols: int,
+                   nb_in_a_row: int, depth: int, start: int,
+                   stop: int) -> int:
+    """Evaluates the positions `start` to `stop` of the batch `name`
+    (in a worker process), and returns their number."""
+    global _batch
+    if _batch is None or _batch.name != name:
+        if _batch is not None:
+            _batch.close()
+        _batch = PositionBatch(nb_positions, nb_rows, nb_cols, name)
+    batch = _batch
+    engine = _engines.get((nb_in_a_row, depth))
+    if engine is None:
+        engine = _engines[nb_in_a_row, depth] = Engine(
+            nb_in_a_row, movetime=None, max_depth=depth, tt_size_mb=1)
+    grid = Grid(nb_rows, nb_cols)
+    scores, moves = [], []
+    for masks, id_player in zip(batch.masks[start:stop].tolist(),
+                                batch.to_move[start:stop].tolist()):
+        grid.set_masks(masks)
+        if depth == 0 or grid.is_full():
+            scores.append(engine.evaluate(grid, id_player))
+            moves.append(NO_MOVE)
+        else:
+            # a fresh table (a new generation of it, see `tt`), so that
+            # the results do not depend on the slices
+            engine.tt.clear()
+            result = engine.search(grid, id_player)
+            scores.append(result.score)
+            moves.append(result.best_move)
+    batch.scores[start:stop] = scores
+    batch.moves[start:stop] = moves
+    return stop - start
+
+
+class EvaluationPool:
+    """Pool of processes evaluating `PositionBatch`es in place"""
+
+    def __init__(self, nb_in_a_row: int = 4, nb_workers: int = None):
+        self.nb_in_a_row = nb_in_a_row
+        self.nb_workers = nb_workers or os.cpu_count() or 1
+        self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.nb_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def evaluate(self, batch: PositionBatch, depth: int = 0,
+                 chunk_size: int = None) -> PositionBatch:
+        """Writes the scores and best moves of all the positions of the
+        batch into it: static evaluations of `Engine.evaluate` if
+        `depth` is 0, else searches of `depth` plies."""
+        n = batch.nb_positions
+        if chunk_size is None:
+            chunk_size = min(CHUNK_SIZE, -(-n // (self.nb_workers
+                                                   * TASKS_PER_WORKER)))
+        chunk_size = max(1, chunk_size)
+        futures = [self.pool.submit(evaluate_slice, batch.name, n,
+                                    batch.nb_rows, batch.nb_cols,
+                                    self.nb_in_a_row, depth, start,
+                                    min(start + chunk_size, n))
+                   for start in range(0, n, chunk_size)]
+        nb_evaluated = sum(future.result() for future in futures)
+        if nb_evaluated != n:
+            raise RuntimeError(f"{nb_evaluated} positions of {n} were"
+                               f" evaluated.")
+        return batch
+
+
+def random_batch(nb_positions: int, nb_rows: int = 6, nb_cols: int = 7,
+                 nb_in_a_row: int = 4, seed: int = 0) -> PositionBatch:
+    """Batch of the positions of random games, until someone wins."""
+    rng = random.Random(seed)
+    masks, to_move = [], []
+    grid = Grid(nb_rows, nb_cols)
+    while len(masks) < nb_positions:
+        grid.reset_board()
+        id_player = 1
+        cols = list(range(nb_cols))
+        while cols and len(masks) < nb_positions:
+            masks.append(grid.masks[1:3])
+            to_move.append(id_player)
+            col = rng.choice(cols)
+            grid.drop_piece(col, id_player)
+            if grid.heights[col] == nb_rows:
+                cols.remove(col)
+            if grid.winning_move(id_player, nb_in_a_row):
+                break
+            id_player = id_player % 2 + 1
+    batch = PositionBatch(nb_positions, nb_rows, nb_cols)
+    batch.masks[:] = masks
+    batch.to_move[:] = to_move
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluates random"
+                                                 " positions of power four"
+                                                 " in a process pool.")
+    parser.add_argument("--positions", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=0,
+                        help="plies searched, 0 for static evaluations")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batch = random_batch(args.positions, args.rows, args.cols,
+                         args.nb_in_a_row)
+    print(f"{args.positions} positions written"
+          f" in {time.perf_counter() - start:.1f}s")
+    with batch, EvaluationPool(args.nb_in_a_row, args.workers) as pool:
+        # the workers are started before the clock
+        pool.pool.submit(os.getpid).result()
+        start = time.perf_counter()
+        pool.evaluate(batch, args.depth)
+        elapsed = time.perf_counter() - start
+        print(f"{args.positions} positions evaluated by {pool.nb_workers}"
+              f" workers in {elapsed:.2f}s:"
+              f" {args.positions / elapsed:.0f} positions/s")
+
+
+if __name__ == "__main__":
+    main()
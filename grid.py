@@ -0,0 +1,283 @@
+"""
+Bitboard grid of power four.
+
+Each player's pieces are stored in one integer mask: the cell
+(row, col) is the bit `col * (nb_rows + 1) + row`. The extra bit on top
+of each column is always empty, so that shifting a mask never lets an
+alignment wrap from one column to the next. The owner of each cell is
+also kept in a flat list with the same indices, so that the lines
+through a piece are walked cell by cell on any size of grid.
+"""
+
+import random
+from functools import lru_cache
+
+
+NB_PLAYERS = 2
+
+ZOBRIST_SEED = 0x50F4
+
+# (d_row, d_col) of the vertical, horizontal, and diagonal orientations
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (-1, 1))
+
+
+class InvalidMoveError(Exception):
+    """Custom error for invalid moves."""
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(nb_bits: int, nb_players: int) -> tuple:
+    """Random 64 bits keys of the pieces, per player and per bit of the
+    grid, and the keys of the player to move.
+
+    The seed is fixed, so that hashes are the same from one run to
+    another (and can be stored)."""
+    rng = random.Random(ZOBRIST_SEED)
+    pieces = tuple(tuple(rng.getrandbits(64) for _ in range(nb_bits))
+                   if id_player else ()
+                   for id_player in range(nb_players + 1))
+    turns = tuple(rng.getrandbits(64) for _ in range(nb_players + 1))
+    return pieces, turns
+
+
+class Grid:
+    """Stores the grid of power four"""
+
+    def __init__(self, nb_rows: int = 6,
+                 nb_cols: int = 7,
+                 nb_players: int = NB_PLAYERS):
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.nb_players = nb_players
+        # number of bits used by a column, sentinel included
+        self.col_height = nb_rows + 1
+        # masks[0] holds every piece, masks[id_player] the player's ones
+        self.masks = [0] * (nb_players + 1)
+        # id of the player in each cell, 0 if empty, by bit index
+        self.cells = [0] * (self.col_height * nb_cols)
+        self.heights = [0] * nb_cols
+        self.nb_moves = 0
+        # Zobrist hash of the pieces, and of their mirror (the columns
+        # reversed), updated at each move
+        self.hash = 0
+        self.mirror_hash = 0
+        self.zobrist, self.turn_keys = zobrist_keys(
+            self.col_height * nb_cols, nb_players)
+
+    def reset_board(self):
+        self.masks = [0] * (self.nb_players + 1)
+        self.cells = [0] * (self.col_height * self.nb_cols)
+        self.heights = [0] * self.nb_cols
+        self.nb_moves = 0
+        self.hash = 0
+        self.mirror_hash = 0
+
+    def copy(self) -> "Grid":
+        grid = Grid(self.nb_rows, self.nb_cols, self.nb_players)
+        grid.masks = self.masks.copy()
+        grid.cells = self.cells.copy()
+        grid.heights = self.heights.copy()
+        grid.nb_moves = self.nb_moves
+        grid.hash = self.hash
+        grid.mirror_hash = self.mirror_hash
+        return grid
+
+    def set_masks(self, masks):
+        """Sets the pieces from the masks of the players, `masks[i]`
+        being the one of the player `i + 1`."""
+        self.reset_board()
+        height = self.col_height
+        for id_player, mask in enumerate(masks, 1):
+            self.masks[id_player] = mask
+            self.masks[0] |= mask
+            while mask:
+                index = (mask & -mask).bit_length() - 1
+                mask &= mask - 1
+                self.cells[index] = id_player
+                col = index // height
+                self.hash ^= self.zobrist[id_player][index]
+                self.mirror_hash ^= self.zobrist[id_player][
+                    index + (self.nb_cols - 1 - 2 * col) * height]
+                self.heights[col] = max(self.heights[col],
+                                        index - col * height + 1)
+        self.nb_moves = self.masks[0].bit_count()
+
+    def __getstate__(self) -> dict:
+        # the Zobrist keys are not pickled, but found back from the cache
+        state = self.__dict__.copy()
+        del state["zobrist"], state["turn_keys"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.zobrist, self.turn_keys = zobrist_keys(
+            self.col_height * self.nb_cols, self.nb_players)
+
+    def key(self, id_player: int) -> int:
+        """Zobrist key of the position, with `id_player` to move."""
+        return self.hash ^ self.turn_keys[id_player]
+
+    def canonical_key(self, id_player: int) -> tuple:
+        """Key of the position or of its mirror, whichever is smaller,
+        and whether it is the key of the mirror. A position and its
+        mirror have the same canonical key: the columns stored with it
+        are mirrored (see `mirror_col`) when it is the key of the
+        mirror."""
+        if self.mirror_hash < self.hash:
+            return self.mirror_hash ^ self.turn_keys[id_player], True
+        return self.hash ^ self.turn_keys[id_player], False
+
+    def mirror_col(self, col):
+        """Column seen in a mirror (None stays None)."""
+        return None if col is None else self.nb_cols - 1 - col
+
+    def bit(self, row: int, col: int) -> int:
+        """Gives the bit of the cell (row, col)."""
+        return 1 << (col * self.col_height + row)
+
+    def cell(self, row: int, col: int) -> int:
+        """Gives the id of the player in (row, col), 0 if empty."""
+        return self.cells[col * self.col_height + row]
+
+    @property
+    def board(self):
+        """NumPy array view of the grid, row 0 being the bottom row."""
+        # NumPy is only imported by the front-ends, to keep the rules light
+        import numpy as np
+        board = np.zeros((self.nb_rows, self.nb_cols), dtype=int)
+        for c in range(self.nb_cols):
+            for r in range(self.heights[c]):
+                board[r, c] = self.cell(r, c)
+        return board
+
+    def is_valid_location(self, col: int) -> bool:
+        """Checks if a column is a valid location for a piece."""
+        return 0 <= col < self.nb_cols and self.heights[col] < self.nb_rows
+
+    def get_next_open_row(self, col: int) -> int:
+        """Finds the first row where a new piece can go.
+
+        This row must be a valid location"""
+        if not self.is_valid_location(col):
+            raise InvalidMoveError("This column is filled."
+                                   " Please try another.")
+        return self.heights[col]
+
+    def drop_piece(self, col: int, id_player: int) -> int:
+        """Drop the piece in the column, and returns its row."""
+        row = self.get_next_open_row(col)
+        index = col * self.col_height + row
+        bit = 1 << index
+        self.masks[0] |= bit
+        self.masks[id_player] |= bit
+        self.cells[index] = id_player
+        self.heights[col] = row + 1
+        self.nb_moves += 1
+        self.hash ^= self.zobrist[id_player][index]
+        self.mirror_hash ^= self.zobrist[id_player][
+            index + (self.nb_cols - 1 - 2 * col) * self.col_height]
+        return row
+
+    def undo_piece(self, col: int) -> int:
+        """Removes the top piece of the column, and returns its row."""
+        row = self.heights[col] - 1
+        if row < 0:
+            raise InvalidMoveError("This column is empty.")
+        index = col * self.col_height + row
+        bit = 1 << index
+        id_player = self.cells[index]
+        self.cells[index] = 0
+        self.masks[id_player] ^= bit
+        self.masks[0] ^= bit
+        self.hash ^= self.zobrist[id_player][index]
+        self.mirror_hash ^= self.zobrist[id_player][
+            index + (self.nb_cols - 1 - 2 * col) * self.col_height]
+        self.heights[col] = row
+        self.nb_moves -= 1
+        return row
+
+    def is_full(self) -> bool:
+        """Checks if there is no room left in the grid."""
+        return self.nb_moves == self.nb_rows * self.nb_cols
+
+    def print_board(self):
+        print(self.board[::-1])
+
+    def line_through(self, row: int, col: int, d_row: int, d_col: int,
+                     id_player: int) -> list:
+        """Gives the pieces of `id_player` aligned with (row, col) along
+        (d_row, d_col), from one end of the alignment to the other."""
+        cells, h = self.cells, self.col_height
+        step = d_col * h + d_row
+        index = col * h + row
+        # the sentinel cells stop the walk at the top and the bottom
+        start = index
+        while 0 <= start - step < len(cells) \
+                and cells[start - step] == id_player:
+            start -= step
+        end = index
+        while 0 <= end + step < len(cells) \
+                and cells[end + step] == id_player:
+            end += step
+        return [(i % h, i // h) for i in range(start, end + 1, step)]
+
+    def check_win_at(self, row: int, col: int, id_player: int,
+                     nb_in_a_row: int = 4) -> list:
+        """Checks the four lines through the piece in (row, col).
+
+        Returns the cells of the winning alignments, empty if `id_player`
+        did not win. A line is only walked as far as the pieces of
+        `id_player` go, so the cost does not depend on the size of the
+        grid."""
+        winning_cells = []
+        for d_row, d_col in DIRECTIONS:
+            line = self.line_through(row, col, d_row, d_col, id_player)
+            if len(line) >= nb_in_a_row:
+                winning_cells.extend(cell for cell in line
+                                     if cell not in winning_cells)
+        return winning_cells
+
+    def winning_alignments(self, id_player: int,
+                           nb_in_a_row: int = 4) -> list:
+        """Gives every alignment of at least `nb_in_a_row` pieces of
+        `id_player` on the grid, each one as the list of its cells."""
+        mask = self.masks[id_player]
+        h = self.col_height
+        all_alignments = []
+        for d_row, d_col in DIRECTIONS:
+            shift = d_col * h + d_row
+            # first bits of the alignments, which do not continue a longer
+            # one from the previous cell
+            starts = self.alignments(mask, shift, nb_in_a_row) \
+                & ~(mask << shift)
+            while starts:
+                low = starts & -starts
+                starts ^= low
+                index = low.bit_length() - 1
+                all_alignments.append(self.line_through(
+                    index % h, index // h, d_row, d_col, id_player))
+        return all_alignments
+
+    def directions(self) -> tuple:
+        """Gives the bit shifts of the four orientations.
+
+        Vertical, horizontal, and the two diagonals."""
+        h = self.col_height
+        return tuple(d_col * h + d_row for d_row, d_col in DIRECTIONS)
+
+    @staticmethod
+    def alignments(mask: int, shift: int, nb_in_a_row: int) -> int:
+        """Gives the bits starting `nb_in_a_row` pieces aligned along
+        `shift` in `mask`."""
+        run, length = mask, 1
+        while length < nb_in_a_row:
+            step = min(length, nb_in_a_row - length)
+            run &= run >> (step * shift)
+            length += step
+        return run
+
+    def winning_move(self, player_id: int, nb_in_a_row: int = 4) -> bool:
+        """Check if `player` is winning."""
+        mask = self.masks[player_id]
+        return any(self.alignments(mask, shift, nb_in_a_row)
+                   for shift in self.directions())
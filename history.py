@@ -0,0 +1,108 @@
+"""
+History of a game of power four.
+
+Only the moves are stored, in a tree whose branches are the variations
+played after an undo. Undo and redo give back the move to remove from
+or to put again on the grid, so that a front-end only changes one cell.
+"""
+
+from collections import namedtuple
+
+
+Move = namedtuple("Move", ["col", "row", "id_player"])
+
+
+class HistoryNode:
+    """Position reached by `move`, with the variations played after it"""
+
+    __slots__ = ("move", "parent", "children", "selected")
+
+    def __init__(self, move, parent):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        # index of the child followed by a redo
+        self.selected = 0
+
+
+class History:
+    """Moves of a game, with its variations"""
+
+    def __init__(self):
+        self.root = HistoryNode(None, None)
+        self.current = self.root
+        self.ply = 0
+
+    def __len__(self):
+        return self.ply
+
+    def push(self, move: Move):
+        """Records a move played from the current position.
+
+        Playing again the move of a variation follows it, another move
+        opens a new variation."""
+        node = self.current
+        for i, child in enumerate(node.children):
+            if child.move == move:
+                break
+        else:
+            i = len(node.children)
+            node.children.append(HistoryNode(move, node))
+        node.selected = i
+        self.current = node.children[i]
+        self.ply += 1
+
+    def can_undo(self) -> bool:
+        return self.current is not self.root
+
+    def can_redo(self) -> bool:
+        return bool(self.current.children)
+
+    def undo(self):
+        """Goes back one move, and returns it (None at the start)."""
+        if not self.can_undo():
+            return None
+        move = self.current.move
+        self.current = self.current.parent
+        self.ply -= 1
+        return move
+
+    def redo(self):
+        """Plays again the selected variation, and returns its move (None
+        at the end)."""
+        if not self.can_redo():
+            return None
+        node = self.current
+        self.current = node.children[node.selected]
+        self.ply += 1
+        return self.current.move
+
+    def variations(self) -> list:
+        """Gives the first moves of the variations after the current
+        position."""
+        return [child.move for child in self.current.children]
+
+    def select_variation(self, index: int):
+        """Chooses the variation followed by the next redo."""
+        if not 0 <= index < len(self.current.children):
+            raise IndexError(f"No variation {index} here.")
+        self.current.selected = index
+
+    def jump(self, ply: int):
+        """Goes to the ply `ply` of the current line.
+
+        Yields (move, forward) for each move to remove (forward is False)
+        or to put again (forward is True) on the grid."""
+        while self.ply > ply and self.can_undo():
+            yield self.undo(), False
+        while self.ply < ply and self.can_redo():
+            yield self.redo(), True
+
+    def moves(self) -> list:
+        """Gives the moves from the start to the current position."""
+        moves = []
+        node = self.current
+        while node is not self.root:
+            moves.append(node.move)
+            node = node.parent
+        return moves[::-1]
@@ -0,0 +1,184 @@
+"""
+Opt-in instrumentation of the front-ends and of the engine.
+
+The phases of the game loops (events, drawing, win checks, searches)
+are timed in latency histograms, with counters (frames, nodes, hits of
+the transposition table, cutoffs) and gauges (depth of the event queue).
+The data are dumped periodically as JSON lines and summed up in one line
+for an on-screen overlay.
+
+It is disabled by default, and a disabled hook only tests a flag. It is
+enabled by the environment variable POWER_FOUR_INSTRUMENT, set to the
+path of the JSON lines file, or to 1 for the overlay only:
+
+    POWER_FOUR_INSTRUMENT=profile.jsonl python draft.py
+"""
+
+import atexit
+import functools
+import json
+import os
+import time
+
+
+ENV_VAR = "POWER_FOUR_INSTRUMENT"
+DUMP_INTERVAL = 5.  # seconds between two dumps
+# upper bounds of the buckets of the histograms, in microseconds
+BUCKETS = tuple(2 ** i for i in range(25))
+
+
+class Histogram:
+    """Latencies, in buckets of powers of two microseconds"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, seconds: float):
+        us = seconds * 1e6
+        self.counts[min(int(us).bit_length(), len(BUCKETS))] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the percentile `p` (in
+        microseconds)."""
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return float(BUCKETS[i]) if i < len(BUCKETS) else self.max
+        return 0.
+
+    def to_dict(self) -> dict:
+        return {"count": self.count,
+                "mean_us": self.total / self.count if self.count else 0.,
+                "p50_us": self.percentile(.5),
+                "p99_us": self.percentile(.99),
+                "max_us": self.max,
+                "buckets": {BUCKETS[i] if i < len(BUCKETS) else "inf": n
+                            for i, n in enumerate(self.counts) if n}}
+
+
+class Instrument:
+    """Histograms, counters and gauges of a running game"""
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.interval = DUMP_INTERVAL
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.start = self._last_dump = time.perf_counter()
+
+    def enable(self, path: str = None, interval: float = DUMP_INTERVAL):
+        """Starts recording, dumped to `path` (JSON lines) if given."""
+        self.enabled = True
+        self.path = path
+        self.interval = interval
+        self.reset()
+        if path is not None:
+            atexit.register(self.dump)
+
+    def disable(self):
+        if self.enabled and self.path is not None:
+            self.dump()
+            atexit.unregister(self.dump)
+        self.enabled = False
+
+    def record(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value):
+        """Records the last value and the maximum of `name`."""
+        last_max = self.gauges.get(name, (value, value))[1]
+        self.gauges[name] = (value, max(value, last_max))
+
+    def search(self, engine, result=None):
+        """Records the counters of the last search of an `Engine`."""
+        if result is not None:
+            self.record("search", result.elapsed)
+            self.gauge("search_depth", result.depth)
+        self.count("nodes", engine.nodes)
+        self.count("cutoffs", engine.cutoffs)
+        tt = engine.tt
+        # the counters of the table are not reset between searches
+        self.gauges["tt_hits"] = (tt.hits, tt.hits)
+        self.gauges["tt_misses"] = (tt.misses, tt.misses)
+
+    def frame(self):
+        """Counts a frame drawn, and dumps the data when it is time."""
+        self.count("frames")
+        if self.path is not None \
+                and time.perf_counter() - self._last_dump >= self.interval:
+            self.dump()
+
+    def snapshot(self) -> dict:
+        return {"time": time.time(),
+                "elapsed": time.perf_counter() - self.start,
+                "histograms": {name: histogram.to_dict()
+                               for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+                "gauges": {name: {"last": last, "max": max_value}
+                           for name, (last, max_value) in self.gauges.items()}}
+
+    def dump(self):
+        """Appends the data recorded so far to the JSON lines file."""
+        self._last_dump = time.perf_counter()
+        if self.path is None:
+            return
+        with open(self.path, "a") as file:
+            file.write(json.dumps(self.snapshot()) + "\n")
+
+    def overlay(self) -> str:
+        """Sums the data up in one line, for the screen."""
+        elapsed = time.perf_counter() - self.start
+        parts = [f"{self.counters.get('frames', 0) / elapsed:.0f} fps"
+                 if elapsed else "0 fps"]
+        for name, histogram in sorted(self.histograms.items()):
+            parts.append(f"{name} p99 {histogram.percentile(.99) / 1e3:.1f}ms")
+        if "event_queue" in self.gauges:
+            parts.append(f"queue max {self.gauges['event_queue'][1]}")
+        if "nodes" in self.counters:
+            parts.append(f"nodes {self.counters['nodes']}")
+        return " | ".join(parts)
+
+
+INSTRUMENT = Instrument()
+if os.environ.get(ENV_VAR):
+    INSTRUMENT.enable(None if os.environ[ENV_VAR] == "1"
+                      else os.environ[ENV_VAR])
+
+
+def timed(name: str):
+    """Decorator recording the latency of each call in the histogram
+    `name`, when the instrumentation is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENT.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                INSTRUMENT.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+"""
+Load test of the game server.
+
+Simulated clients pair up with `seek` and play random moves as fast as
+they can, and the time from each move sent to its `moved` message is
+measured. The clients either connect to a server over TCP, or talk to a
+`server.GameServer` of the same process without any socket, to load the
+matches without the limits of the sockets.
+
+Usage:
+    python loadtest.py --games 10000                    in process
+    python loadtest.py --games 500 --host localhost     over TCP
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from grid import Grid
+from server import GameServer, Session, PORT
+
+
+class Client:
+    """Simulated player, moving at random"""
+
+    def __init__(self, rng: random.Random, latencies: list,
+                 think: float = 0.):
+        self.rng = rng
+        self.latencies = latencies
+        self.think = think
+        self.write = None
+        self.grid = None
+        self.nb_in_a_row = None
+        self.seat = None
+        self.sent = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    def receive(self, line: str):
+        words = line.split()
+        if words[0] == "start":
+            self.seat = int(words[2])
+            self.grid = Grid(int(words[3]), int(words[4]))
+            self.nb_in_a_row = int(words[5])
+            if self.seat == 1:
+                self.play()
+        elif words[0] == "moved":
+            col, seat = int(words[1]) - 1, int(words[2])
+            self.grid.drop_piece(col, seat)
+            if seat == self.seat:
+                self.latencies.append(time.perf_counter() - self.sent)
+            elif not self.grid.is_full() \
+                    and not self.grid.winning_move(seat, self.nb_in_a_row):
+                self.play()
+        elif words[0] == "end":
+            if not self.done.done():
+                self.done.set_result(words[1:])
+        elif words[0] == "error":
+            # raised by the test, not by the loop running this callback
+            if not self.done.done():
+                self.done.set_exception(RuntimeError(line))
+
+    def play(self):
+        if self.think:
+            asyncio.get_running_loop().call_later(
+                self.rng.uniform(0, 2 * self.think), self.send_move)
+        else:
+            self.send_move()
+
+    def send_move(self):
+        cols = [c for c in range(self.grid.nb_cols)
+                if self.grid.is_valid_location(c)]
+        self.sent = time.perf_counter()
+        self.write(f"move {self.rng.choice(cols) + 1}")
+
+
+async def memory_client(server: GameServer, client: Client, seek: str):
+    # the lines are handed over by the loop, as they would be by sockets
+    loop = asyncio.get_running_loop()
+    session = Session(server, lambda line: loop.call_soon(client.receive,
+                                                          line))
+    client.write = lambda line: loop.call_soon(session.handle, line)
+    client.write(seek)
+    await client.done
+
+
+async def tcp_client(host: str, port: int, client: Client, seek: str):
+    reader, writer = await asyncio.open_connection(host, port)
+    client.write = lambda line: writer.write(line.encode() + b"\n")
+    client.write(seek)
+    while not client.done.done():
+        line = await reader.readline()
+        if not line:
+            break
+        client.receive(line.decode())
+    writer.write(b"quit\n")
+    writer.close()
+
+
+async def load_test(nb_games: int, host: str = None, port: int = PORT,
+                    setup: str = "6 7 4", think: float = 0.,
+                    seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    seek = f"seek {setup} 3600"
+    server = GameServer() if host is None else None
+    clients = []
+    for _ in range(2 * nb_games):
+        client = Client(random.Random(rng.random()), latencies, think)
+        if server is not None:
+            clients.append(memory_client(server, client, seek))
+        else:
+            clients.append(tcp_client(host, port, client, seek))
+    start = time.perf_counter()
+    await asyncio.gather(*clients)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"games": nb_games,
+            "moves": len(latencies),
+            "elapsed_s": elapsed,
+            "moves_per_s": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": latencies[int(.99 * (len(latencies) - 1))] * 1000,
+            "max_ms": latencies[-1] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the game"
+                                                 " server.")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--host", help="server to connect to (the"
+                                       " server runs in process if none)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--size", default="6 7 4",
+                        help="rows, columns and number in a row")
+    parser.add_argument("--think", type=float, default=0.,
+                        help="mean seconds before each move")
+    args = parser.parse_args()
+    report = asyncio.run(load_test(args.games, args.host, args.port,
+                                   args.size, args.think))
+    print(f"{report['games']} games, {report['moves']} moves"
+          f" in {report['elapsed_s']:.1f}s:"
+          f" {report['moves_per_s']:.0f} moves/s,"
+          f" p50 {report['p50_ms']:.2f}ms, p99 {report['p99_ms']:.2f}ms,"
+          f" max {report['max_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
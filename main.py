@@ -14,6 +14,13 @@ import tkinter
 from tkinter import Frame, Canvas, Toplevel, Scale, Message
 from super_matrix import SuperMatrix
 
+from grid import Grid
+from engine import Engine
+from history import History, Move
+from threats import ThreatMap
+from instrument import INSTRUMENT, timed
+from worker import EngineWorker
+
 
 # Todo : possibilities of variations :
 # Todo : - bigger power like power five in a greater grid
@@ -23,6 +30,11 @@ from super_matrix import SuperMatrix
 
 # Todo 1: keyboard shortcuts like cmd + U for Undo, etc...  -> Partly done
 
+RESIZE_DELAY = 50  # ms without <Configure> event before a resize
+DROP_DELAY = 100  # ms per row of the falling pawn
+OVERLAY_DELAY = 1000  # ms between two refreshes of the measures shown
+POLL_DELAY = 16  # ms between two readings of the messages of the engine
+
 
 class MenuBar(tkinter.Menu):
 
@@ -55,6 +67,9 @@ class MenuBar(tkinter.Menu):
 class Panel(Frame):
     """Panel de jeu (grille de n x m cases)"""
 
+    # colors of the pawns, indexed by the values of the state
+    COLORS = ["red", "yellow", "white", "black"]
+
     def __init__(self, root):
         # Red = 0 and Yellow = 1
         # The panel of game is constituted of a re-scaling grid
@@ -90,26 +105,55 @@ class Panel(Frame):
         self.player = 1  # TODO = to change color of first player.
         # construction of a list of lists
         self.state = SuperMatrix(2, self.n_row, self.n_col)
-        self.game = []
-        self.history = []
-        self.coup = 0
+        # rules of the game, the players 0 and 1 being 1 and 2 in the grid
+        self.grid = Grid(self.n_row, self.n_col)
+        self.nb_in_a_row = 4
+        # players (0 or 1) moved by the engine :
+        self.ai_players = set()
+        self.engine = Engine(self.nb_in_a_row)
+        # the engine searches in a thread, its messages are polled :
+        self.worker = EngineWorker(self.engine)
+        self.ai_job = None
+        # ply and player the running search was asked for :
+        self.ai_request = None
+        self.poll_job = None
+        self.hint = None
+        # threats of the players, and their marks when they are shown :
+        self.threats = ThreatMap(self.n_row, self.n_col, self.nb_in_a_row)
+        self.show_threats = False
+        self.threat_items = []
+        # moves of the game and its variations :
+        self.history = History()
+        self.winning_cells = []
         self.width, self.height = 2, 2
         self.cote = 0
         self.win = False
+        # items of the pawns, kept from a layout to another, with the
+        # colors and the side they were drawn with :
+        self.pawns = []
+        self.painted = []
+        self.traced_cote = None
+        # scheduled resize, and falling pawn of the drop animation :
+        self.resize_job = None
+        self.drop_job = None
+        self.falling = None
         self.init_jeu()
+        if INSTRUMENT.enabled:
+            self.after(OVERLAY_DELAY, self.update_overlay)
 
-    def init_jeu(self, state=None):
+    def init_jeu(self):
         """Initialisation of the list which remember the state of the game"""
+        self.cancel_drop()
+        self.stop_ai()
         self.win = False
-        if state is None:
-            # TODO : here to force first player color ?
-            #  (be careful with A.I. definition)
-            # self.player = 1
-            self.state = SuperMatrix(2, self.n_row, self.n_col)
-            self.game.append(self.state)
-        else:
-            self.state = state.copy()
-        self.game.append(self.state)
+        self.winning_cells = []
+        # TODO : here to force first player color ?
+        #  (be careful with A.I. definition)
+        # self.player = 1
+        self.state = SuperMatrix(2, self.n_row, self.n_col)
+        self.grid = Grid(self.n_row, self.n_col)
+        self.threats = ThreatMap(self.n_row, self.n_col, self.nb_in_a_row)
+        self.history = History()
         self.set_side()
         self.trace_grille()
 
@@ -128,35 +172,59 @@ class Panel(Frame):
         self.width, self.height = event.width - 4, event.height - 4
         # The subtraction of 4 pixels allows to compensate the width
         # of the 'highlight bordure' rolling the canvas
+        # A window drag sends many events : only the last one is laid out
+        if self.resize_job is not None:
+            self.after_cancel(self.resize_job)
+        self.resize_job = self.after(RESIZE_DELAY, self.apply_rescale)
+
+    def apply_rescale(self):
+        """Layout with the last size received"""
+        self.resize_job = None
         self.set_side()
         self.trace_grille()
 
+    def pawn_coords(self, l, c):
+        """Coordinates of the pawn in (l, c) : size of the case - 6"""
+        return (c * self.cote + 3, l * self.cote + 3,
+                (c + 1) * self.cote - 3, (l + 1) * self.cote - 3)
+
+    def paint_pawn(self, l, c):
+        """Updates the color of the pawn in (l, c) if it changed"""
+        color = self.COLORS[self.state[l][c]]
+        if self.painted[l][c] != color:
+            self.can.itemconfig(self.pawns[l][c], fill=color)
+            self.painted[l][c] = color
+
+    @timed("trace_grille")
     def trace_grille(self):
         """Layout of the grid, in function of dimensions and options"""
         # -> establishment of new dimensions for the canvas :
         wide, high = self.cote * self.n_col, self.cote * self.n_row
         self.can.configure(width=wide, height=high)
-        # Layout of the grid:
-        self.can.delete(tkinter.ALL)  # erasing of the past Layouts
-        # Layout of all the pawns,
+        # the pawns are only created when the size of the grid changes :
+        if len(self.pawns) != self.n_row \
+                or len(self.pawns[0]) != self.n_col:
+            self.can.delete(tkinter.ALL)
+            self.hint = None
+            self.threat_items = []
+            self.pawns = [[self.can.create_oval(self.pawn_coords(l, c),
+                                                outline="grey", width=1)
+                           for c in range(self.n_col)]
+                          for l in range(self.n_row)]
+            self.painted = [[None] * self.n_col for _ in range(self.n_row)]
+            self.traced_cote = self.cote
+        elif self.traced_cote != self.cote:
+            for l in range(self.n_row):
+                for c in range(self.n_col):
+                    self.can.coords(self.pawns[l][c], self.pawn_coords(l, c))
+            self.traced_cote = self.cote
         # white or black according to the state of the game :
         for l in range(self.n_row):
             for c in range(self.n_col):
-                x1 = c * self.cote + 3  # size of pawns =
-                x2 = (c + 1) * self.cote - 3  # size of the case -6
-                y1 = l * self.cote + 3  #
-                y2 = (l + 1) * self.cote - 3
-                color = ["red", "yellow", "white", "black"][self.state[l][c]]
-                self.can.create_oval(x1, y1, x2, y2, outline="grey",
-                                     width=1, fill=color)
+                self.paint_pawn(l, c)
         self.can_bis.configure(width=self.width - wide, height=self.height)
-        self.can_bis.delete(self.turn, self.turn_bis)
-        self.turn = \
-            self.can_bis.create_text(self.can_bis.winfo_width() / 2,
-                                     self.can_bis.winfo_height() / 3,
-                                     text=f"{['Red', 'Yellow'][self.player]}'s"
-                                          f"\n turn",
-                                     font="Helvetica 18 bold")
+        self.can_bis.coords(self.turn, self.can_bis.winfo_width() / 2,
+                            self.can_bis.winfo_height() / 3)
         x = self.can_bis.winfo_width() / 3
         y = self.can_bis.winfo_height() / 3
         r = min([x, y, 40])
@@ -164,130 +232,313 @@ class Panel(Frame):
         x1 = 3 * x / 2 - r
         x2 = 3 * x / 2 + r
         y2 = y * 2 + r
-        self.turn_bis\
-            = self.can_bis.create_oval(x1, y1, x2, y2, outline="grey", width=1,
-                                       fill=["red", "yellow"][self.player])
-
+        self.can_bis.coords(self.turn_bis, x1, y1, x2, y2)
+        if not self.win:
+            self.trace_turn()
+        self.draw_threats()
+        if INSTRUMENT.enabled:
+            INSTRUMENT.frame()
+
+    def trace_turn(self):
+        """Shows whose turn it is"""
+        self.can_bis.itemconfig(
+            self.turn, text=f"{['Red', 'Yellow'][self.player]}'s\n turn")
+        self.can_bis.itemconfig(self.turn_bis, state=tkinter.NORMAL,
+                                fill=["red", "yellow"][self.player])
+
+    @timed("click")
     def click(self, event):
         """Management of the mouse click : return the pawns"""
         # We start to determinate the line and the columns :
         row, col = int(event.y / self.cote), int(event.x / self.cote)
+        if self.player in self.ai_players:
+            return
         if 0 <= row < self.n_row and 0 <= col < self.n_col:
-            # maximal width and height possibles for the cases :
-            l_max = self.width / self.n_col
-            h_max = self.height / self.n_row
-            # the side of a case would be the smallest of the two dimensions :
-            self.cote = min(l_max, h_max)
-            wide, high = self.cote * self.n_col, self.cote * self.n_row
-            self.can.configure(width=wide, height=high)
-            n = 0
-            x1 = self.cote * col + 3
-            x2 = self.cote * (col + 1) - 3
-            while n < self.n_row and self.state[n][col] == 2:
-                y1 = n * self.cote + 3
-                y2 = (n + 1) * self.cote - 3
-                color = ["red", "yellow"][self.player]
-                self.can.create_oval(x1, y1 - self.cote, x2, y2 - self.cote,
-                                     outline="grey", width=1, fill="white")
-                self.update()
-                self.can.create_oval(x1, y1, x2, y2, outline="grey",
-                                     width=1, fill=color)
-                self.update()
-                self.can.after(100)
-                n += 1
-
-            if 1 <= n <= self.n_row:
-                self.state[n - 1][col] = self.player
-                self.history.append([n-1, col, self.player])
-                self.coup += 1
-                if not self.display_victory():
-                    try:
-                        self.game[self.coup] = self.state.copy()
-                    except IndexError:
-                        self.game.append(self.state.copy())
-                    self.player += 1
-                    self.player %= 2
-                    # self.can_bis.destroy()
-                    # self.can_bis = Label(text=["Red", "Yellow"][self.player]+\
-                    # "'s\n turn", font="Helvetica 15 bold")
-                    self.can_bis.itemconfig(
-                        self.turn,
-                        text=f"{['Red', 'Yellow'][self.player]}'s\n turn")
-                    self.can_bis.itemconfig(
-                        self.turn_bis, fill=["red", "yellow"][self.player])
-
-                    # print("hello")
-                    self.can_bis.pack(side=tkinter.RIGHT)
-                    self.can_bis.update()
-                    self.trace_grille()
+            self.play(col)
+
+    def play(self, col):
+        """Drop of a pawn of the current player in the column `col`
+
+        The pawn falls one row every DROP_DELAY ms, without blocking the
+        events, and the move is made when it lands."""
+        if self.win or self.falling is not None:
+            return
+        if 0 <= col < self.n_col and self.state[0][col] == 2:
+            self.falling = self.can.create_oval(
+                self.pawn_coords(0, col), outline="grey", width=1,
+                fill=["red", "yellow"][self.player])
+            self.drop_job = self.after(DROP_DELAY, self.drop_step, col, 0)
+
+    def drop_step(self, col, n):
+        """Moves the falling pawn from the row n to the next one"""
+        if n + 1 < self.n_row and self.state[n + 1][col] == 2:
+            self.can.coords(self.falling, self.pawn_coords(n + 1, col))
+            self.drop_job = self.after(DROP_DELAY, self.drop_step,
+                                       col, n + 1)
+        else:
+            self.cancel_drop()
+            self.land(col, n)
+
+    def cancel_drop(self):
+        """Stops the drop animation, if any"""
+        if self.drop_job is not None:
+            self.after_cancel(self.drop_job)
+            self.drop_job = None
+        if self.falling is not None:
+            self.can.delete(self.falling)
+            self.falling = None
+
+    def land(self, col, n):
+        """The pawn of the current player lands in the row n of `col`"""
+        move = Move(col, self.n_row - 1 - n, self.player + 1)
+        self.put_move(move)
+        self.history.push(move)
+        if not self.display_victory(n, col):
+            self.player += 1
+            self.player %= 2
+            self.trace_turn()
+            if self.player in self.ai_players:
+                # the search goes on if the engine expected this move :
+                self.ai_job = self.worker.ponder_hit(col)
+                if self.ai_job is None:
+                    self.ai_play()
                 else:
-                    self.can_bis.itemconfig(
-                        self.turn,
-                        text=f"{['Red', 'Yellow'][self.player]}\n wins !!")
-                    self.can_bis.delete(self.turn_bis)
-                    try:
-                        self.game[self.coup] = self.state.copy()
-                    except IndexError:
-                        self.game.append(self.state.copy())
-                    self.player += 1
-                    self.player %= 2
-
-    def undo(self, event=None):
-        if self.coup > 0:
-            self.coup -= 1
+                    self.ai_request = (self.grid.nb_moves, self.player)
+                    self.poll_engine()
+            elif move.id_player - 1 in self.ai_players:
+                self.worker.ponder(self.grid, self.player + 1)
+        else:
+            self.can_bis.itemconfig(
+                self.turn,
+                text=f"{['Red', 'Yellow'][self.player]}\n wins !!")
+            self.can_bis.itemconfig(self.turn_bis, state=tkinter.HIDDEN)
             self.player += 1
             self.player %= 2
-            self.init_jeu(self.game[self.coup].copy())
+
+    def ai_play(self):
+        """The engine starts to search the move of the current player"""
+        self.ai_job = self.worker.think(self.grid, self.player + 1)
+        self.ai_request = (self.grid.nb_moves, self.player)
+        if self.poll_job is None:
+            self.poll_engine()
+
+    def ai_resume(self):
+        """Asks the engine again for the move of the current player, if it
+        plays it and no pawn is falling (`land` asks once it lands)"""
+        if self.player in self.ai_players and self.falling is None \
+                and not self.win and not self.grid.is_full():
+            self.ai_play()
+
+    def poll_engine(self):
+        """Handles the messages of the engine, until its move is played"""
+        self.poll_job = None
+        while not self.worker.messages.empty():
+            message = self.worker.messages.get()
+            if message.job is not self.ai_job:
+                continue
+            if message.kind == "info":
+                self.show_hint(message.result.best_move)
+            else:
+                self.ai_job = None
+                self.show_hint(None)
+                if INSTRUMENT.enabled:
+                    INSTRUMENT.search(self.engine, message.result)
+                if self.ai_request != (self.grid.nb_moves, self.player) \
+                        or self.player not in self.ai_players \
+                        or self.falling is not None:
+                    # the move of another position, or of a player the
+                    # engine gave back : it is not played
+                    self.ai_resume()
+                elif message.result.best_move is not None:
+                    self.play(message.result.best_move)
+        # (a search asked again above may poll already)
+        if self.ai_job is not None and self.poll_job is None:
+            self.poll_job = self.after(POLL_DELAY, self.poll_engine)
+
+    def stop_ai(self):
+        """Cancels the search of the engine, if any"""
+        self.worker.cancel()
+        self.ai_job = None
+        self.ai_request = None
+        if self.poll_job is not None:
+            self.after_cancel(self.poll_job)
+            self.poll_job = None
+        self.show_hint(None)
+
+    def show_hint(self, col):
+        """Points at the best move found so far by the engine (hides the
+        arrow if `col` is None)"""
+        if col is None:
+            if self.hint is not None:
+                self.can.itemconfig(self.hint, state=tkinter.HIDDEN)
+            return
+        x = (col + .5) * self.cote
+        coords = (x, 0, x, self.cote / 2)
+        if self.hint is None:
+            self.hint = self.can.create_line(coords, arrow=tkinter.LAST,
+                                             width=3, fill="grey")
+        else:
+            self.can.coords(self.hint, coords)
+            self.can.itemconfig(self.hint, state=tkinter.NORMAL)
+        self.can.tag_raise(self.hint)
+
+    def toggle_ai(self, player):
+        """The engine takes (or gives back) the pawns of `player`"""
+        if player in self.ai_players:
+            self.ai_players.remove(player)
+            self.stop_ai()
+            # the search of the other player, if any, was cancelled too :
+            self.ai_resume()
+        else:
+            self.ai_players.add(player)
+            if player == self.player and self.ai_job is None:
+                self.ai_resume()
+
+    def put_move(self, move):
+        """Puts the pawn of `move` on the grid, and draws it"""
+        l = self.n_row - 1 - move.row
+        self.state[l][move.col] = move.id_player - 1
+        self.grid.drop_piece(move.col, move.id_player)
+        self.threats.play(move.col, move.row, move.id_player)
+        self.paint_pawn(l, move.col)
+        self.draw_threats()
+
+    def remove_move(self, move):
+        """Removes the pawn of `move` from the grid, and erases it"""
+        l = self.n_row - 1 - move.row
+        self.state[l][move.col] = 2
+        self.grid.undo_piece(move.col)
+        self.threats.undo(move.col, move.row, move.id_player)
+        self.paint_pawn(l, move.col)
+        self.draw_threats()
+
+    def clear_victory(self):
+        """Gives back their colors to the pawns of the alignments"""
+        for grid_row, c in self.winning_cells:
+            l = self.n_row - 1 - grid_row
+            self.state[l][c] = self.grid.cell(grid_row, c) - 1
+            self.paint_pawn(l, c)
+        self.winning_cells = []
+        self.win = False
+
+    def undo(self, event=None):
+        self.cancel_drop()
+        self.stop_ai()
+        move = self.history.undo()
+        if move is not None:
+            self.take_back(move)
         if event:
             pass
 
+    def redo(self, event=None):
+        self.cancel_drop()
+        self.stop_ai()
+        if self.win:
+            return
+        move = self.history.redo()
+        if move is not None:
+            self.play_again(move)
+        if event:
+            pass
+
+    def goto(self, ply):
+        """Goes to the move `ply` of the current variation"""
+        self.cancel_drop()
+        self.stop_ai()
+        if self.win:
+            # nothing is played after a victory
+            ply = min(ply, self.history.ply)
+        for move, forward in self.history.jump(ply):
+            if forward:
+                self.play_again(move)
+            else:
+                self.take_back(move)
+
+    def take_back(self, move):
+        """Removes `move`, the last one of the grid, whose player is to
+        play again"""
+        self.clear_victory()
+        self.remove_move(move)
+        self.player = move.id_player - 1
+        self.trace_turn()
+
+    def play_again(self, move):
+        """Puts `move` back on the grid, and shows its alignments"""
+        self.put_move(move)
+        self.player = move.id_player - 1
+        if not self.display_victory(self.n_row - 1 - move.row, move.col):
+            self.player = move.id_player % 2
+            self.trace_turn()
+        else:
+            self.can_bis.itemconfig(
+                self.turn,
+                text=f"{['Red', 'Yellow'][self.player]}\n wins !!")
+            self.can_bis.itemconfig(self.turn_bis, state=tkinter.HIDDEN)
+            self.player = move.id_player % 2
+
     def reset(self, event=None):
         """  french!  """
         self.init_jeu()
-        self.coup = 0
-        self.trace_grille()
         if event:
             pass
 
     def victory_threaten(self):
-        # Todo : threaten.... ??
-        orientation = [[0, 1], [1, 0], [1, 1], [-1, 1]]
-        color = self.player
-        all_alignments = []
-        for x in range(self.n_row):
-            for y in range(self.n_col):
-                if self.state[x][y] != color:
-                    continue
-                for sens in orientation:
-                    x2, y2 = x, y
-                    victory = True
-                    alignment = [[x, y]]
-                    for _ in range(3):
-                        x2 += sens[0]
-                        y2 += sens[1]
-                        alignment.append([x2, y2])
-                        try:
-                            if x2 < 0 or y2 < 0 or self.state[x2][y2] != color:
-                                victory = False
-                                break
-                        except IndexError:
-                            victory = False
-                            break
-
-                    if victory:
-                        # return alignment
-                        all_alignments.append(alignment)
-        return all_alignments
-
-    def display_victory(self):
-        all_alignment = self.victory_threaten()
-        if not all_alignment:
+        """Alignments of the current player, as lists of [row, col], and
+        the cells [row, col] where a pawn would make one"""
+        alignments = [[[self.n_row - 1 - r, c] for r, c in alignment]
+                      for alignment in self.grid.winning_alignments(
+                          self.player + 1, self.nb_in_a_row)]
+        threatened = [[self.n_row - 1 - r, c]
+                      for r, c in self.threats.cells(self.player + 1)]
+        return alignments, threatened
+
+    def toggle_threats(self, event=None):
+        """Shows (or hides) the threats of both players"""
+        self.show_threats = not self.show_threats
+        self.draw_threats()
+
+    def draw_threats(self):
+        """Rings the cells completing an alignment, in the color of the
+        player : thick ones can be played at once"""
+        for item in self.threat_items:
+            self.can.delete(item)
+        self.threat_items = []
+        if not self.show_threats or self.win:
+            return
+        for id_player in (1, 2):
+            for r, c in self.threats.cells(id_player):
+                x1, y1, x2, y2 = self.pawn_coords(self.n_row - 1 - r, c)
+                # the rings of the two players do not overlap
+                inset = self.cote / 8 * id_player
+                self.threat_items.append(self.can.create_oval(
+                    x1 + inset, y1 + inset, x2 - inset, y2 - inset,
+                    outline=self.COLORS[id_player - 1],
+                    width=3 if self.grid.heights[c] == r else 1))
+
+    def update_overlay(self):
+        """Shows the measures of `instrument` in the title of the window"""
+        self.winfo_toplevel().title(INSTRUMENT.overlay())
+        self.after(OVERLAY_DELAY, self.update_overlay)
+
+    @timed("check_win")
+    def check_win_at(self, row, col):
+        """Cells of the alignments made by the pawn put in (row, col)"""
+        # the rows of the grid are counted from the bottom :
+        return self.grid.check_win_at(self.n_row - 1 - row, col,
+                                      self.player + 1, self.nb_in_a_row)
+
+    def display_victory(self, row, col):
+        """Shows the alignments made by the pawn put in (row, col)"""
+        winning_cells = self.check_win_at(row, col)
+        if not winning_cells:
             return False
         else:
-            for alignment in all_alignment:
-                for pawn in alignment:
-                    self.state[pawn[0]][pawn[1]] = 3
-                self.trace_grille()
+            self.win = True
+            self.winning_cells = winning_cells
+            self.draw_threats()
+            for grid_row, c in winning_cells:
+                self.state[self.n_row - 1 - grid_row][c] = 3
+                self.paint_pawn(self.n_row - 1 - grid_row, c)
             return True
 
 
@@ -308,9 +559,15 @@ class PowerFourGUI(tkinter.Tk):
             ('File', [
                 ('Options', self.options),
                 ('Undo', self.jeu.undo),
+                ('Redo', self.jeu.redo),
                 ('Restart', self.jeu.reset),
                 ('Quit', self.quit)
             ]),
+            ('Computer', [
+                ('Plays Red', lambda: self.jeu.toggle_ai(0)),
+                ('Plays Yellow', lambda: self.jeu.toggle_ai(1)),
+                ('Show threats', self.jeu.toggle_threats)
+            ]),
             ('Help', [
                 ('Principle of the game', self.principle),
                 ('About...', self.about)
@@ -323,7 +580,9 @@ class PowerFourGUI(tkinter.Tk):
         self.jeu.pack(expand=tkinter.YES, fill=tkinter.BOTH, padx=8, pady=8)
 
         self.bind("<Command-z>", self.jeu.undo)
+        self.bind("<Command-y>", self.jeu.redo)
         self.bind("<Command-r>", self.jeu.reset)
+        self.bind("<Command-t>", self.jeu.toggle_threats)
 
     def options(self):
         """Choice of the number of lines and columns for the grid"""
@@ -349,14 +608,6 @@ class PowerFourGUI(tkinter.Tk):
         self.jeu.n_row = int(n)
         self.jeu.init_jeu()
 
-    # def redo(self):
-    #     if self.jeu.coup < len(self.jeu.game):
-    #         self.jeu.coup += 1
-    #         game = self.jeu.game[self.jeu.coup]
-    #         self.jeu.init_state()
-    #         self.jeu.state = game.copy()
-    #     self.jeu.trace_grille()
-
     def principle(self):
         """window-message containing
          the small description of the principle of this game"""
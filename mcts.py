@@ -0,0 +1,237 @@
+"""
+Monte Carlo tree search player of power four.
+
+UCT on the rules of `grid.Grid`, parallelised at the root: every worker
+of a process pool grows its own tree from the same position for the
+same wall-clock budget, and the visit counts of the root moves are
+summed to choose the move.
+"""
+
+import math
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from grid import Grid
+
+
+EXPLORATION = math.sqrt(2)
+MOVETIME = 1.  # seconds
+
+MCTSResult = namedtuple("MCTSResult", ["best_move", "visits", "wins",
+                                       "playouts", "elapsed",
+                                       "playouts_per_s"])
+
+
+def random_policy(grid: Grid, id_player: int, nb_in_a_row: int,
+                  rng: random.Random) -> int:
+    """Plays any valid column."""
+    return rng.choice([col for col in range(grid.nb_cols)
+                       if grid.is_valid_location(col)])
+
+
+def winning_policy(grid: Grid, id_player: int, nb_in_a_row: int,
+                   rng: random.Random) -> int:
+    """Plays a winning column if there is one, a random one otherwise."""
+    moves = [col for col in range(grid.nb_cols)
+             if grid.is_valid_location(col)]
+    for col in moves:
+        row = grid.drop_piece(col, id_player)
+        won = grid.check_win_at(row, col, id_player, nb_in_a_row)
+        grid.undo_piece(col)
+        if won:
+            return col
+    return rng.choice(moves)
+
+
+POLICIES = {"random": random_policy, "winning": winning_policy}
+
+
+class Node:
+    """Node of the tree, for the position after `move` of `id_player`"""
+
+    __slots__ = ("move", "id_player", "parent", "children", "untried",
+                 "winner", "visits", "wins")
+
+    def __init__(self, move, id_player, parent, untried, winner=None):
+        self.move = move
+        self.id_player = id_player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        # for the end of a game, its winner (0 for a draw)
+        self.winner = winner
+        self.visits = 0
+        # wins of `id_player`, a draw counting for half
+        self.wins = 0.
+
+    def select(self, exploration: float) -> "Node":
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTS:
+    """UCT search on a `Grid`, for two players"""
+
+    def __init__(self, nb_in_a_row: int = 4,
+                 exploration: float = EXPLORATION, policy="random",
+                 seed=None):
+        self.nb_in_a_row = nb_in_a_row
+        self.exploration = exploration
+        self.policy = POLICIES[policy] if isinstance(policy, str) \
+            else policy
+        self.rng = random.Random(seed)
+
+    def valid_moves(self, grid: Grid) -> list:
+        return [col for col in range(grid.nb_cols)
+                if grid.is_valid_location(col)]
+
+    def playout(self, grid: Grid, id_player: int):
+        """Plays randomly to the end, `id_player` to move.
+
+        Returns the winner, 0 for a draw. The grid is left as it was."""
+        played = []
+        winner = 0
+        while not grid.is_full():
+            col = self.policy(grid, id_player, self.nb_in_a_row, self.rng)
+            row = grid.drop_piece(col, id_player)
+            played.append(col)
+            if grid.check_win_at(row, col, id_player, self.nb_in_a_row):
+                winner = id_player
+                break
+            id_player = id_player % 2 + 1
+        for col in reversed(played):
+            grid.undo_piece(col)
+        return winner
+
+    def search(self, grid: Grid, id_player: int,
+               movetime: float = MOVETIME, max_playouts: int = None):
+        """Grows a tree from the grid, `id_player` to move.
+
+        Returns the root, whose children hold the visits and wins of
+        each move, and the number of playouts."""
+        grid = grid.copy()
+        other = id_player % 2 + 1
+        root = Node(None, other, None, self.valid_moves(grid))
+        deadline = time.perf_counter() + movetime
+        nb_playouts = 0
+        while (root.untried or root.children) \
+                and time.perf_counter() < deadline \
+                and (max_playouts is None or nb_playouts < max_playouts):
+            node, played, winner = root, [], None
+            # selection
+            while not node.untried and node.children:
+                node = node.select(self.exploration)
+                grid.drop_piece(node.move, node.id_player)
+                played.append(node.move)
+            # expansion
+            if node.untried:
+                col = node.untried.pop(
+                    self.rng.randrange(len(node.untried)))
+                id_moving = node.id_player % 2 + 1
+                row = grid.drop_piece(col, id_moving)
+                played.append(col)
+                if grid.check_win_at(row, col, id_moving,
+                                     self.nb_in_a_row):
+                    winner, untried = id_moving, []
+                elif grid.is_full():
+                    winner, untried = 0, []
+                else:
+                    untried = self.valid_moves(grid)
+                child = Node(col, id_moving, node, untried, winner)
+                node.children.append(child)
+                node = child
+            else:
+                winner = node.winner
+            # simulation
+            if winner is None:
+                winner = self.playout(grid, node.id_player % 2 + 1)
+            # back-propagation
+            while node is not None:
+                node.visits += 1
+                if winner == node.id_player:
+                    node.wins += 1.
+                elif not winner:
+                    node.wins += .5
+                node = node.parent
+            for col in reversed(played):
+                grid.undo_piece(col)
+            nb_playouts += 1
+        return root, nb_playouts
+
+
+def worker_search(grid: Grid, id_player: int, nb_in_a_row: int,
+                  exploration: float, policy, movetime: float,
+                  seed) -> tuple:
+    """Searches in a worker process, and returns the statistics of the
+    root moves."""
+    start = time.perf_counter()
+    mcts = MCTS(nb_in_a_row, exploration, policy, seed)
+    root, nb_playouts = mcts.search(grid, id_player, movetime)
+    elapsed = time.perf_counter() - start
+    stats = {child.move: (child.visits, child.wins)
+             for child in root.children}
+    return stats, nb_playouts, elapsed
+
+
+class MCTSPlayer:
+    """MCTS player, running one tree per worker process"""
+
+    def __init__(self, nb_in_a_row: int = 4,
+                 exploration: float = EXPLORATION, policy="random",
+                 movetime: float = MOVETIME, nb_workers: int = None):
+        self.nb_in_a_row = nb_in_a_row
+        self.exploration = exploration
+        self.policy = policy
+        self.movetime = movetime
+        self.nb_workers = nb_workers or os.cpu_count()
+        self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.nb_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, grid: Grid, id_player: int,
+               movetime: float = None) -> MCTSResult:
+        """Searches the grid, `id_player` to move, during `movetime`
+        seconds on every worker."""
+        movetime = self.movetime if movetime is None else movetime
+        start = time.perf_counter()
+        seeds = [random.getrandbits(32) for _ in range(self.nb_workers)]
+        futures = [self.pool.submit(worker_search, grid, id_player,
+                                    self.nb_in_a_row,
+                                    self.exploration, self.policy,
+                                    movetime, seed)
+                   for seed in seeds]
+        visits, wins = {}, {}
+        playouts, rates = 0, []
+        for future in futures:
+            stats, nb_playouts, elapsed = future.result()
+            for move, (v, w) in stats.items():
+                visits[move] = visits.get(move, 0) + v
+                wins[move] = wins.get(move, 0.) + w
+            playouts += nb_playouts
+            rates.append(nb_playouts / elapsed if elapsed else 0.)
+        best_move = max(visits, key=visits.get) if visits else None
+        return MCTSResult(best_move, visits, wins, playouts,
+                          time.perf_counter() - start, rates)
+
+    def best_move(self, grid: Grid, id_player: int) -> int:
+        return self.search(grid, id_player).best_move
@@ -0,0 +1,148 @@
+"""
+Compact records of finished games of power four.
+
+An archive is a small file header followed by games, each one being a
+header (size of the grid, number in a row, result, players) and one
+byte per move, the column played. Archives are written and read as
+streams, one game at a time.
+"""
+
+import re
+import struct
+from collections import namedtuple
+
+
+MAGIC = b"P4GR"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sB")
+# rows, cols, number in a row, result, number of players, of moves
+GAME_HEADER = struct.Struct("<BBBBBH")
+NAME_LENGTH = struct.Struct("<B")
+
+DRAW = 0
+UNFINISHED = 0xFF
+
+GameRecord = namedtuple("GameRecord", ["nb_rows", "nb_cols", "nb_in_a_row",
+                                       "players", "result", "moves"])
+GameRecord.__doc__ = """Finished game: `players` holds the names of the
+players in the order they play, `result` the id (from 1) of the winner,
+DRAW or UNFINISHED, and `moves` the columns played, as bytes."""
+
+
+class RecordFormatError(Exception):
+    """Custom error raised when a file is not a valid archive."""
+
+
+def format_moves(moves) -> str:
+    """Writes columns as 1-based columns (e.g. 4453), the ones above 9
+    between brackets."""
+    return "".join(str(col + 1) if col < 9 else f"({col + 1})"
+                   for col in moves)
+
+
+def parse_moves(text: str) -> list:
+    """Reads the columns written by `format_moves`."""
+    if not re.fullmatch(r"(?:\d|\(\d+\))*", text):
+        raise ValueError(f"invalid moves {text!r}")
+    return [int(number or digit) - 1
+            for number, digit in re.findall(r"\((\d+)\)|(\d)", text)]
+
+
+def canonical_moves(moves, nb_cols: int) -> bytes:
+    """The moves or their mirror (columns reversed), whichever is
+    smaller: a game and its mirror have the same canonical moves."""
+    moves = bytes(moves)
+    return min(moves, bytes(nb_cols - 1 - col for col in moves))
+
+
+def opening(record: GameRecord, nb_plies: int = 4,
+            canonical: bool = False) -> str:
+    """Gives the first moves of the game, as 1-based columns (e.g. 4453),
+    or their canonical form."""
+    moves = record.moves[:nb_plies]
+    if canonical:
+        moves = canonical_moves(moves, record.nb_cols)
+    return format_moves(moves)
+
+
+class RecordWriter:
+    """Writes games one by one at the end of an archive"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, record: GameRecord) -> int:
+        """Appends a game, and returns its offset in the archive."""
+        offset = self._file.tell()
+        names = [name.encode("utf-8")[:0xFF] for name in record.players]
+        self._file.write(GAME_HEADER.pack(record.nb_rows, record.nb_cols,
+                                          record.nb_in_a_row, record.result,
+                                          len(names), len(record.moves)))
+        for name in names:
+            self._file.write(NAME_LENGTH.pack(len(name)))
+            self._file.write(name)
+        self._file.write(bytes(record.moves))
+        return offset
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_exactly(file, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise RecordFormatError(f"{file.name} ends in the middle of a game.")
+    return data
+
+
+def read_game(file):
+    """Reads the game at the position of `file`, None at the end."""
+    header = file.read(GAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) != GAME_HEADER.size:
+        raise RecordFormatError(f"{file.name} ends in the middle of a game.")
+    nb_rows, nb_cols, nb_in_a_row, result, nb_players, nb_moves = \
+        GAME_HEADER.unpack(header)
+    players = []
+    for _ in range(nb_players):
+        length, = NAME_LENGTH.unpack(read_exactly(file, NAME_LENGTH.size))
+        players.append(read_exactly(file, length).decode("utf-8"))
+    return GameRecord(nb_rows, nb_cols, nb_in_a_row, tuple(players), result,
+                      read_exactly(file, nb_moves))
+
+
+def read_records(path: str, with_offsets: bool = False):
+    """Yields the games of an archive, one at a time.
+
+    With `with_offsets`, yields (offset, game) instead."""
+    with open(path, "rb") as file:
+        header = file.read(FILE_HEADER.size)
+        if len(header) != FILE_HEADER.size \
+                or FILE_HEADER.unpack(header) != (MAGIC, VERSION):
+            raise RecordFormatError(f"{path} is not an archive of games.")
+        while True:
+            offset = file.tell()
+            record = read_game(file)
+            if record is None:
+                return
+            yield (offset, record) if with_offsets else record
+
+
+def read_record_at(path: str, offset: int) -> GameRecord:
+    """Reads the game at `offset` in an archive (see `stats`)."""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        record = read_game(file)
+    if record is None:
+        raise RecordFormatError(f"No game at {offset} in {path}.")
+    return record
@@ -0,0 +1,196 @@
+"""
+Offscreen replays of recorded games of power four.
+
+A game of an archive (see `records`) is drawn on a pygame surface,
+without any window: the first frame is the empty grid, then each frame
+only blits the disc of its move (and the waiting disc above its column)
+onto the previous frame, from the sprites of `draft.Sprites`, rendered
+once per colors and square size. The last frame rings the winning
+alignment. The frames are written as PNG files, one per frame, as one
+strip holding all of them (for an animation), or only the last one (for
+a thumbnail). Many games are rendered by a pool of processes, which
+only get the offsets of the games in the archive.
+
+Usage:
+    python replay.py games.p4gr out/ [--mode frames|strip|last]
+        [--games 0:1000] [--square-size 40] [--workers 8]
+"""
+
+import argparse
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# no window is ever opened, the surfaces are only saved
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+
+from grid import Grid  # noqa: E402
+from draft import Sprites, ColorSettings, COLOR_SETTINGS  # noqa: E402
+from records import (GameRecord, read_records, read_record_at,  # noqa: E402
+                     DRAW, UNFINISHED)
+
+
+SQUARE_SIZE = 40
+WIN_RING = (255, 255, 255)
+MODES = ("frames", "strip", "last")
+# games in flight per worker of the pool
+GAMES_PER_WORKER = 4
+
+# renderers of a worker process, by size of grid
+_renderers = {}
+
+
+class ReplayRenderer:
+    """Draws the frames of games of `nb_rows` x `nb_cols` on a surface"""
+
+    def __init__(self, nb_rows: int, nb_cols: int,
+                 square_size: int = SQUARE_SIZE,
+                 color_settings: ColorSettings = COLOR_SETTINGS):
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.square_size = square_size
+        self.colors = color_settings
+        self.sprites = Sprites.get(square_size, color_settings)
+        self.surface = pygame.Surface((nb_cols * square_size,
+                                       (nb_rows + 1) * square_size))
+        # the surface of the empty grid, copied at the start of each game
+        self._empty = self.surface.copy()
+        self._empty.fill(color_settings.background_color)
+        for row in range(nb_rows):
+            for col in range(nb_cols):
+                self._empty.blit(self.sprites.cell(0),
+                                 self.cell_position(row, col))
+
+    def cell_position(self, row: int, col: int) -> tuple:
+        """Top left corner of the cell (row, col), row 0 at the bottom."""
+        return col * self.square_size, (self.nb_rows - row) * self.square_size
+
+    def frames(self, record: GameRecord):
+        """Yields the surface once per frame of the game: the empty grid,
+        then once per move. The same surface is drawn again between two
+        frames."""
+        self.surface.blit(self._empty, (0, 0))
+        yield self.surface
+        grid = Grid(self.nb_rows, self.nb_cols)
+        waiting = pygame.Rect(0, 0, self.surface.get_width(),
+                              self.square_size)
+        for i, col in enumerate(record.moves):
+            id_player = i % 2 + 1
+            row = grid.drop_piece(col, id_player)
+            self.surface.fill(self.colors.background_color, waiting)
+            self.surface.blit(self.sprites.disc(id_player),
+                              (col * self.square_size, 0))
+            self.surface.blit(self.sprites.cell(id_player),
+                              self.cell_position(row, col))
+            if i == len(record.moves) - 1 \
+                    and record.result not in (DRAW, UNFINISHED):
+                for r, c in grid.check_win_at(row, col, id_player,
+                                              record.nb_in_a_row):
+                    self.surface.blit(
+                        self.sprites.cell(id_player, WIN_RING),
+                        self.cell_position(r, c))
+            yield self.surface
+
+    def render(self, record: GameRecord, path: str,
+               mode: str = "frames") -> list:
+        """Writes the frames of the game: `path`_000.png... (frames),
+        `path`.png with all the frames side by side (strip) or only the
+        last one (last). Returns the files written."""
+        if mode == "frames":
+            paths = []
+            for i, surface in enumerate(self.frames(record)):
+                paths.append(f"{path}_{i:03d}.png")
+                pygame.image.save(surface, paths[-1])
+            return paths
+        if mode == "strip":
+            width, height = self.surface.get_size()
+            strip = pygame.Surface((width * (len(record.moves) + 1),
+                                    height))
+            for i, surface in enumerate(self.frames(record)):
+                strip.blit(surface, (i * width, 0))
+            pygame.image.save(strip, f"{path}.png")
+        elif mode == "last":
+            for surface in self.frames(record):
+                pass
+            pygame.image.save(surface, f"{path}.png")
+        else:
+            raise ValueError(f"Unknown mode {mode}.")
+        return [f"{path}.png"]
+
+
+def render_game(archive: str, offset: int, path: str, mode: str,
+                square_size: int, color_settings: ColorSettings) -> list:
+    """Renders the game at `offset` in the archive (in a worker
+    process)."""
+    record = read_record_at(archive, offset)
+    key = (record.nb_rows, record.nb_cols, square_size,
+           tuple(color_settings.players_colors), color_settings.grid_color,
+           color_settings.background_color)
+    renderer = _renderers.get(key)
+    if renderer is None:
+        renderer = _renderers[key] = ReplayRenderer(
+            record.nb_rows, record.nb_cols, square_size, color_settings)
+    return renderer.render(record, path, mode)
+
+
+def render_archive(archive: str, directory: str, mode: str = "frames",
+                   games: slice = slice(None), square_size: int = SQUARE_SIZE,
+                   color_settings: ColorSettings = COLOR_SETTINGS,
+                   nb_workers: int = None):
+    """Renders the games of an archive (the ones of the slice `games`)
+    in a pool of processes, and yields the files written for each game,
+    in the order of the archive."""
+    os.makedirs(directory, exist_ok=True)
+    nb_workers = nb_workers or os.cpu_count() or 1
+    offsets = ((i, offset) for i, (offset, _) in enumerate(itertools.islice(
+        read_records(archive, with_offsets=True), games.start, games.stop),
+        games.start or 0))
+    with ProcessPoolExecutor(nb_workers) as pool:
+        pending = deque()
+        for i, offset in offsets:
+            pending.append(pool.submit(
+                render_game, archive, offset,
+                os.path.join(directory, f"game{i:06d}"), mode, square_size,
+                color_settings))
+            if len(pending) >= nb_workers * GAMES_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_games(text: str) -> slice:
+    """Slice of games written start:stop (or a single index)."""
+    if ":" not in text:
+        return slice(int(text), int(text) + 1)
+    start, stop = (int(value) if value else None
+                   for value in text.split(":", 1))
+    return slice(start, stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders recorded games"
+                                                 " of power four to PNG.")
+    parser.add_argument("archive")
+    parser.add_argument("directory")
+    parser.add_argument("--mode", choices=MODES, default="frames")
+    parser.add_argument("--games", type=parse_games, default=slice(None),
+                        help="games of the archive, e.g. 0:1000")
+    parser.add_argument("--square-size", type=int, default=SQUARE_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    nb_games = nb_files = 0
+    for paths in render_archive(args.archive, args.directory, args.mode,
+                                args.games, args.square_size,
+                                nb_workers=args.workers):
+        nb_games += 1
+        nb_files += len(paths)
+    print(f"{nb_games} games rendered to {nb_files} files"
+          f" in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
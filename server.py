@@ -0,0 +1,339 @@
+"""
+Game server of power four.
+
+One asyncio process hosts the matches of many clients, each one on the
+rules of `grid.Grid` with its own size and number in a row. Clients send
+one command per line, and receive one message per line:
+
+    hello <name>                       -> welcome <name>
+    seek [<rows> <cols> <k>] [<clock>] waits for an opponent of the same
+                                       size and clock (seconds)
+    engine [<rows> <cols> <k>] [<clock>] [<movetime ms>]
+                                       plays against the engine
+    move <col>                         plays in a column, from 1
+    resign
+    quit
+
+    start <match> <seat> <rows> <cols> <k> <clock ms> <opponent>
+    moved <col> <seat> <clock 1 ms> <clock 2 ms>
+    end <winner seat or 0> <alignment|full|time|resign|disconnect>
+    error <message>
+
+Each player has a clock, running during its turns only: the match is lost
+when it falls to 0. The engines search in a bounded pool of processes,
+so that the event loop never waits for them.
+
+Usage: python server.py --port 4444 --workers 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from grid import Grid, InvalidMoveError
+from engine import Engine
+
+
+PORT = 4444
+CLOCK = 300.  # seconds per player and match
+MOVETIME = 50  # ms of search of the engine per move
+MAX_PENDING = 4  # searches waiting per worker of the pool
+
+# engines of a worker process, by number in a row
+_engines = {}
+
+
+def engine_move(grid: Grid, id_player: int, nb_in_a_row: int,
+                movetime: float):
+    """Column played by the engine (in a worker process)."""
+    engine = _engines.get(nb_in_a_row)
+    if engine is None:
+        engine = _engines[nb_in_a_row] = Engine(nb_in_a_row, tt_size_mb=4)
+    return engine.search(grid, id_player, movetime=movetime).best_move
+
+
+class Session:
+    """Client connected to the server"""
+
+    def __init__(self, server: "GameServer", send):
+        self.server = server
+        # writes a line to the client
+        self.send = send
+        self.name = f"guest{next(server.ids)}"
+        self.match = None
+        self.seat = None
+        self.seeking = None
+
+    def handle(self, line: str) -> bool:
+        """Executes a command, returns False on `quit`."""
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "quit":
+            return False
+        handler = getattr(self, f"cmd_{command}", None)
+        if handler is None:
+            self.send(f"error unknown command {command}")
+            return True
+        try:
+            handler(args)
+        except (ValueError, IndexError, InvalidMoveError) as error:
+            self.send(f"error {error}")
+        return True
+
+    @staticmethod
+    def parse_setup(args, nb_extra: int = 1) -> tuple:
+        """Gives (rows, cols, k) and the other numbers of the command."""
+        numbers = list(map(float, args))
+        for number in numbers:
+            if not math.isfinite(number) or number < 0:
+                raise ValueError(f"invalid number {number}")
+        if len(numbers) >= 3:
+            setup = tuple(map(int, numbers[:3]))
+            numbers = numbers[3:]
+        else:
+            setup = (6, 7, 4)
+        if not (1 <= setup[2] <= max(setup[:2]) and setup[0] * setup[1]
+                <= 255 and min(setup) > 0):
+            raise ValueError(f"invalid size {setup}")
+        return setup, (numbers + [None] * nb_extra)[:nb_extra]
+
+    def cmd_hello(self, args):
+        self.name = args[0]
+        self.send(f"welcome {self.name}")
+
+    def cmd_seek(self, args):
+        if self.match is not None or self.seeking is not None:
+            raise ValueError("already playing or seeking")
+        setup, (clock,) = self.parse_setup(args)
+        self.server.seek(self, setup, CLOCK if clock is None else clock)
+
+    def cmd_engine(self, args):
+        if self.match is not None or self.seeking is not None:
+            raise ValueError("already playing or seeking")
+        setup, (clock, movetime) = self.parse_setup(args, 2)
+        self.server.start_match(
+            [self, None], setup, CLOCK if clock is None else clock,
+            MOVETIME if movetime is None else movetime)
+
+    def cmd_move(self, args):
+        if self.match is None:
+            raise ValueError("not playing")
+        self.match.move(self.seat, int(args[0]) - 1)
+
+    def cmd_resign(self, args):
+        if self.match is None:
+            raise ValueError("not playing")
+        self.match.finish(3 - self.seat, "resign")
+
+    def disconnect(self):
+        if self.seeking is not None:
+            self.server.queues[self.seeking].remove(self)
+            self.seeking = None
+        if self.match is not None:
+            self.match.finish(3 - self.seat, "disconnect")
+
+
+class Match:
+    """Match between two seats, a session or the engine (None) each"""
+
+    def __init__(self, server: "GameServer", id_match: int, players: list,
+                 setup: tuple, clock: float, movetime: float = MOVETIME):
+        self.server = server
+        self.id = id_match
+        self.players = players
+        nb_rows, nb_cols, self.nb_in_a_row = setup
+        self.grid = Grid(nb_rows, nb_cols)
+        self.clocks = [clock, clock]
+        self.movetime = movetime
+        self.turn_start = time.monotonic()
+        self.timer = None
+        self.over = False
+
+    @property
+    def seat(self) -> int:
+        """Seat to move"""
+        return self.grid.nb_moves % 2 + 1
+
+    def broadcast(self, line: str):
+        for player in self.players:
+            if player is not None:
+                player.send(line)
+
+    def start(self):
+        names = [player.name if player is not None else "engine"
+                 for player in self.players]
+        for seat, player in enumerate(self.players, 1):
+            if player is not None:
+                player.match, player.seat = self, seat
+                player.send(f"start {self.id} {seat} {self.grid.nb_rows}"
+                            f" {self.grid.nb_cols} {self.nb_in_a_row}"
+                            f" {self.clocks[0] * 1000:.0f} {names[2 - seat]}")
+        self.next_turn()
+
+    def next_turn(self):
+        self.turn_start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        self.timer = loop.call_later(self.clocks[self.seat - 1],
+                                     self.time_out, self.grid.nb_moves)
+        if self.players[self.seat - 1] is None:
+            self.server.engine_turn(self)
+
+    def time_out(self, nb_moves: int):
+        if not self.over and self.grid.nb_moves == nb_moves:
+            self.clocks[self.seat - 1] = 0.
+            self.finish(3 - self.seat, "time")
+
+    def move(self, seat: int, col: int):
+        if self.over:
+            raise ValueError("the match is over")
+        if seat != self.seat:
+            raise ValueError("not your turn")
+        if not 0 <= col < self.grid.nb_cols:
+            raise ValueError(f"no column {col + 1}")
+        self.grid.drop_piece(col, seat)
+        self.timer.cancel()
+        self.clocks[seat - 1] -= time.monotonic() - self.turn_start
+        self.server.nb_moves += 1
+        self.broadcast(f"moved {col + 1} {seat} {self.clocks[0] * 1000:.0f}"
+                       f" {self.clocks[1] * 1000:.0f}")
+        if self.clocks[seat - 1] <= 0:
+            self.finish(3 - seat, "time")
+        elif self.grid.winning_move(seat, self.nb_in_a_row):
+            self.finish(seat, "alignment")
+        elif self.grid.is_full():
+            self.finish(0, "full")
+        else:
+            self.next_turn()
+
+    def finish(self, winner: int, reason: str):
+        if self.over:
+            return
+        self.over = True
+        if self.timer is not None:
+            self.timer.cancel()
+        self.broadcast(f"end {winner} {reason}")
+        for player in self.players:
+            if player is not None:
+                player.match = player.seat = None
+        self.server.matches.pop(self.id, None)
+
+
+class GameServer:
+    """Matchmaking and matches of the connected clients"""
+
+    def __init__(self, nb_workers: int = None):
+        self.ids = itertools.count(1)
+        self.match_ids = itertools.count(1)
+        # sessions waiting for an opponent, by (size, number, clock)
+        self.queues = {}
+        self.matches = {}
+        self.nb_moves = 0
+        self.nb_workers = nb_workers or os.cpu_count() or 1
+        self._executor = None
+        self._searches = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Pool of the engines, started by the first search."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.nb_workers)
+            self._searches = asyncio.Semaphore(self.nb_workers * MAX_PENDING)
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def seek(self, session: Session, setup: tuple, clock: float):
+        key = (setup, clock)
+        queue = self.queues.setdefault(key, deque())
+        if queue:
+            opponent = queue.popleft()
+            opponent.seeking = None
+            self.start_match([opponent, session], setup, clock)
+        else:
+            queue.append(session)
+            session.seeking = key
+
+    def start_match(self, players: list, setup: tuple, clock: float,
+                    movetime: float = MOVETIME) -> Match:
+        match = Match(self, next(self.match_ids), players, setup, clock,
+                      movetime)
+        self.matches[match.id] = match
+        match.start()
+        return match
+
+    def engine_turn(self, match: Match):
+        asyncio.get_running_loop().create_task(self.engine_play(match))
+
+    async def engine_play(self, match: Match):
+        """Plays the move of the engine, searched in the pool."""
+        nb_moves = match.grid.nb_moves
+        executor = self.executor
+        async with self._searches:
+            if match.over or match.grid.nb_moves != nb_moves:
+                return
+            col = await asyncio.get_running_loop().run_in_executor(
+                executor, engine_move, match.grid, match.seat,
+                match.nb_in_a_row, match.movetime / 1000)
+        if not match.over and match.grid.nb_moves == nb_moves \
+                and col is not None:
+            match.move(match.seat, col)
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        session = Session(self, lambda line: writer.write(
+            line.encode() + b"\n"))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # longer than the limit of the stream, and dropped
+                    session.send("error line too long")
+                    await writer.drain()
+                    continue
+                if not line or not session.handle(
+                        line.decode(errors="replace")):
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            session.disconnect()
+            writer.close()
+
+    async def serve(self, host: str = "localhost", port: int = PORT):
+        server = await asyncio.start_server(self.handle_connection, host,
+                                            port, limit=2 ** 12,
+                                            backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game server of"
+                                                 " power four.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes of the engines")
+    args = parser.parse_args()
+    server = GameServer(args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
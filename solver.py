@@ -0,0 +1,322 @@
+"""
+Exact solver of power four.
+
+The positions are proved by negamax on the bitboards of `grid.Grid`:
+null-window searches narrow the score down, moves letting the opponent
+win at once are never tried, the others are ordered by the number of
+alignments they threaten, and the results are kept in a transposition
+table keyed by the position or its mirror, whichever is smaller. An
+endgame tablebase (see `tablebase`) answers for the positions it holds.
+
+A score counts the moves left to the winner when it wins: a position
+won by the player to move with their last piece scores 1, with one
+piece to spare 2, etc., a lost one scores the opposite, a draw 0.
+
+Usage: python solver.py 4453 [--rows 6 --cols 7 --nb-in-a-row 4]
+"""
+
+import argparse
+import time
+from collections import namedtuple
+
+from grid import Grid
+from tt import TranspositionTable, LOWER, UPPER
+
+
+WIN, DRAW, LOSS = 1, 0, -1
+MASK64 = (1 << 64) - 1
+
+Solution = namedtuple("Solution", ["result", "score", "distance",
+                                   "best_move", "nodes", "elapsed"])
+Solution.__doc__ = """Proved result for the player to move: `result` is
+WIN, DRAW or LOSS, `distance` the number of plies to the end of the game
+with best play, `best_move` a column reaching it."""
+
+
+def mix64(key: int) -> int:
+    """Bijective mix of 64 bits keys (the finalizer of splitmix64), so
+    that keys differing in their high bits fall in different buckets."""
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & MASK64
+    return key ^ (key >> 31)
+
+
+class Solver:
+    """Solver for two players on a grid of `nb_rows` x `nb_cols`"""
+
+    def __init__(self, nb_rows: int = 6, nb_cols: int = 7,
+                 nb_in_a_row: int = 4, tt: TranspositionTable = None,
+                 tt_size_mb: float = 64, tablebase=None):
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.nb_in_a_row = nb_in_a_row
+        self.size = nb_rows * nb_cols
+        height = self.col_height = nb_rows + 1
+        self.bottom = sum(1 << (col * height) for col in range(nb_cols))
+        self.board_mask = self.bottom * ((1 << nb_rows) - 1)
+        self.col_mask = (1 << height) - 1
+        self.shifts = (1, height, height + 1, height - 1)
+        centre = (nb_cols - 1) / 2
+        self.order = sorted(range(nb_cols), key=lambda c: abs(c - centre))
+        self.col_masks = [((1 << nb_rows) - 1) << (col * height)
+                          for col in self.order]
+        self.tt = TranspositionTable(tt_size_mb) if tt is None else tt
+        # `tablebase.Tablebase` of the same grid, or None
+        self.tablebase = tablebase
+        self.nodes = 0
+
+    def winning_cells(self, position: int, mask: int) -> int:
+        """Empty cells (playable or not) completing an alignment of
+        `position`."""
+        k = self.nb_in_a_row
+        cells = 0
+        for shift in self.shifts:
+            # runs[a]: cells with `a` pieces of `position` on one side
+            lower = upper = -1
+            lowers, uppers = [-1], [-1]
+            for a in range(1, k):
+                lower &= position << (a * shift)
+                upper &= position >> (a * shift)
+                lowers.append(lower)
+                uppers.append(upper)
+            for a in range(k):
+                cells |= lowers[a] & uppers[k - 1 - a]
+        return cells & (self.board_mask ^ mask)
+
+    def possible(self, mask: int) -> int:
+        return (mask + self.bottom) & self.board_mask
+
+    def mirror(self, key: int) -> int:
+        """Key of the position seen in a mirror (columns reversed)."""
+        height, col_mask, last = self.col_height, self.col_mask, \
+            self.nb_cols - 1
+        return sum(((key >> (col * height)) & col_mask)
+                   << ((last - col) * height)
+                   for col in range(self.nb_cols))
+
+    def key(self, current: int, mask: int) -> int:
+        """Key of the position, the same for its mirror. Each column
+        holds its pieces under the first bit above them, so that the
+        key is unique."""
+        key = current + mask
+        return min(key, self.mirror(key))
+
+    def tt_key(self, key: int) -> int:
+        if self.col_height * self.nb_cols >= 64:
+            # keys of big grids may collide once folded on 64 bits
+            key = (key ^ (key >> 64)) & MASK64
+        return mix64(key)
+
+    def win_score(self, nb_moves: int) -> int:
+        """Score of the player winning with the move `nb_moves` + 1."""
+        return (self.size + 1 - nb_moves) // 2
+
+    def non_losing_moves(self, current: int, mask: int) -> int:
+        """Moves not giving the opponent a win at once (0 if they all
+        do)."""
+        possible = self.possible(mask)
+        threats = self.winning_cells(current ^ mask, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                # two threats, one cannot stop both
+                return 0
+            possible = forced
+        # no move under a cell where the opponent wins
+        return possible & ~(threats >> 1)
+
+    def negamax(self, current: int, mask: int, nb_moves: int, alpha: int,
+                beta: int) -> int:
+        """Score of the player to move (owning `current`) if it is in
+        ]alpha, beta[, else a bound beyond it. The player to move cannot
+        win at once."""
+        self.nodes += 1
+        moves = self.non_losing_moves(current, mask)
+        if not moves:
+            return -((self.size - nb_moves) // 2)
+        if nb_moves >= self.size - 2:
+            return 0
+        lowest = -((self.size - 2 - nb_moves) // 2)
+        if alpha < lowest:
+            alpha = lowest
+            if alpha >= beta:
+                return alpha
+        highest = (self.size - 1 - nb_moves) // 2
+        if beta > highest:
+            beta = highest
+            if alpha >= beta:
+                return beta
+
+        key = self.key(current, mask)
+        if self.tablebase is not None:
+            result = self.tablebase.probe(key, current, mask, nb_moves)
+            if result == DRAW:
+                return 0
+            if result == WIN and alpha < 1:
+                alpha = 1
+                if alpha >= beta:
+                    return alpha
+            elif result == LOSS and beta > -1:
+                beta = -1
+                if alpha >= beta:
+                    return beta
+        tt_key = self.tt_key(key)
+        entry = self.tt.probe(tt_key)
+        if entry is not None:
+            score = entry[2]
+            if entry[1] == LOWER:
+                if score > alpha:
+                    alpha = score
+            elif score < beta:
+                beta = score
+            if alpha >= beta:
+                return score
+
+        # threatening moves first, then the central ones
+        ordered = []
+        for col_mask in self.col_masks:
+            move = moves & col_mask
+            if move:
+                nb_threats = bin(self.winning_cells(current | move,
+                                                    mask | move)).count("1")
+                i = len(ordered)
+                while i and ordered[i - 1][0] < nb_threats:
+                    i -= 1
+                ordered.insert(i, (nb_threats, move))
+
+        opponent = current ^ mask
+        for _, move in ordered:
+            score = -self.negamax(opponent, mask | move, nb_moves + 1,
+                                  -beta, -alpha)
+            if score >= beta:
+                self.tt.store(tt_key, 0, LOWER, score, None)
+                return score
+            if score > alpha:
+                alpha = score
+        self.tt.store(tt_key, 0, UPPER, alpha, None)
+        return alpha
+
+    def score(self, current: int, mask: int, nb_moves: int,
+              weak: bool = False) -> int:
+        """Exact score of the player to move, or only its sign if
+        `weak`."""
+        if self.winning_cells(current, mask) & self.possible(mask):
+            return self.win_score(nb_moves) if not weak else 1
+        lo = -((self.size - nb_moves) // 2)
+        hi = self.win_score(nb_moves)
+        if weak:
+            lo, hi = -1, 1
+        while lo < hi:
+            # null-window searches, first around 0 to find the sign
+            med = lo + (hi - lo) // 2
+            if med <= 0 and int(lo / 2) < med:
+                med = int(lo / 2)
+            elif med >= 0 and int(hi / 2) > med:
+                med = int(hi / 2)
+            result = self.negamax(current, mask, nb_moves, med, med + 1)
+            if result <= med:
+                hi = result
+            else:
+                lo = result
+        return lo
+
+    def distance(self, score: int, nb_moves: int) -> int:
+        """Plies to the end of the game for a score of the player to
+        move."""
+        if score == 0:
+            return self.size - nb_moves
+        # moves after which the winner plays its winning move
+        last = self.size + 1 - 2 * abs(score)
+        if (last - nb_moves) % 2 != (score < 0):
+            last -= 1
+        return last - nb_moves + 1
+
+    def best_move(self, current: int, mask: int, nb_moves: int,
+                  score: int):
+        """A column reaching `score`, None if the grid is full."""
+        possible = self.possible(mask)
+        winning = self.winning_cells(current, mask) & possible
+        fallback = None
+        for col, col_mask in zip(self.order, self.col_masks):
+            move = possible & col_mask
+            if not move:
+                continue
+            if fallback is None:
+                fallback = col
+            if winning & move:
+                return col
+            if nb_moves + 1 == self.size:
+                return col
+            # the score of the opponent after the move is at most -score
+            opponent = current ^ mask
+            if self.winning_cells(opponent, mask | move) \
+                    & self.possible(mask | move):
+                continue
+            if self.negamax(opponent, mask | move, nb_moves + 1, -score,
+                            -score + 1) <= -score:
+                return col
+        return fallback
+
+    def solve(self, grid: Grid, id_player: int,
+              weak: bool = False) -> Solution:
+        """Proves the result of the grid for `id_player`, to move.
+
+        With `weak`, only the result is proved, which is much faster;
+        the score and the distance are then those of a win, a draw or a
+        loss with the last pieces."""
+        if grid.nb_players != 2 or (grid.nb_rows, grid.nb_cols) \
+                != (self.nb_rows, self.nb_cols):
+            raise ValueError("The solver is not set up for this grid.")
+        start = time.perf_counter()
+        self.nodes = 0
+        current, mask, nb_moves = grid.masks[id_player], grid.masks[0], \
+            grid.nb_moves
+        if nb_moves == self.size:
+            return Solution(DRAW, 0, 0, None, 0, 0.)
+        score = self.score(current, mask, nb_moves, weak)
+        result = WIN if score > 0 else LOSS if score < 0 else DRAW
+        best_move = self.best_move(current, mask, nb_moves, score)
+        return Solution(result, score, self.distance(score, nb_moves),
+                        best_move, self.nodes,
+                        time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solves a position of"
+                                                 " power four.")
+    parser.add_argument("moves", nargs="?", default="",
+                        help="columns played from the empty grid, from 1")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    parser.add_argument("--weak", action="store_true",
+                        help="only win, draw or loss")
+    parser.add_argument("--tablebase", help="endgame tablebase file")
+    parser.add_argument("--tt-size-mb", type=float, default=64)
+    args = parser.parse_args()
+
+    grid = Grid(args.rows, args.cols)
+    id_player = 1
+    for char in args.moves:
+        row = grid.drop_piece(int(char) - 1, id_player)
+        if grid.check_win_at(row, int(char) - 1, id_player,
+                             args.nb_in_a_row):
+            parser.error(f"player {id_player} has already won.")
+        id_player = id_player % 2 + 1
+
+    tablebase = None
+    if args.tablebase:
+        from tablebase import Tablebase
+        tablebase = Tablebase(args.tablebase)
+    solver = Solver(args.rows, args.cols, args.nb_in_a_row,
+                    tt_size_mb=args.tt_size_mb, tablebase=tablebase)
+    solution = solver.solve(grid, id_player, args.weak)
+    result = {WIN: "win", DRAW: "draw", LOSS: "loss"}[solution.result]
+    best = "none" if solution.best_move is None else solution.best_move + 1
+    print(f"{result} score {solution.score} in {solution.distance} plies,"
+          f" best move {best}, {solution.nodes} nodes"
+          f" in {solution.elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
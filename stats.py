@@ -0,0 +1,165 @@
+"""
+Statistics of the players and of the openings, from archives of games.
+
+The games of the archives (see `records`) are indexed once in a local
+SQLite database, and the statistics are queried from the index instead
+of reading the games again. The openings are indexed in their canonical
+form (see `records.canonical_moves`), an opening and its mirror being
+counted together: indexes of an older version have to be rebuilt.
+"""
+
+import sqlite3
+from collections import namedtuple
+
+from records import read_records, opening, format_moves, parse_moves, \
+    canonical_moves, DRAW, UNFINISHED
+
+
+OPENING_PLIES = 4
+BATCH_SIZE = 10_000
+
+PlayerStats = namedtuple("PlayerStats", ["player", "games", "wins", "draws",
+                                         "losses", "win_rate"])
+OpeningStats = namedtuple("OpeningStats", ["opening", "games", "first_wins",
+                                           "draws", "second_wins"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    archive TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    nb_rows INTEGER NOT NULL,
+    nb_cols INTEGER NOT NULL,
+    nb_in_a_row INTEGER NOT NULL,
+    result INTEGER NOT NULL,
+    nb_moves INTEGER NOT NULL,
+    opening TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seats (
+    game_id INTEGER NOT NULL REFERENCES games(id),
+    seat INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    -- 1 won, 0 draw, -1 lost, NULL unfinished
+    outcome INTEGER
+);
+CREATE INDEX IF NOT EXISTS seats_player ON seats(player);
+CREATE INDEX IF NOT EXISTS games_opening ON games(opening);
+CREATE INDEX IF NOT EXISTS games_archive ON games(archive);
+"""
+
+
+def outcome(result: int, seat: int):
+    """Outcome of the game for the player of `seat` (from 1)."""
+    if result == UNFINISHED:
+        return None
+    if result == DRAW:
+        return 0
+    return 1 if result == seat else -1
+
+
+class StatsIndex:
+    """SQLite index of the games of archives"""
+
+    def __init__(self, path: str = "stats.db"):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_archive(self, archive: str) -> int:
+        """Indexes the games of an archive, replacing the games of a
+        previous indexing. Returns the number of games."""
+        cursor = self.connection.cursor()
+        nb_games = 0
+        with self.connection:
+            self._remove_archive(cursor, archive)
+            next_id, = cursor.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM games").fetchone()
+            games, seats = [], []
+            for offset, record in read_records(archive, with_offsets=True):
+                game_id = next_id + nb_games
+                games.append((game_id, archive, offset, record.nb_rows,
+                              record.nb_cols, record.nb_in_a_row,
+                              record.result, len(record.moves),
+                              opening(record, OPENING_PLIES,
+                                      canonical=True)))
+                seats.extend((game_id, seat, player,
+                              outcome(record.result, seat))
+                             for seat, player in enumerate(record.players,
+                                                           1))
+                nb_games += 1
+                if len(games) >= BATCH_SIZE:
+                    self._insert(cursor, games, seats)
+                    games, seats = [], []
+            self._insert(cursor, games, seats)
+        return nb_games
+
+    def rebuild(self, archives) -> int:
+        """Indexes again all the games, from the given archives only."""
+        with self.connection:
+            self.connection.execute("DELETE FROM seats")
+            self.connection.execute("DELETE FROM games")
+        return sum(self.add_archive(archive) for archive in archives)
+
+    @staticmethod
+    def _remove_archive(cursor, archive: str):
+        cursor.execute("DELETE FROM seats WHERE game_id IN"
+                       " (SELECT id FROM games WHERE archive = ?)",
+                       (archive,))
+        cursor.execute("DELETE FROM games WHERE archive = ?", (archive,))
+
+    @staticmethod
+    def _insert(cursor, games: list, seats: list):
+        cursor.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?,"
+                           " ?, ?)", games)
+        cursor.executemany("INSERT INTO seats VALUES (?, ?, ?, ?)", seats)
+
+    def player_stats(self, player: str) -> PlayerStats:
+        row = self.connection.execute(
+            "SELECT COUNT(outcome), SUM(outcome = 1), SUM(outcome = 0),"
+            " SUM(outcome = -1) FROM seats WHERE player = ?",
+            (player,)).fetchone()
+        games, wins, draws, losses = (value or 0 for value in row)
+        return PlayerStats(player, games, wins, draws, losses,
+                           wins / games if games else 0.)
+
+    def players(self, min_games: int = 1) -> list:
+        """Gives the statistics of all the players, best win rate first."""
+        rows = self.connection.execute(
+            "SELECT player, COUNT(outcome), SUM(outcome = 1),"
+            " SUM(outcome = 0), SUM(outcome = -1) FROM seats"
+            " GROUP BY player HAVING COUNT(outcome) >= ?"
+            " ORDER BY 1.0 * SUM(outcome = 1) / COUNT(outcome) DESC",
+            (min_games,))
+        stats = []
+        for player, *counts in rows:
+            # players of unfinished games only (min_games = 0) count none
+            games, wins, draws, losses = (value or 0 for value in counts)
+            stats.append(PlayerStats(player, games, wins, draws, losses,
+                                     wins / games if games else 0.))
+        return stats
+
+    def opening_stats(self, prefix: str = "", nb_rows: int = 6,
+                      nb_cols: int = 7, nb_in_a_row: int = 4) -> list:
+        """Gives the results of the openings starting with `prefix`, or
+        with its mirror, in their canonical form."""
+        prefix = format_moves(canonical_moves(parse_moves(prefix), nb_cols))
+        rows = self.connection.execute(
+            "SELECT opening, COUNT(*), SUM(result = 1), SUM(result = ?),"
+            " SUM(result = 2) FROM games"
+            " WHERE opening LIKE ? AND result != ?"
+            " AND nb_rows = ? AND nb_cols = ? AND nb_in_a_row = ?"
+            " GROUP BY opening ORDER BY COUNT(*) DESC",
+            (DRAW, prefix + "%", UNFINISHED, nb_rows, nb_cols, nb_in_a_row))
+        return [OpeningStats(*row) for row in rows]
+
+    def nb_games(self) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM games").fetchone()[0]
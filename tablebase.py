@@ -0,0 +1,289 @@
+"""
+Endgame tablebase of power four.
+
+The tablebase holds the result (win, draw or loss for the player to
+move) of every position reachable from a root position with at most
+`max_empty` empty cells. The results are computed backward, from the
+fullest positions to the emptiest ones, each one from the results of the
+positions after its moves.
+
+A result takes 2 bits, and no key is stored: the positions are indexed
+by a perfect hash function (three hashes per key, solved by peeling a
+random 3-hypergraph), whose table holds 2 bits per vertex, so that the
+sum of the three vertices of a position, modulo 4, is its result.
+
+The perfect hash gives a meaningless result for a position outside the
+tablebase, and holding the pieces of the root is not enough to be in
+it: some of these positions cannot be reached from the root. So a
+16 bits fingerprint of each key is stored on the same vertices, as the
+xor of the three, and `probe` only answers when it matches (a position
+outside the tablebase is taken for one of it once in 65536). About 22
+bits per position are written, and the file is memory-mapped.
+
+Usage: python tablebase.py tb.bin --root 44444433 --max-empty 14
+"""
+
+import argparse
+import math
+import mmap
+import struct
+import time
+
+from grid import Grid
+from solver import Solver, mix64, MASK64, WIN, DRAW, LOSS
+
+
+MAGIC = b"P4TB"
+VERSION = 2
+# rows, cols, number in a row, max empty cells, seed, vertices per hash,
+# pieces of the first player and all the pieces of the root
+HEADER = struct.Struct("<4sBBBBBIQQQ")
+VERTICES_PER_KEY = 1.23
+MAX_SEEDS = 100
+UNKNOWN = 3
+FINGERPRINT = struct.Struct("<H")
+
+
+class TablebaseFormatError(Exception):
+    """Custom error raised when a file is not a tablebase."""
+
+
+def hashes(key: int, seed: int, nb_vertices: int) -> tuple:
+    """Three vertices of the key, one in each third of the table."""
+    h = mix64((key ^ (key >> 64) ^ seed * 0x9E3779B97F4A7C15) & MASK64)
+    g = mix64(h ^ 0xD6E8FEB86659FD93)
+    return (h % nb_vertices,
+            nb_vertices + (h >> 32) % nb_vertices,
+            2 * nb_vertices + g % nb_vertices)
+
+
+def fingerprint(key: int, seed: int) -> int:
+    """16 bits of the key, independent from its vertices."""
+    return mix64((key ^ (key >> 64) ^ seed * 0xC2B2AE3D27D4EB4F
+                  ^ 0x165667B19E3779F9) & MASK64) >> 48
+
+
+def perfect_table(keys: list, values: list) -> tuple:
+    """Gives (seed, vertices per hash, table, fingerprints) such that the
+    values of the three vertices of `keys[i]` add up to `values[i]`
+    modulo 4, and their fingerprints xor to the one of `keys[i]`."""
+    nb_vertices = max(1, math.ceil(VERTICES_PER_KEY * len(keys) / 3))
+    for seed in range(MAX_SEEDS):
+        edges = [hashes(key, seed, nb_vertices) for key in keys]
+        # peeling: the degree of each vertex, and the xor of its edges
+        degrees = [0] * (3 * nb_vertices)
+        xors = [0] * (3 * nb_vertices)
+        for i, edge in enumerate(edges):
+            for vertex in edge:
+                degrees[vertex] += 1
+                xors[vertex] ^= i
+        stack = [v for v, degree in enumerate(degrees) if degree == 1]
+        peeled = []
+        while stack:
+            vertex = stack.pop()
+            if degrees[vertex] != 1:
+                continue
+            i = xors[vertex]
+            peeled.append((i, vertex))
+            for other in edges[i]:
+                degrees[other] -= 1
+                xors[other] ^= i
+                if degrees[other] == 1:
+                    stack.append(other)
+        if len(peeled) == len(keys):
+            break
+    else:
+        raise ValueError("No perfect hash function found (duplicate keys?)")
+    table = bytearray(3 * nb_vertices)
+    fingerprints = [0] * (3 * nb_vertices)
+    for i, vertex in reversed(peeled):
+        a, b, c = edges[i]
+        table[vertex] = (values[i] - table[a] - table[b] - table[c]
+                         + table[vertex]) % 4
+        fingerprints[vertex] = (fingerprint(keys[i], seed) ^ fingerprints[a]
+                                ^ fingerprints[b] ^ fingerprints[c]
+                                ^ fingerprints[vertex])
+    return seed, nb_vertices, table, fingerprints
+
+
+def pack_2bits(table: bytearray) -> bytes:
+    packed = bytearray((len(table) + 3) // 4)
+    for i, value in enumerate(table):
+        packed[i >> 2] |= value << ((i & 3) << 1)
+    return bytes(packed)
+
+
+def retrograde(solver: Solver, current: int, mask: int, nb_moves: int,
+               max_empty: int, verbose: bool = False) -> dict:
+    """Results of the positions reachable from the root (`current`,
+    `mask`) with at most `max_empty` empty cells, by key."""
+    min_moves = solver.size - max_empty
+    # positions of each ply, by key, where nobody has won yet
+    layers = [{solver.key(current, mask): (current, mask)}]
+    while nb_moves + len(layers) - 1 < solver.size - 1:
+        layer = {}
+        for current, mask in layers[-1].values():
+            possible = solver.possible(mask)
+            # the winning moves end the game
+            possible &= ~solver.winning_cells(current, mask)
+            while possible:
+                move = possible & -possible
+                possible ^= move
+                child = (current ^ mask, mask | move)
+                layer.setdefault(solver.key(*child), child)
+        layers.append(layer)
+        if verbose:
+            print(f"ply {nb_moves + len(layers) - 1}: {len(layer)} positions")
+
+    results = {}
+    below = {}
+    for depth in range(len(layers) - 1, -1, -1):
+        ply = nb_moves + depth
+        values = {}
+        for key, (current, mask) in layers[depth].items():
+            possible = solver.possible(mask)
+            if solver.winning_cells(current, mask) & possible:
+                value = WIN
+            elif ply == solver.size - 1:
+                value = DRAW
+            else:
+                value = LOSS
+                while possible and value != WIN:
+                    move = possible & -possible
+                    possible ^= move
+                    child = solver.key(current ^ mask, mask | move)
+                    value = max(value, -below[child])
+            values[key] = value
+        if ply >= min_moves:
+            results.update(values)
+        below = values
+        layers[depth] = None
+    return results
+
+
+def build_tablebase(path: str, root: Grid, max_empty: int,
+                    nb_in_a_row: int = 4, verbose: bool = False) -> int:
+    """Computes the tablebase of the positions reachable from `root`
+    with at most `max_empty` empty cells, and writes it to `path`."""
+    if (root.nb_rows + 1) * root.nb_cols > 64:
+        raise ValueError("The tablebase needs grids of 64 bits at most.")
+    start = time.perf_counter()
+    solver = Solver(root.nb_rows, root.nb_cols, nb_in_a_row, tt_size_mb=0)
+    current, mask = root.masks[root.nb_moves % 2 + 1], root.masks[0]
+    results = retrograde(solver, current, mask, root.nb_moves, max_empty,
+                         verbose)
+    keys = list(results)
+    seed, nb_vertices, table, fingerprints = perfect_table(
+        keys, [results[key] + 1 for key in keys])
+    first = current if root.nb_moves % 2 == 0 else current ^ mask
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, root.nb_rows, root.nb_cols,
+                               nb_in_a_row, max_empty, seed, nb_vertices,
+                               first, mask))
+        file.write(pack_2bits(table))
+        file.write(struct.pack(f"<{len(fingerprints)}H", *fingerprints))
+    if verbose:
+        print(f"{len(keys)} positions in {time.perf_counter() - start:.0f}s")
+    return len(keys)
+
+
+class Tablebase:
+    """Read-only memory-mapped endgame tablebase"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise TablebaseFormatError(f"{path} is empty.")
+        magic, version, self.nb_rows, self.nb_cols, self.nb_in_a_row, \
+            self.max_empty, self.seed, self.nb_vertices, root_first, \
+            self.root_mask = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise TablebaseFormatError(f"{path} is not a tablebase.")
+        self.size = self.nb_rows * self.nb_cols
+        # the fingerprints follow the 2 bits of the vertices
+        self._fingerprints = HEADER.size + (3 * self.nb_vertices + 3) // 4
+        self._solver = Solver(self.nb_rows, self.nb_cols, self.nb_in_a_row,
+                              tt_size_mb=0)
+        mirror = self._solver.mirror
+        # pieces of the first player and all the pieces, of the root and
+        # of its mirror
+        self.roots = {(root_first, self.root_mask),
+                      (mirror(root_first), mirror(self.root_mask))}
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def vertex(self, vertex: int) -> int:
+        return (self._map[HEADER.size + (vertex >> 2)]
+                >> ((vertex & 3) << 1)) & 3
+
+    def fingerprint(self, vertex: int) -> int:
+        return FINGERPRINT.unpack_from(
+            self._map, self._fingerprints + 2 * vertex)[0]
+
+    def covers(self, current: int, mask: int, nb_moves: int) -> bool:
+        """Whether the position may be in the tablebase: it holds the
+        pieces of the root (or of its mirror), with at most `max_empty`
+        empty cells. The fingerprint of `probe` tells the rest."""
+        if nb_moves < self.size - self.max_empty:
+            return False
+        first = current if nb_moves % 2 == 0 else current ^ mask
+        return any(mask & root_mask == root_mask
+                   and first & root_mask == root_first
+                   for root_first, root_mask in self.roots)
+
+    def probe(self, key: int, current: int, mask: int, nb_moves: int):
+        """Result (WIN, DRAW or LOSS) of the player to move owning
+        `current`, None if the position is not in the tablebase. `key`
+        is `solver.Solver.key` of the position."""
+        if not self.covers(current, mask, nb_moves):
+            return None
+        vertices = hashes(key, self.seed, self.nb_vertices)
+        a, b, c = map(self.fingerprint, vertices)
+        if a ^ b ^ c != fingerprint(key, self.seed):
+            return None
+        value = sum(map(self.vertex, vertices)) % 4
+        return None if value == UNKNOWN else value - 1
+
+    def lookup(self, grid: Grid, id_player: int):
+        """Result of the grid for `id_player`, to move, or None."""
+        if (grid.nb_rows, grid.nb_cols) != (self.nb_rows, self.nb_cols):
+            return None
+        current, mask = grid.masks[id_player], grid.masks[0]
+        return self.probe(self._solver.key(current, mask), current, mask,
+                          grid.nb_moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds an endgame"
+                                                 " tablebase of power four.")
+    parser.add_argument("path")
+    parser.add_argument("--root", default="",
+                        help="columns played from the empty grid, from 1")
+    parser.add_argument("--max-empty", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    args = parser.parse_args()
+    root = Grid(args.rows, args.cols)
+    for i, char in enumerate(args.root):
+        root.drop_piece(int(char) - 1, i % 2 + 1)
+    nb_positions = build_tablebase(args.path, root, args.max_empty,
+                                   args.nb_in_a_row, verbose=True)
+    print(f"{nb_positions} positions written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
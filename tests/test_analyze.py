@@ -0,0 +1,44 @@
+import pytest
+
+from analyze import parse_position
+from grid import InvalidMoveError
+
+
+@pytest.mark.parametrize("line", ["4453", '{"moves": "4453"}',
+                                  '{"moves": [4, 4, 5, 3]}'])
+def test_parse_position(line):
+    moves, grid, id_player = parse_position(line, 6, 7, 4)
+    assert moves == [3, 3, 4, 2]
+    assert grid.nb_moves == 4
+    assert id_player == 1
+
+
+def test_empty_line_is_the_empty_grid():
+    moves, grid, id_player = parse_position("", 6, 7, 4)
+    assert (moves, grid.nb_moves, id_player) == ([], 0, 1)
+
+
+@pytest.mark.parametrize("line", ['{"moves": 4}', '{"moves": ["4", 4]}',
+                                  '{"moves": [true]}', '{"moves": null}',
+                                  '{"moves": {"4": 4}}'])
+def test_moves_of_other_types(line):
+    with pytest.raises(ValueError):
+        parse_position(line, 6, 7, 4)
+
+
+@pytest.mark.parametrize("line", ["hello", "44x5", "4 4", "(10", "()",
+                                  '{"moves": "4-4"}'])
+def test_moves_of_junk_strings(line):
+    with pytest.raises(ValueError, match="invalid moves"):
+        parse_position(line, 6, 7, 4)
+
+
+@pytest.mark.parametrize("line", ["4444444", '{"moves": [0]}', "8"])
+def test_invalid_moves(line):
+    with pytest.raises(InvalidMoveError):
+        parse_position(line, 6, 7, 4)
+
+
+def test_won_position():
+    with pytest.raises(ValueError, match="already won"):
+        parse_position("1212121", 6, 7, 4)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from grid import Grid, InvalidMoveError
+from batch import BatchGrid, DRAW, random_moves, random_playouts
+
+
+@pytest.mark.parametrize("nb_rows, nb_cols, nb_in_a_row",
+                         [(6, 7, 4), (4, 5, 3), (5, 9, 5), (3, 3, 3)])
+def test_same_games_as_grid(nb_rows, nb_cols, nb_in_a_row):
+    rng = np.random.default_rng(nb_rows * nb_cols)
+    nb_games = 64
+    batch = BatchGrid(nb_games, nb_rows, nb_cols, nb_in_a_row)
+    grids = [Grid(nb_rows, nb_cols) for _ in range(nb_games)]
+    winners = [0] * nb_games
+    id_player = 1
+    while batch.active.any():
+        cols = random_moves(batch, rng)
+        rows = batch.drop_pieces(cols, id_player)
+        for n, grid in enumerate(grids):
+            if winners[n]:
+                assert rows[n] == -1
+                continue
+            row = grid.drop_piece(int(cols[n]), id_player)
+            assert rows[n] == row
+            if grid.check_win_at(row, int(cols[n]), id_player, nb_in_a_row):
+                winners[n] = id_player
+            elif grid.is_full():
+                winners[n] = DRAW
+        assert batch.winners.tolist() == winners
+        assert (batch.boards == np.array([grid.board
+                                          for grid in grids])).all()
+        assert batch.heights.tolist() == [grid.heights for grid in grids]
+        assert batch.nb_moves.tolist() == [grid.nb_moves for grid in grids]
+        for id_checked in (1, 2):
+            assert batch.winning_games(id_checked).tolist() \
+                == [grid.winning_move(id_checked, nb_in_a_row)
+                    for grid in grids]
+        id_player = id_player % 2 + 1
+    assert all(winners)
+
+
+def test_full_column():
+    batch = BatchGrid(2, 2, 3, 3)
+    batch.drop_pieces([0, 1], 1)
+    batch.drop_pieces([0, 1], 2)
+    assert batch.valid_locations().tolist() == [[False, True, True],
+                                                [True, False, True]]
+    with pytest.raises(InvalidMoveError):
+        batch.drop_pieces([0, 2], 1)
+
+
+def test_finished_games_are_left():
+    batch = BatchGrid(2, 4, 4, 3)
+    for cols, id_player in (([0, 0], 1), ([1, 3], 2), ([0, 0], 1),
+                            ([1, 3], 2), ([0, 1], 1)):
+        batch.drop_pieces(cols, id_player)
+    assert batch.winners.tolist() == [1, 0]
+    assert not batch.valid_locations()[0].any()
+    # the column of a finished game is not checked
+    rows = batch.drop_pieces([0, 2], 2)
+    assert rows.tolist() == [-1, 0]
+    assert batch.boards[0, 3, 0] == 0
+    batch.reset_board(np.array([True, False]))
+    assert batch.winners.tolist() == [0, 0]
+    assert batch.nb_moves.tolist() == [0, 6]
+    assert not batch.boards[0].any()
+
+
+def test_random_playouts():
+    winners = random_playouts(200, 4, 5, 3, seed=11)
+    assert set(winners.tolist()) <= {1, 2, DRAW}
+    assert (winners == random_playouts(200, 4, 5, 3, seed=11)).all()
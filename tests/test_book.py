@@ -0,0 +1,98 @@
+import itertools
+import random
+
+import pytest
+
+from grid import Grid
+from engine import Engine
+from book import (OpeningBook, BookFormatError, book_positions,
+                  generate_book, write_book)
+
+
+def play(moves, nb_rows=4, nb_cols=5) -> Grid:
+    grid = Grid(nb_rows, nb_cols)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+    return grid
+
+
+@pytest.fixture(scope="module")
+def book_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("book") / "book.bin")
+    generate_book(path, 4, Engine(3, movetime=None, max_depth=5),
+                  nb_rows=4, nb_cols=5)
+    return path
+
+
+def test_write_and_find(tmp_path):
+    rand = random.Random(3)
+    records = {rand.getrandbits(64): (rand.randrange(7),
+                                      rand.randrange(-1000, 1000))
+               for _ in range(500)}
+    path = str(tmp_path / "book.bin")
+    write_book(path, [(key, *entry) for key, entry in records.items()],
+               6, 7, 4)
+    with OpeningBook(path) as book:
+        assert len(book) == len(records)
+        for key, entry in records.items():
+            assert book.find(key) == entry
+        for key in (0, 2 ** 64 - 1, *(key ^ 1 for key in records)):
+            if key not in records:
+                assert book.find(key) is None
+
+
+def test_every_position_and_mirror(book_path):
+    keys = {grid.canonical_key(id_player)[0]
+            for grid, id_player in book_positions(4, 4, 5, 3)}
+    with OpeningBook(book_path) as book:
+        assert len(book) == len(keys)
+        for nb_plies in range(5):
+            for moves in itertools.product(range(5), repeat=nb_plies):
+                grid = play(moves)
+                mirror = play([4 - col for col in moves])
+                id_player = nb_plies % 2 + 1
+                entry = book.lookup(grid, id_player, 3)
+                if grid.canonical_key(id_player)[0] not in keys:
+                    # a won position, out of the book
+                    assert entry is None
+                    continue
+                move, score = entry
+                assert grid.is_valid_location(move)
+                if mirror.hash == grid.hash:
+                    # a symmetric position
+                    assert book.lookup(mirror, id_player, 3) == entry
+                else:
+                    assert book.lookup(mirror, id_player, 3) \
+                        == (grid.mirror_col(move), score)
+
+
+@pytest.mark.parametrize("moves, winning", [([0, 4, 0, 4], {0}),
+                                            ([4, 0, 4, 0], {4}),
+                                            ([1, 1, 2, 2], {0, 3})])
+def test_winning_moves(book_path, moves, winning):
+    with OpeningBook(book_path) as book:
+        best_move, score = book.lookup(play(moves), 1, 3)
+    assert best_move in winning
+    assert score > 0
+
+
+def test_engine_plays_from_the_book(book_path):
+    with OpeningBook(book_path) as book:
+        engine = Engine(3, book=book)
+        grid = play([2, 2])
+        result = engine.search(grid, 1)
+        assert (result.best_move, result.score) == book.lookup(grid, 1, 3)
+        assert result.nodes == 0
+        # other grids are searched
+        assert book.lookup(Grid(6, 7), 1, 3) is None
+        assert book.lookup(play([2, 2]), 1, 4) is None
+
+
+def test_not_a_book(tmp_path):
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"P4TT" + bytes(64))
+    for path in (empty, other):
+        with pytest.raises(BookFormatError):
+            OpeningBook(str(path))
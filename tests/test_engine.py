@@ -0,0 +1,58 @@
+import io
+
+from engine import EngineProtocol
+
+
+def run(*lines: str) -> tuple:
+    """Protocol after the commands, and its answers."""
+    output = io.StringIO()
+    protocol = EngineProtocol(output)
+    protocol.loop(line + "\n" for line in lines)
+    return protocol, output.getvalue().splitlines()
+
+
+def test_position_in_one_word():
+    protocol, answers = run("position 4453")
+    assert answers == []
+    assert protocol.grid.nb_moves == 4
+    assert protocol.grid.heights[3:5] == [2, 1]
+    assert protocol.grid.cell(0, 2) == 2
+
+
+def test_position_in_words():
+    protocol, answers = run("position startpos 4 4 5 3")
+    assert answers == []
+    assert protocol.grid.heights[2:5] == [1, 2, 1]
+
+
+def test_position_beyond_nine_columns():
+    protocol, answers = run("size 6 12", "position 10")
+    assert answers == []
+    assert protocol.grid.nb_moves == 1
+    assert protocol.grid.cell(0, 9) == 1
+    protocol, answers = run("size 6 12", "position 10 12 1")
+    assert answers == []
+    assert [protocol.grid.cell(0, col) for col in (9, 11, 0)] == [1, 2, 1]
+
+
+def test_invalid_commands():
+    _, answers = run("position 9", "size 6", "perft", "jump")
+    assert [answer.split()[0] for answer in answers] == ["error"] * 4
+    assert answers[-1] == "error unknown command jump"
+
+
+def test_go_and_ready():
+    protocol, answers = run("position 444", "go depth 2", "isready", "quit",
+                            "isready")
+    assert answers[-2].startswith("bestmove ")
+    assert answers[-1] == "readyok"
+    assert 1 <= int(answers[-2].split()[1]) <= 7
+
+
+def test_go_depth_without_movetime():
+    # no default movetime cuts a search limited by its depth
+    _, answers = run("position 444", "go depth 9")
+    infos = [answer.split() for answer in answers
+             if answer.startswith("info ")]
+    assert [int(info[2]) for info in infos] == list(range(1, 10))
+    assert answers[-1].startswith("bestmove ")
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+from grid import Grid
+from engine import Engine
+from book import OpeningBook, book_positions, generate_book
+from records import canonical_moves, format_moves, parse_moves
+
+
+def play(moves, nb_rows=6, nb_cols=7) -> Grid:
+    grid = Grid(nb_rows, nb_cols)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+    return grid
+
+
+def mirror(moves, nb_cols=7) -> list:
+    return [nb_cols - 1 - col for col in moves]
+
+
+def random_moves(rand: random.Random, nb_moves: int, nb_rows=6,
+                 nb_cols=7) -> list:
+    heights = [0] * nb_cols
+    moves = []
+    while len(moves) < nb_moves:
+        col = rand.randrange(nb_cols)
+        if heights[col] < nb_rows:
+            heights[col] += 1
+            moves.append(col)
+    return moves
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_canonical_key_of_mirror(seed):
+    rand = random.Random(seed)
+    moves = random_moves(rand, rand.randrange(1, 30))
+    grid, mirrored = play(moves), play(mirror(moves))
+    for id_player in (1, 2):
+        key, flag = grid.canonical_key(id_player)
+        mirror_key, mirror_flag = mirrored.canonical_key(id_player)
+        assert key == mirror_key
+        assert key == min(grid.hash, mirrored.hash) \
+            ^ grid.turn_keys[id_player]
+        if grid.hash != mirrored.hash:
+            assert flag != mirror_flag
+    assert grid.mirror_hash == mirrored.hash
+    assert mirrored.mirror_hash == grid.hash
+
+
+def test_canonical_key_of_symmetric_position():
+    grid = play([3, 3, 3, 3])
+    assert grid.hash == grid.mirror_hash
+    assert grid.canonical_key(1) == (grid.key(1), False)
+    # the players to move are not mixed up
+    assert grid.canonical_key(1)[0] != grid.canonical_key(2)[0]
+
+
+def test_mirror_hash_through_undo_copy_and_masks():
+    rand = random.Random(7)
+    moves = random_moves(rand, 25)
+    grid = Grid(6, 7)
+    hashes = [(grid.hash, grid.mirror_hash)]
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+        hashes.append((grid.hash, grid.mirror_hash))
+        copy = grid.copy()
+        assert (copy.hash, copy.mirror_hash) == hashes[-1]
+        again = Grid(6, 7)
+        again.set_masks(grid.masks[1:])
+        assert (again.hash, again.mirror_hash) == hashes[-1]
+    for col in reversed(moves):
+        hashes.pop()
+        grid.undo_piece(col)
+        assert (grid.hash, grid.mirror_hash) == hashes[-1]
+    grid.drop_piece(3, 1)
+    grid.reset_board()
+    assert (grid.hash, grid.mirror_hash) == (0, 0)
+
+
+def test_mirror_col():
+    grid = Grid(6, 7)
+    assert [grid.mirror_col(col) for col in range(7)] == [6, 5, 4, 3, 2, 1, 0]
+    assert grid.mirror_col(None) is None
+
+
+def test_engine_shares_mirrored_entries():
+    # both searches go to the same depth, whatever the load
+    engine = Engine(4, movetime=None, max_depth=6)
+    moves = [0, 1, 1, 5, 2]
+    grid, mirrored = play(moves), play(mirror(moves))
+    result = engine.search(grid, 2)
+    key, flag = grid.canonical_key(2)
+    assert key == mirrored.canonical_key(2)[0]
+    entry = engine.tt.probe(key)
+    move = grid.mirror_col(entry[3]) if flag else entry[3]
+    assert move == result.best_move
+    # the mirror is answered from the same entries, with mirrored moves
+    mirror_result = engine.search(mirrored, 2)
+    assert mirror_result.best_move == grid.mirror_col(result.best_move)
+    assert mirror_result.score == result.score
+
+
+def test_book_mirrored_lookup(tmp_path):
+    path = str(tmp_path / "book.bin")
+    nb_records = generate_book(path, 3, Engine(3, movetime=None,
+                                               max_depth=4),
+                               nb_rows=4, nb_cols=5)
+    keys = {grid.canonical_key(id_player)[0]
+            for grid, id_player in book_positions(3, 4, 5, 3)}
+    assert nb_records == len(keys)
+    with OpeningBook(path) as book:
+        assert len(book) == nb_records
+        for moves in ([], [0], [1, 4], [0, 2, 3], [2, 2, 1]):
+            grid = play(moves, 4, 5)
+            mirrored = play(mirror(moves, 5), 4, 5)
+            id_player = len(moves) % 2 + 1
+            move, score = book.lookup(grid, id_player, 3)
+            assert book.lookup(mirrored, id_player, 3) \
+                == (grid.mirror_col(move), score)
+            assert grid.is_valid_location(move)
+
+
+@pytest.mark.parametrize("moves", [[], [3], [0, 6, 2], [9, 10, 0, 11],
+                                   [12, 1, 12]])
+def test_format_moves(moves):
+    assert parse_moves(format_moves(moves)) == moves
+
+
+def test_canonical_moves():
+    assert canonical_moves([5, 4, 3], 7) == bytes([1, 2, 3])
+    assert canonical_moves([1, 2, 3], 7) == bytes([1, 2, 3])
+    assert canonical_moves([3, 0], 7) == canonical_moves([3, 6], 7)
+    assert canonical_moves([11, 0], 12) == bytes([0, 11])
@@ -0,0 +1,42 @@
+from history import History, Move
+
+
+def history_of(*cols: int) -> History:
+    history = History()
+    for i, col in enumerate(cols):
+        history.push(Move(col, 0, i % 2 + 1))
+    return history
+
+
+def test_undo_and_redo():
+    history = history_of(3, 4, 5)
+    assert history.undo() == Move(5, 0, 1)
+    assert history.undo() == Move(4, 0, 2)
+    assert history.redo() == Move(4, 0, 2)
+    assert len(history) == 2
+    assert history.moves() == [Move(3, 0, 1), Move(4, 0, 2)]
+
+
+def test_variations():
+    history = history_of(3, 4)
+    history.undo()
+    history.push(Move(2, 0, 2))
+    history.undo()
+    assert history.variations() == [Move(4, 0, 2), Move(2, 0, 2)]
+    assert history.redo() == Move(2, 0, 2)
+    history.undo()
+    history.select_variation(0)
+    assert history.redo() == Move(4, 0, 2)
+
+
+def test_jump():
+    history = history_of(3, 4, 5, 6)
+    steps = list(history.jump(1))
+    assert steps == [(Move(6, 0, 2), False), (Move(5, 0, 1), False),
+                     (Move(4, 0, 2), False)]
+    assert history.ply == 1
+    assert list(history.jump(3)) == [(Move(4, 0, 2), True),
+                                     (Move(5, 0, 1), True)]
+    # as far as the line goes
+    assert len(list(history.jump(10))) == 1
+    assert history.ply == 4
@@ -0,0 +1,60 @@
+import math
+
+import pytest
+
+from grid import Grid
+from mcts import MCTS, MCTSPlayer
+
+
+def play(moves, nb_rows=6, nb_cols=7) -> Grid:
+    grid = Grid(nb_rows, nb_cols)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+    return grid
+
+
+def best_move(root) -> int:
+    return max(root.children, key=lambda child: child.visits).move
+
+
+@pytest.mark.parametrize("policy", ["random", "winning"])
+def test_plays_the_winning_move(policy):
+    # player 1 has three pieces in the first column
+    grid = play([0, 6, 0, 6, 0, 5])
+    root, nb_playouts = MCTS(4, policy=policy, seed=1).search(
+        grid, 1, movetime=math.inf, max_playouts=2000)
+    assert nb_playouts == 2000
+    assert best_move(root) == 0
+    assert sum(child.visits for child in root.children) == nb_playouts
+
+
+@pytest.mark.parametrize("policy", ["random", "winning"])
+def test_blocks_the_winning_move(policy):
+    grid = play([0, 6, 0, 6, 0])
+    root, _ = MCTS(4, policy=policy, seed=2).search(
+        grid, 2, movetime=math.inf, max_playouts=1000)
+    assert best_move(root) == 0
+
+
+def test_same_seed_same_tree():
+    grid = play([3, 3, 2])
+    first, _ = MCTS(4, seed=5).search(grid, 2, movetime=math.inf,
+                                       max_playouts=300)
+    second, _ = MCTS(4, seed=5).search(grid, 2, movetime=math.inf,
+                                        max_playouts=300)
+    assert [(child.move, child.visits, child.wins)
+            for child in first.children] \
+        == [(child.move, child.visits, child.wins)
+            for child in second.children]
+    # the grid searched is left as it was
+    assert grid.nb_moves == 3
+
+
+def test_player_elapsed_time():
+    # on a full grid, the search ends at once whatever its movetime
+    grid = play([col for col in range(4) for _ in range(4)], 4, 4)
+    with MCTSPlayer(3, movetime=60., nb_workers=1) as player:
+        result = player.search(grid, 1)
+    assert result.best_move is None
+    assert result.playouts == 0
+    assert result.elapsed < 30
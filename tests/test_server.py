@@ -0,0 +1,36 @@
+import pytest
+
+from server import GameServer, Session
+
+
+def session() -> tuple:
+    """Session of a new server, and the lines sent to its client."""
+    lines = []
+    return Session(GameServer(1), lines.append), lines
+
+
+def test_parse_setup():
+    assert Session.parse_setup([]) == ((6, 7, 4), [None])
+    assert Session.parse_setup(["5", "8", "3", "60"]) == ((5, 8, 3), [60.])
+    assert Session.parse_setup(["60", "20"], 2) == ((6, 7, 4), [60., 20.])
+
+
+@pytest.mark.parametrize("args", [["nan"], ["inf"], ["-1"],
+                                  ["6", "7", "4", "-inf"], ["inf", "7", "4"],
+                                  ["6", "7", "9"], ["20", "20", "4"]])
+def test_parse_invalid_setup(args):
+    with pytest.raises(ValueError):
+        Session.parse_setup(args)
+
+
+def test_commands():
+    client, lines = session()
+    assert client.handle("hello ada")
+    assert client.handle("seek 6 7 4 nan")
+    assert client.handle("move 4")
+    assert client.handle("dance")
+    assert client.handle("seek 6 7 4 60")
+    assert client.seeking == ((6, 7, 4), 60.)
+    assert not client.handle("quit")
+    assert lines == ["welcome ada", "error invalid number nan",
+                     "error not playing", "error unknown command dance"]
@@ -0,0 +1,121 @@
+import random
+
+import pytest
+
+from grid import Grid
+from solver import Solver, WIN, DRAW, LOSS
+from tablebase import Tablebase, build_tablebase
+
+
+NB_ROWS, NB_COLS, NB_IN_A_ROW = 4, 5, 3
+
+
+def play(moves: list) -> tuple:
+    """Grid after the columns `moves`, and the player to move."""
+    grid = Grid(NB_ROWS, NB_COLS)
+    for i, col in enumerate(moves):
+        grid.drop_piece(col, i % 2 + 1)
+    return grid, len(moves) % 2 + 1
+
+
+def random_positions(nb_positions: int, min_moves: int, seed: int = 0):
+    """Random positions where nobody has won and the player to move
+    cannot win at once."""
+    rng = random.Random(seed)
+    solver = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=0)
+    positions = []
+    while len(positions) < nb_positions:
+        grid, id_player = play([])
+        nb_moves = rng.randint(min_moves, grid.nb_rows * grid.nb_cols - 1)
+        while grid.nb_moves < nb_moves:
+            col = rng.choice([c for c in range(NB_COLS)
+                              if grid.is_valid_location(c)])
+            row = grid.drop_piece(col, id_player)
+            if grid.check_win_at(row, col, id_player, NB_IN_A_ROW):
+                break
+            id_player = id_player % 2 + 1
+        else:
+            current, mask = grid.masks[id_player], grid.masks[0]
+            if not solver.winning_cells(current, mask) \
+                    & solver.possible(mask):
+                positions.append((grid, id_player))
+    return positions
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    # the root "12", the first two columns from 1
+    path = tmp_path_factory.mktemp("tb") / "tb.bin"
+    root, _ = play([0, 1])
+    build_tablebase(str(path), root, 18, NB_IN_A_ROW)
+    with Tablebase(str(path)) as tablebase:
+        yield tablebase
+
+
+@pytest.mark.parametrize("moves", [[4, 4, 4, 3], [1, 3, 1, 1], [3, 1, 3, 3]])
+def test_tablebase_ignores_unreachable_positions(tablebase, moves):
+    grid, id_player = play(moves)
+    plain = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1)
+    backed = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1,
+                    tablebase=tablebase)
+    assert backed.solve(grid, id_player, weak=True).result \
+        == plain.solve(grid, id_player, weak=True).result
+
+
+def test_tablebase_solves_like_plain_search(tablebase):
+    plain = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1)
+    backed = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1,
+                    tablebase=tablebase)
+    for grid, id_player in random_positions(60, 2):
+        plain.tt.clear()
+        backed.tt.clear()
+        expected = plain.solve(grid, id_player, weak=True).result
+        assert backed.solve(grid, id_player, weak=True).result == expected
+        assert tablebase.lookup(grid, id_player) in (None, expected)
+
+
+def test_tablebase_holds_the_root_positions(tablebase):
+    plain = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1)
+    found = 0
+    for grid, id_player in random_positions(200, 8, seed=1):
+        if (grid.cell(0, 0), grid.cell(0, 1)) != (1, 2) \
+                or grid.heights[0] < 1 or grid.heights[1] < 1:
+            continue
+        result = tablebase.lookup(grid, id_player)
+        if result is not None:
+            found += 1
+            assert result == plain.solve(grid, id_player, weak=True).result
+    assert found
+
+
+def test_distance():
+    solver = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW)
+    size = solver.size
+    # a draw lasts until the grid is full
+    assert solver.distance(0, 5) == size - 5
+    # won with the next move, or lost with the move after
+    assert solver.distance(solver.win_score(7), 7) == 1
+    assert solver.distance(-solver.win_score(8), 7) == 2
+    # won with the last piece of the first player
+    assert solver.distance(1, 0) == size - 1
+
+
+def test_distance_of_best_play():
+    solver = Solver(NB_ROWS, NB_COLS, NB_IN_A_ROW, tt_size_mb=1)
+    for grid, id_player in random_positions(15, 6, seed=2):
+        solution = solver.solve(grid, id_player)
+        nb_plies = 0
+        while True:
+            best = solver.solve(grid, id_player)
+            assert best.result == (solution.result if nb_plies % 2 == 0
+                                   else -solution.result)
+            row = grid.drop_piece(best.best_move, id_player)
+            nb_plies += 1
+            if grid.check_win_at(row, best.best_move, id_player,
+                                 NB_IN_A_ROW) or grid.is_full():
+                break
+            id_player = id_player % 2 + 1
+        assert nb_plies == solution.distance
+        assert (solution.result == DRAW) == (not grid.winning_move(
+            id_player, NB_IN_A_ROW))
+        assert solution.result in (WIN, DRAW, LOSS)
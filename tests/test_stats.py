@@ -0,0 +1,39 @@
+from records import GameRecord, RecordWriter, UNFINISHED
+from stats import StatsIndex
+
+
+def write_archive(path, records):
+    with RecordWriter(str(path)) as writer:
+        for record in records:
+            writer.write(record)
+
+
+def test_players(tmp_path):
+    archive = tmp_path / "games.p4gr"
+    write_archive(archive, [
+        GameRecord(6, 7, 4, ("ada", "bob"), 1, bytes([3, 3, 4, 4, 5, 5, 6])),
+        GameRecord(6, 7, 4, ("bob", "eve"), UNFINISHED, bytes([3, 2])),
+    ])
+    with StatsIndex(str(tmp_path / "stats.db")) as index:
+        assert index.add_archive(str(archive)) == 2
+        assert [stats.player for stats in index.players()] == ["ada", "bob"]
+        stats = {stats.player: stats for stats in index.players(0)}
+        assert stats["eve"].games == 0
+        assert stats["eve"].win_rate == 0.
+        assert stats["bob"].losses == 1
+        assert index.player_stats("ada").win_rate == 1.
+
+
+def test_openings_and_their_mirror(tmp_path):
+    archive = tmp_path / "games.p4gr"
+    write_archive(archive, [
+        GameRecord(6, 7, 4, ("ada", "bob"), 1, bytes([0, 1, 0, 1])),
+        GameRecord(6, 7, 4, ("ada", "bob"), 2, bytes([6, 5, 6, 5])),
+        GameRecord(6, 7, 4, ("ada", "bob"), 1, bytes([3, 3, 3, 3])),
+    ])
+    with StatsIndex(str(tmp_path / "stats.db")) as index:
+        index.add_archive(str(archive))
+        (stats,) = index.opening_stats("12")
+        assert (stats.games, stats.first_wins, stats.second_wins) == (2, 1, 1)
+        assert index.opening_stats("76") == [stats]
+        assert index.nb_games() == 3
@@ -0,0 +1,63 @@
+import random
+
+from engine import Engine
+from grid import Grid
+from threats import ThreatMap, window_tables
+
+
+def test_window_tables():
+    tables = window_tables(6, 7, 4)
+    # 24 horizontal, 21 vertical and 2 x 12 diagonal windows
+    assert len(tables.cells) == 69
+    assert all(len(cells) == 4 for cells in tables.cells)
+    # the cell (0, 3) belongs to 4 horizontal, 1 vertical, 2 diagonal
+    assert len(tables.by_cell[3 * 7]) == 7
+
+
+def test_play_and_undo_match_from_grid():
+    rng = random.Random(0)
+    for _ in range(20):
+        grid = Grid()
+        threats = ThreatMap()
+        played = []
+        while not grid.is_full():
+            col = rng.choice([c for c in range(7)
+                              if grid.is_valid_location(c)])
+            id_player = grid.nb_moves % 2 + 1
+            row = grid.drop_piece(col, id_player)
+            threats.play(col, row, id_player)
+            played.append((col, row, id_player))
+            fresh = ThreatMap.from_grid(grid)
+            for player in (1, 2):
+                assert threats.cells(player) == fresh.cells(player)
+                assert threats.parity(player) == fresh.parity(player)
+                assert threats.evaluate(player) == fresh.evaluate(player)
+            if grid.winning_move(id_player):
+                break
+        for col, row, id_player in reversed(played):
+            threats.undo(col, row, id_player)
+        empty = ThreatMap()
+        assert threats.counts == empty.counts
+        assert threats.scores == empty.scores
+        assert threats.threats == empty.threats
+
+
+def test_immediate_and_forced_moves():
+    grid = Grid()
+    for col, id_player in [(0, 1), (0, 2), (1, 1), (1, 2), (2, 1)]:
+        grid.drop_piece(col, id_player)
+    threats = ThreatMap.from_grid(grid)
+    assert threats.immediate(1) == [3]
+    assert threats.forced_moves(1) == [3]
+    assert threats.forced_moves(2) == [3]
+    assert threats.evaluate(1) == -threats.evaluate(2)
+
+
+def test_engine_with_threats():
+    grid = Grid()
+    for col, id_player in [(0, 1), (0, 2), (1, 1), (1, 2), (2, 1)]:
+        grid.drop_piece(col, id_player)
+    engine = Engine(movetime=None, max_depth=4, threats=True)
+    assert engine.search(grid, 2).best_move == 3
+    assert engine.search(grid, 1).best_move == 3
+    assert grid.nb_moves == 5
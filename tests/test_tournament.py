@@ -0,0 +1,41 @@
+import pytest
+
+from tournament import (read_openings, all_openings, elo_estimate, sprt,
+                        sprt_bounds, Score)
+
+
+def test_read_openings(tmp_path):
+    path = tmp_path / "openings.txt"
+    path.write_text("44\n# a comment\n\n4453  # another one\n")
+    assert read_openings(str(path)) == [[3, 3], [3, 3, 4, 2]]
+
+
+@pytest.mark.parametrize("text", ["08", "48", "4444444", "4x", "1212121"])
+def test_read_invalid_openings(tmp_path, text):
+    path = tmp_path / "openings.txt"
+    path.write_text(f"44\n{text}\n")
+    with pytest.raises(ValueError, match=":2:"):
+        read_openings(str(path))
+
+
+def test_openings_of_smaller_grids(tmp_path):
+    path = tmp_path / "openings.txt"
+    path.write_text("55\n")
+    with pytest.raises(ValueError):
+        read_openings(str(path), 4, 4, 3)
+    assert len(all_openings(4)) == 16
+
+
+def test_elo_estimate():
+    assert elo_estimate(Score(0, 0, 0)).games == 0
+    even = elo_estimate(Score(30, 40, 30))
+    assert even.elo == pytest.approx(0)
+    assert even.error > 0
+    assert elo_estimate(Score(60, 20, 20)).elo > 100
+
+
+def test_sprt():
+    lower, upper = sprt_bounds()
+    assert lower < 0 < upper
+    assert sprt(Score(300, 400, 100), 0, 20) > upper
+    assert sprt(Score(100, 400, 300), 0, 20) < lower
@@ -0,0 +1,45 @@
+import pytest
+
+from tt import TranspositionTable, pack, unpack, EXACT, LOWER, UPPER
+
+
+@pytest.mark.parametrize("entry", [(0, EXACT, 0, None), (5, LOWER, -42, 0),
+                                   (255, UPPER, 999_999, 11),
+                                   (12, EXACT, -999_999, 6)])
+def test_pack(entry):
+    assert pack(*entry) & 1
+    assert unpack(pack(*entry)) == entry
+
+
+def test_deep_entries_stay():
+    table = TranspositionTable(nb_entries=2)
+    table.store(1, 8, EXACT, 10, 3)
+    table.store(2, 2, LOWER, 5, 1)
+    table.store(3, 4, UPPER, -5, None)
+    assert table.probe(1) == (8, EXACT, 10, 3)
+    assert table.probe(2) is None
+    assert table.probe(3) == (4, UPPER, -5, None)
+
+
+def test_clear():
+    table = TranspositionTable(nb_entries=64)
+    for generation in range(300):
+        assert table.probe(7) is None
+        assert table.stats()["used"] == 0
+        table.store(7, 1 + generation % 200, EXACT, generation, 2)
+        # an entry of an older generation gives its slot to any depth
+        table.store(7 + table.nb_buckets, 1, EXACT, -generation, 1)
+        assert table.probe(7) == (1 + generation % 200, EXACT, generation, 2)
+        assert table.probe(7 + table.nb_buckets)[2] == -generation
+        table.clear()
+
+
+def test_save_and_load(tmp_path):
+    table = TranspositionTable(nb_entries=64)
+    table.store(1, 3, EXACT, 4, 5)
+    table.clear()
+    table.store(2, 6, LOWER, 7, 8)
+    table.save(tmp_path / "tt.bin")
+    loaded = TranspositionTable.load(tmp_path / "tt.bin")
+    assert loaded.probe(1) is None
+    assert loaded.probe(2) == (6, LOWER, 7, 8)
@@ -0,0 +1,178 @@
+"""
+Windows and threats of power four.
+
+A window is a line of `nb_in_a_row` cells: every alignment fills one.
+The windows of each size of grid are computed once, with the windows
+through each cell, so that a move only updates the windows of its cell.
+
+A `ThreatMap` counts the pieces of each player in each window. A window
+holding the pieces of only one player is open for them, and is a threat
+when one cell is missing: this empty cell wins for them. A threat is
+immediate when its cell can be played at once. Rows are counted from 1
+at the bottom, as the parity of the row of a threat matters at the end
+of the game: the first player benefits from the odd threats, the second
+one from the even threats.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from grid import DIRECTIONS
+
+
+# weight of an open window holding n pieces (n from 1), in `evaluate`
+WINDOW_WEIGHT = 4
+# weight of a threat, and of a threat of the good parity
+THREAT_WEIGHT = 32
+PARITY_WEIGHT = 64
+
+WindowTables = namedtuple("WindowTables", ["cells", "masks", "by_cell"])
+WindowTables.__doc__ = """Windows of a grid: `cells[w]` are the bit
+indices (see `grid.Grid`) of the cells of the window w, `masks[w]` its
+mask, and `by_cell[i]` the windows through the cell of index i."""
+
+
+@lru_cache(maxsize=None)
+def window_tables(nb_rows: int, nb_cols: int,
+                  nb_in_a_row: int) -> WindowTables:
+    """Windows of the grids of `nb_rows` x `nb_cols`."""
+    height = nb_rows + 1
+    cells, masks = [], []
+    by_cell = [[] for _ in range(height * nb_cols)]
+    for d_row, d_col in DIRECTIONS:
+        for col in range(nb_cols):
+            for row in range(nb_rows):
+                end_row = row + (nb_in_a_row - 1) * d_row
+                end_col = col + (nb_in_a_row - 1) * d_col
+                if not (0 <= end_row < nb_rows and end_col < nb_cols):
+                    continue
+                window = tuple((col + i * d_col) * height + row + i * d_row
+                               for i in range(nb_in_a_row))
+                for index in window:
+                    by_cell[index].append(len(cells))
+                cells.append(window)
+                masks.append(sum(1 << index for index in window))
+    return WindowTables(tuple(cells), tuple(masks),
+                        tuple(map(tuple, by_cell)))
+
+
+class ThreatMap:
+    """Pieces of two players in the windows of a grid, updated move by
+    move"""
+
+    def __init__(self, nb_rows: int = 6, nb_cols: int = 7,
+                 nb_in_a_row: int = 4):
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.nb_in_a_row = nb_in_a_row
+        self.col_height = nb_rows + 1
+        self.tables = window_tables(nb_rows, nb_cols, nb_in_a_row)
+        nb_windows = len(self.tables.cells)
+        # counts[id_player][w]: pieces of the player in the window w
+        self.counts = [None, [0] * nb_windows, [0] * nb_windows]
+        self.mask = 0
+        self.heights = [0] * nb_cols
+        # threats[id_player]: number of windows completed by each cell
+        self.threats = [None, {}, {}]
+        # threats of each player on odd rows
+        self.nb_odd = [None, 0, 0]
+        # sum of the weights of the open windows of each player
+        self.scores = [None, 0, 0]
+        self.weights = [0] + [WINDOW_WEIGHT ** n
+                              for n in range(nb_in_a_row)]
+
+    @classmethod
+    def from_grid(cls, grid, nb_in_a_row: int = 4) -> "ThreatMap":
+        """Threat map of the pieces of a `grid.Grid`."""
+        threats = cls(grid.nb_rows, grid.nb_cols, nb_in_a_row)
+        for col in range(grid.nb_cols):
+            for row in range(grid.heights[col]):
+                threats.play(col, row, grid.cell(row, col))
+        return threats
+
+    def _window(self, w: int, sign: int):
+        """Adds (`sign` = 1) or removes (-1) the weight and the threat of
+        the window w."""
+        first, second = self.counts[1][w], self.counts[2][w]
+        if first and second:
+            return
+        id_player, n = (1, first) if first else (2, second)
+        self.scores[id_player] += sign * self.weights[n]
+        if n == self.nb_in_a_row - 1:
+            empty = self.tables.masks[w] & ~self.mask
+            index = empty.bit_length() - 1
+            threats = self.threats[id_player]
+            count = threats.get(index, 0) + sign
+            if count:
+                threats[index] = count
+            else:
+                del threats[index]
+            if count == (sign > 0) and index % self.col_height % 2 == 0:
+                # a new threat on an odd row, or the last window of one
+                self.nb_odd[id_player] += sign
+
+    def play(self, col: int, row: int, id_player: int):
+        """Puts a piece of `id_player` in (row, col), the next cell of
+        its column."""
+        index = col * self.col_height + row
+        counts = self.counts[id_player]
+        for w in self.tables.by_cell[index]:
+            self._window(w, -1)
+        self.mask |= 1 << index
+        self.heights[col] = row + 1
+        for w in self.tables.by_cell[index]:
+            counts[w] += 1
+            self._window(w, 1)
+
+    def undo(self, col: int, row: int, id_player: int):
+        """Removes the piece of `id_player` in (row, col), the top piece
+        of its column."""
+        index = col * self.col_height + row
+        counts = self.counts[id_player]
+        for w in self.tables.by_cell[index]:
+            self._window(w, -1)
+            counts[w] -= 1
+        self.mask ^= 1 << index
+        self.heights[col] = row
+        for w in self.tables.by_cell[index]:
+            self._window(w, 1)
+
+    def cells(self, id_player: int) -> list:
+        """Threats of `id_player`, as (row, col) cells, bottom first."""
+        h = self.col_height
+        return sorted((index % h, index // h)
+                      for index in self.threats[id_player])
+
+    def immediate(self, id_player: int) -> list:
+        """Columns where `id_player` wins at once."""
+        h = self.col_height
+        return sorted({index // h for index in self.threats[id_player]
+                       if index % h == self.heights[index // h]})
+
+    def parity(self, id_player: int) -> tuple:
+        """Numbers of odd and even threats of `id_player` (rows from 1
+        at the bottom)."""
+        odd = self.nb_odd[id_player]
+        return odd, len(self.threats[id_player]) - odd
+
+    def forced_moves(self, id_player: int):
+        """Columns `id_player`, to move, has to consider: its winning
+        moves, else the immediate threats of the opponent to block (more
+        than one: the game is lost). None if no move is forced."""
+        winning = self.immediate(id_player)
+        if winning:
+            return winning
+        return self.immediate(3 - id_player) or None
+
+    def evaluate(self, id_player: int) -> int:
+        """Heuristic score of the position for `id_player`: its open
+        windows and threats, minus those of the opponent. The threats
+        of the good parity for each player count more."""
+        score = 0
+        for player, sign in ((id_player, 1), (3 - id_player, -1)):
+            odd, even = self.parity(player)
+            good = odd if player == 1 else even
+            score += sign * (self.scores[player]
+                             + THREAT_WEIGHT * (odd + even)
+                             + PARITY_WEIGHT * good)
+        return score
@@ -0,0 +1,355 @@
+"""
+Tournaments between configurations of the engine.
+
+Each player is an `engine.Engine` set up by a spec such as
+`deep:max_depth=6,tt_size_mb=4` (a name, then keyword arguments of the
+engine). The pairs play round-robin, or the first player against all
+the others (gauntlet). Each opening (columns from 1, one per line of the
+openings file) is played twice by each pair, each player moving first
+once. The games run in a pool of processes, are written to an archive
+(see `records`) as soon as they end, and the archive is indexed in the
+statistics (see `stats`) at the end.
+
+The Elo differences are given with their 95% error bars. With two
+players, a sequential probability ratio test (SPRT) can stop the
+tournament as soon as the games show that the second player is `elo0`
+stronger than the first (H0) or `elo1` stronger (H1).
+
+Usage:
+    python tournament.py d4:max_depth=4 d6:max_depth=6 --games 400
+        [--openings openings.txt] [--mode gauntlet] [--sprt 0 20]
+"""
+
+import argparse
+import itertools
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from grid import Grid, InvalidMoveError
+from engine import Engine
+from records import GameRecord, RecordWriter, DRAW
+
+
+OPENING_PLIES = 2
+# games submitted per worker of the pool, so that none waits
+GAMES_PER_WORKER = 2
+# log-likelihood ratio bounds of the SPRT
+ALPHA = BETA = 0.05
+
+Score = namedtuple("Score", ["wins", "draws", "losses"])
+EloEstimate = namedtuple("EloEstimate", ["elo", "error", "score", "games"])
+EloEstimate.__doc__ = """Elo difference for a score, and the half-width
+of its 95% interval."""
+
+# engines of a worker process, by spec
+_engines = {}
+
+
+def parse_spec(spec: str) -> tuple:
+    """Gives the name and the keyword arguments of the engine of a spec
+    `name:key=value,...`."""
+    name, _, options = spec.partition(":")
+    kwargs = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        number = float(value)
+        kwargs[key] = int(number) if number.is_integer() \
+            and key != "movetime" else number
+    Engine(**kwargs)  # checks the keywords
+    return name, kwargs
+
+
+def read_openings(path: str, nb_rows: int = 6, nb_cols: int = 7,
+                  nb_in_a_row: int = 4) -> list:
+    """Openings of a file, as lists of columns from 0. Raises ValueError
+    for an opening which cannot be played on the grid, or ends the
+    game."""
+    openings = []
+    with open(path) as file:
+        for i, line in enumerate(file, 1):
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            if not line.isdigit():
+                raise ValueError(f"{path}:{i}: {line} is not an opening.")
+            opening = [int(char) - 1 for char in line]
+            grid = Grid(nb_rows, nb_cols)
+            for ply, col in enumerate(opening):
+                id_player = ply % 2 + 1
+                try:
+                    row = grid.drop_piece(col, id_player)
+                except InvalidMoveError:
+                    raise ValueError(f"{path}:{i}: the column {col + 1}"
+                                     f" cannot be played.") from None
+                if grid.check_win_at(row, col, id_player, nb_in_a_row) \
+                        or grid.is_full():
+                    raise ValueError(f"{path}:{i}: the opening ends the"
+                                     f" game.")
+            openings.append(opening)
+    return openings
+
+
+def all_openings(nb_cols: int, nb_plies: int = OPENING_PLIES) -> list:
+    return [list(cols) for cols in itertools.product(range(nb_cols),
+                                                     repeat=nb_plies)]
+
+
+def play_game(specs: tuple, opening: list, nb_rows: int, nb_cols: int,
+              nb_in_a_row: int) -> tuple:
+    """Plays a game between the engines of two specs (in a worker
+    process) from the opening, and gives (result, moves)."""
+    engines = []
+    for spec in specs:
+        engine = _engines.get(spec)
+        if engine is None:
+            engine = _engines[spec] = Engine(nb_in_a_row,
+                                             **parse_spec(spec)[1])
+        engine.nb_in_a_row = nb_in_a_row
+        # each game starts from an empty table
+        engine.tt.clear()
+        engines.append(engine)
+    grid = Grid(nb_rows, nb_cols)
+    moves = []
+    id_player = 1
+    while not grid.is_full():
+        if len(moves) < len(opening):
+            col = opening[len(moves)]
+        else:
+            col = engines[id_player - 1].search(grid, id_player).best_move
+        grid.drop_piece(col, id_player)
+        moves.append(col)
+        if grid.winning_move(id_player, nb_in_a_row):
+            return id_player, bytes(moves)
+        id_player = id_player % 2 + 1
+    return DRAW, bytes(moves)
+
+
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo(score: float) -> float:
+    """Elo difference giving the expected score."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_estimate(score: Score) -> EloEstimate:
+    """Elo difference of a player from its wins, draws and losses."""
+    wins, draws, losses = score
+    games = wins + draws + losses
+    if not games:
+        return EloEstimate(0., math.inf, 0.5, 0)
+    mean = (wins + draws / 2) / games
+    variance = (wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2
+                + losses * mean ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    error = (elo(mean + margin) - elo(mean - margin)) / 2
+    return EloEstimate(elo(mean), error, mean, games)
+
+
+def sprt(score: Score, elo0: float, elo1: float) -> float:
+    """Log-likelihood ratio of H1 (an Elo difference of `elo1`) against
+    H0 (`elo0`), in the normal approximation of the results."""
+    wins, draws, losses = score
+    games = wins + draws + losses
+    if not games:
+        return 0.
+    mean = (wins + draws / 2) / games
+    variance = (wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2
+                + losses * mean ** 2) / games
+    if variance == 0:
+        return 0.
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return games * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float = ALPHA, beta: float = BETA) -> tuple:
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+class Tournament:
+    """Games between engine specs, played in a pool of processes"""
+
+    def __init__(self, specs: list, nb_rows: int = 6, nb_cols: int = 7,
+                 nb_in_a_row: int = 4, openings: list = None,
+                 mode: str = "round-robin", nb_workers: int = None):
+        if len(specs) < 2:
+            raise ValueError("A tournament needs two players at least.")
+        self.specs = specs
+        self.names = [parse_spec(spec)[0] or spec for spec in specs]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError("The players need different names.")
+        self.nb_rows = nb_rows
+        self.nb_cols = nb_cols
+        self.nb_in_a_row = nb_in_a_row
+        self.openings = all_openings(nb_cols) if openings is None \
+            else openings
+        if not self.openings:
+            raise ValueError("A tournament needs one opening at least.")
+        if mode == "round-robin":
+            self.pairs = list(itertools.combinations(range(len(specs)), 2))
+        elif mode == "gauntlet":
+            self.pairs = [(0, i) for i in range(1, len(specs))]
+        else:
+            raise ValueError(f"Unknown mode {mode}.")
+        self.nb_workers = nb_workers or os.cpu_count() or 1
+        # scores[i][j]: wins, draws and losses of the player i against j
+        self.scores = [[Score(0, 0, 0)] * len(specs) for _ in specs]
+        self.nb_games = 0
+
+    def schedule(self):
+        """Yields the players (first to move first) and the opening of
+        the games, without end: each opening, for each pair, with the
+        colours one way then the other."""
+        while True:
+            for opening in self.openings:
+                for i, j in self.pairs:
+                    yield (i, j), opening
+                    yield (j, i), opening
+
+    def add_result(self, seats: tuple, result: int):
+        for seat, (i, j) in enumerate((seats, seats[::-1]), 1):
+            wins, draws, losses = self.scores[i][j]
+            if result == DRAW:
+                draws += 1
+            elif result == seat:
+                wins += 1
+            else:
+                losses += 1
+            self.scores[i][j] = Score(wins, draws, losses)
+        self.nb_games += 1
+
+    def score(self, i: int, j: int = None) -> Score:
+        """Score of the player i against j, or against all the others."""
+        if j is not None:
+            return self.scores[i][j]
+        return Score(*map(sum, zip(*self.scores[i])))
+
+    def run(self, nb_games: int, writer: RecordWriter = None,
+            sprt_elos: tuple = None, progress=None) -> str:
+        """Plays `nb_games` games, or less if the SPRT of the two players
+        (if `sprt_elos` = (elo0, elo1)) ends before. Returns "H0" or "H1"
+        when the SPRT ends, else None. `progress` is called with the
+        tournament after each game."""
+        if sprt_elos is not None and len(self.specs) != 2:
+            raise ValueError("The SPRT needs two players.")
+        lower, upper = sprt_bounds()
+        games = itertools.islice(self.schedule(), nb_games)
+        decision = None
+        with ProcessPoolExecutor(self.nb_workers) as pool:
+            pending = {}
+
+            def submit():
+                for seats, opening in itertools.islice(
+                        games, self.nb_workers * GAMES_PER_WORKER
+                        - len(pending)):
+                    future = pool.submit(
+                        play_game, tuple(self.specs[i] for i in seats),
+                        opening, self.nb_rows, self.nb_cols,
+                        self.nb_in_a_row)
+                    pending[future] = seats
+
+            submit()
+            while pending and decision is None:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    seats = pending.pop(future)
+                    result, moves = future.result()
+                    self.add_result(seats, result)
+                    if writer is not None:
+                        writer.write(GameRecord(
+                            self.nb_rows, self.nb_cols, self.nb_in_a_row,
+                            tuple(self.names[i] for i in seats), result,
+                            moves))
+                    if progress is not None:
+                        progress(self)
+                    if sprt_elos is not None and decision is None:
+                        llr = sprt(self.score(1, 0), *sprt_elos)
+                        if llr <= lower:
+                            decision = "H0"
+                        elif llr >= upper:
+                            decision = "H1"
+                if decision is None:
+                    submit()
+            for future in pending:
+                future.cancel()
+        return decision
+
+    def report(self, sprt_elos: tuple = None) -> str:
+        lines = []
+        for i in sorted(range(len(self.specs)),
+                        key=lambda i: -elo_estimate(self.score(i)).elo):
+            estimate = elo_estimate(self.score(i))
+            wins, draws, losses = self.score(i)
+            lines.append(f"{self.names[i]:<16} {estimate.elo:+7.1f}"
+                         f" +/- {estimate.error:5.1f}"
+                         f"  {wins}/{draws}/{losses}"
+                         f"  ({estimate.games} games)")
+        if sprt_elos is not None:
+            lower, upper = sprt_bounds()
+            llr = sprt(self.score(1, 0), *sprt_elos)
+            lines.append(f"SPRT [{sprt_elos[0]:g}, {sprt_elos[1]:g}]:"
+                         f" LLR {llr:.2f} ({lower:.2f}, {upper:.2f})")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tournament between"
+                                                 " configurations of the"
+                                                 " engine.")
+    parser.add_argument("specs", nargs="+",
+                        help="name:key=value,... of each engine")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--mode", choices=["round-robin", "gauntlet"],
+                        default="round-robin")
+    parser.add_argument("--openings", help="file of openings, one per"
+                                           " line (e.g. 4453)")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--cols", type=int, default=7)
+    parser.add_argument("--nb-in-a-row", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sprt", type=float, nargs=2,
+                        metavar=("ELO0", "ELO1"),
+                        help="stops when the second player is shown to be"
+                             " ELO0 or ELO1 stronger than the first")
+    parser.add_argument("--archive", default="tournament.p4gr",
+                        help="games archive the games are appended to")
+    parser.add_argument("--stats", help="statistics database indexing the"
+                                        " archive at the end")
+    args = parser.parse_args()
+
+    openings = None
+    if args.openings is not None:
+        try:
+            openings = read_openings(args.openings, args.rows, args.cols,
+                                     args.nb_in_a_row)
+        except ValueError as error:
+            parser.error(str(error))
+    tournament = Tournament(args.specs, args.rows, args.cols,
+                            args.nb_in_a_row, openings, args.mode,
+                            args.workers)
+    start = time.perf_counter()
+
+    def progress(tournament: Tournament):
+        if tournament.nb_games % 100 == 0:
+            print(f"{tournament.nb_games} games"
+                  f" in {time.perf_counter() - start:.0f}s")
+
+    with RecordWriter(args.archive) as writer:
+        decision = tournament.run(args.games, writer, args.sprt, progress)
+    print(tournament.report(args.sprt))
+    if decision is not None:
+        print(f"SPRT: {decision} accepted after {tournament.nb_games}"
+              f" games")
+    if args.stats:
+        from stats import StatsIndex
+        with StatsIndex(args.stats) as index:
+            index.add_archive(args.archive)
+
+
+if __name__ == "__main__":
+    main()
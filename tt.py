@@ -0,0 +1,147 @@
+"""
+Transposition table of the search.
+
+Entries live in two preallocated arrays, one for the 64 bits keys and
+one for the packed results, grouped in buckets of two slots: the first
+one keeps the deepest result, the second one always takes the last.
+
+A third array holds the generation of each entry: `clear` only starts a
+new generation, and the entries of the older ones count as empty, so
+that clearing does not cost a pass over the table (but once every 256
+generations).
+"""
+
+import struct
+import sys
+from array import array
+
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+ENTRY_SIZE = 17  # bytes, key, packed result and generation
+NB_GENERATIONS = 256
+MAGIC = b"P4TT"
+HEADER = struct.Struct("<4scQ")
+
+
+def pack(depth: int, flag: int, score: int, move) -> int:
+    """Packs a result in an integer, whose lowest bit marks a used slot."""
+    move = 0 if move is None else move + 1
+    depth = min(depth, 0xFF)
+    return (((score << 8 | depth) << 8 | move) << 2 | flag) << 1 | 1
+
+
+def unpack(data: int) -> tuple:
+    """Gives back (depth, flag, score, move) from a packed result."""
+    move = (data >> 3) & 0xFF
+    return ((data >> 11) & 0xFF, (data >> 1) & 3, data >> 19,
+            move - 1 if move else None)
+
+
+class TranspositionTable:
+    """Fixed size table of search results, keyed by Zobrist hashes"""
+
+    def __init__(self, size_mb: float = 16, nb_entries: int = None):
+        if nb_entries is None:
+            nb_entries = int(size_mb * 2 ** 20) // ENTRY_SIZE
+        self.nb_buckets = max(1, nb_entries // 2)
+        self.keys = array("Q", bytes(16 * self.nb_buckets))
+        self.data = array("q", bytes(16 * self.nb_buckets))
+        self.generations = array("B", bytes(2 * self.nb_buckets))
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    @property
+    def size_mb(self) -> float:
+        return 2 * self.nb_buckets * ENTRY_SIZE / 2 ** 20
+
+    def clear(self):
+        """Empties the table, by starting a new generation."""
+        self.generation = (self.generation + 1) % NB_GENERATIONS
+        if not self.generation:
+            # the oldest entries would come back to life
+            self.data = array("q", bytes(16 * self.nb_buckets))
+            self.generations = array("B", bytes(2 * self.nb_buckets))
+        self.hits = self.misses = self.collisions = 0
+
+    def used(self, i: int) -> bool:
+        return bool(self.data[i]) \
+            and self.generations[i] == self.generation
+
+    def probe(self, key: int):
+        """Gives (depth, flag, score, move) stored for `key`, or None."""
+        slot = 2 * (key % self.nb_buckets)
+        keys, data = self.keys, self.data
+        for i in (slot, slot + 1):
+            if keys[i] == key and data[i] \
+                    and self.generations[i] == self.generation:
+                self.hits += 1
+                return unpack(data[i])
+        self.misses += 1
+        if self.used(slot) or self.used(slot + 1):
+            self.collisions += 1
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int, move):
+        """Stores a result: in the first slot of its bucket if it is at
+        least as deep as the one there (which moves to the second slot),
+        in the second slot otherwise."""
+        slot = 2 * (key % self.nb_buckets)
+        keys, data, generations = self.keys, self.data, self.generations
+        packed = pack(depth, flag, score, move)
+        used = data[slot] and generations[slot] == self.generation
+        if not used or keys[slot] == key \
+                or min(depth, 0xFF) >= (data[slot] >> 11) & 0xFF:
+            if used and keys[slot] != key:
+                keys[slot + 1], data[slot + 1] = keys[slot], data[slot]
+                generations[slot + 1] = self.generation
+            keys[slot], data[slot] = key, packed
+            generations[slot] = self.generation
+        else:
+            keys[slot + 1], data[slot + 1] = key, packed
+            generations[slot + 1] = self.generation
+
+    def stats(self) -> dict:
+        probes = self.hits + self.misses
+        return {"size_mb": self.size_mb,
+                "entries": 2 * self.nb_buckets,
+                "used": sum(map(self.used, range(2 * self.nb_buckets))),
+                "hits": self.hits,
+                "misses": self.misses,
+                "collisions": self.collisions,
+                "hit_rate": self.hits / probes if probes else 0.}
+
+    def save(self, path: str):
+        """Saves the table to the file `path` (the entries of the current
+        generation)."""
+        data = self.data
+        if any(g != self.generation for g in self.generations):
+            data = array("q", (d if self.used(i) else 0
+                               for i, d in enumerate(data)))
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(),
+                                   self.nb_buckets))
+            self.keys.tofile(file)
+            data.tofile(file)
+
+    @classmethod
+    def load(cls, path: str) -> "TranspositionTable":
+        """Loads a table saved by `save()`."""
+        with open(path, "rb") as file:
+            magic, byteorder, nb_buckets = HEADER.unpack(
+                file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a transposition table.")
+            table = cls(nb_entries=2)
+            table.nb_buckets = nb_buckets
+            table.keys = array("Q")
+            table.keys.fromfile(file, 2 * nb_buckets)
+            table.data = array("q")
+            table.data.fromfile(file, 2 * nb_buckets)
+            table.generations = array("B", bytes(2 * nb_buckets))
+        if byteorder.decode() != sys.byteorder[0]:
+            table.keys.byteswap()
+            table.data.byteswap()
+        return table
@@ -0,0 +1,181 @@
+"""
+Engine searching in a background thread, for the front-ends.
+
+The front-end asks for a move with `think` and goes on handling its
+events; the worker posts an "info" message after each completed
+iteration (the best move so far, for a hint) and a "bestmove" message at
+the end. Messages are posted from the thread of the worker, by the
+function given to the worker: it must only hand them over to the GUI
+thread (a queue polled with `after()`, a custom pygame event...).
+
+During the turn of the opponent, `ponder` searches the position after
+the reply the engine expects. If this reply is played, `ponder_hit`
+turns the running search into the answer, else it is cancelled, and
+the positions it searched stay in the transposition table.
+"""
+
+import math
+import queue
+import threading
+from collections import namedtuple
+
+from grid import Grid
+from engine import Engine
+
+
+EngineMessage = namedtuple("EngineMessage", ["kind", "job", "result"])
+EngineMessage.__doc__ = """Message of the worker: `kind` is "info" or
+"bestmove", `job` the job of `think` or `ponder`, `result` the
+`engine.SearchResult`."""
+
+
+class EngineJob:
+    """Search of a position by the worker"""
+
+    __slots__ = ("grid", "id_player", "movetime", "predicted", "pondering",
+                 "cancelled", "result")
+
+    def __init__(self, grid: Grid, id_player: int, movetime: float,
+                 predicted: int = None):
+        self.grid = grid
+        self.id_player = id_player
+        self.movetime = movetime
+        # reply of the opponent expected by a ponder job
+        self.predicted = predicted
+        self.pondering = predicted is not None
+        self.cancelled = False
+        # result of a ponder job which ended before the reply
+        self.result = None
+
+
+class EngineWorker:
+    """Thread running the searches of an `Engine`, one at a time"""
+
+    def __init__(self, engine: Engine, post=None):
+        self.engine = engine
+        # messages go to `messages` if no function is given
+        self.messages = queue.Queue()
+        self.post = self.messages.put if post is None else post
+        self._jobs = queue.Queue()
+        # jobs not ended yet, running or waiting
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._current = None
+        self._ponder = None
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="engine-worker")
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.cancelled:
+                    self._pending.discard(job)
+                    continue
+                self.engine.stopped = False
+                self._current = job
+            result = self.engine.search(
+                job.grid, job.id_player, movetime=job.movetime,
+                info=lambda info: self._info(job, info))
+            with self._lock:
+                # a ponder hit after the end of the search must not give
+                # its time to the next one
+                self.engine.set_movetime(None)
+                self._current = None
+                self._pending.discard(job)
+                if job.cancelled:
+                    continue
+                if job.pondering:
+                    job.result = result
+                    continue
+            self.post(EngineMessage("bestmove", job, result))
+
+    def _info(self, job: EngineJob, result):
+        if not job.cancelled and not job.pondering:
+            self.post(EngineMessage("info", job, result))
+
+    def think(self, grid: Grid, id_player: int,
+              movetime: float = None) -> EngineJob:
+        """Starts the search of the move of `id_player`, after cancelling
+        the running one, and returns the job."""
+        self.cancel()
+        job = EngineJob(grid.copy(), id_player,
+                        self.engine.movetime if movetime is None
+                        else movetime)
+        self._start(job)
+        return job
+
+    def ponder(self, grid: Grid, id_player: int) -> EngineJob:
+        """Searches, without limit of time, the position after the move
+        the engine expects from `id_player`. Returns the job, None if
+        there is no move to expect."""
+        self.cancel()
+        key, mirrored = grid.canonical_key(id_player)
+        entry = self.engine.tt.probe(key)
+        if entry is None or entry[3] is None:
+            return None
+        col = grid.mirror_col(entry[3]) if mirrored else entry[3]
+        if not grid.is_valid_location(col):
+            return None
+        grid = grid.copy()
+        row = grid.drop_piece(col, id_player)
+        if grid.check_win_at(row, col, id_player,
+                             self.engine.nb_in_a_row) or grid.is_full():
+            return None
+        job = EngineJob(grid, self.engine.other(id_player), math.inf,
+                        predicted=col)
+        self._ponder = job
+        self._start(job)
+        return job
+
+    def _start(self, job: EngineJob):
+        with self._lock:
+            self._pending.add(job)
+        self._jobs.put(job)
+
+    def ponder_hit(self, col: int, movetime: float = None):
+        """The opponent played `col`. Gives the ponder job if it expected
+        this move, which will post its best move within `movetime`, else
+        cancels it and returns None."""
+        movetime = self.engine.movetime if movetime is None else movetime
+        with self._lock:
+            job, self._ponder = self._ponder, None
+            if job is None or job.cancelled:
+                return None
+            if job.predicted != col:
+                self._cancel(job)
+                return None
+            job.pondering = False
+            if job.result is None:
+                if job is self._current:
+                    self.engine.set_movetime(movetime)
+                else:
+                    # not started yet, searched as a normal job
+                    job.movetime = movetime
+                return job
+        self.post(EngineMessage("bestmove", job, job.result))
+        return job
+
+    def _cancel(self, job: EngineJob):
+        job.cancelled = True
+        if job is self._current:
+            self.engine.stop()
+
+    def cancel(self):
+        """Cancels the jobs running or waiting: they post nothing more."""
+        with self._lock:
+            self._ponder = None
+            for job in self._pending:
+                self._cancel(job)
+
+    def busy(self) -> bool:
+        return bool(self._pending)
+
+    def close(self):
+        """Stops the thread, after cancelling the jobs."""
+        self.cancel()
+        self._jobs.put(None)
+        self._thread.join()